@@ -10,18 +10,89 @@ from site_to_site_vpn.stacks.datacenter import (
     DatacenterVPCStack,
     DatacenterCustomerGatewayStack,
     DatacenterClient,
+    DatacenterCachingProxy,
 )
 
+from site_to_site_vpn.stacks.image import ImageStack
 from site_to_site_vpn.stacks.vpc import VpcStack, WebServerStack
+from site_to_site_vpn.constructs.customer_gateway import IpsecBackend
+from site_to_site_vpn.constructs.ec2 import SHARED_INSTANCE_RESOURCES_CONTEXT
+from site_to_site_vpn.constructs.vpn_connection import VpnTopology
+from site_to_site_vpn.ipsec import AES_GCM_128, HITLESS_REKEY
+from site_to_site_vpn.inside_cidrs import DEFAULT_STATE_FILE, InsideCidrAllocator
+from site_to_site_vpn.load_test import LoadTest
+from site_to_site_vpn.operator_context import OperatorContext
+from site_to_site_vpn.routing import RoutePlan
+from site_to_site_vpn.prober import LatencyProbe
+from site_to_site_vpn.registry import StackRegistry
+from site_to_site_vpn.sizing import select_instance_size
+from site_to_site_vpn.wan_cache import WanCache
 
 load_dotenv()
 
 app = App()
-
+# SSH access for the operator, from -c admin_cidr=... -c ssh_public_key=...
+# or VPN_ADMIN_CIDR/VPN_SSH_PUBLIC_KEY. Unset values are looked up once, from
+# checkip.amazonaws.com and ~/.ssh/*.pub, unless -c offline=true/VPN_OFFLINE=1.
+# The instances resolve them when they are built, a cached synth never does.
+OPERATOR_SETTINGS = OperatorContext.settings(app)
+# Let the instances of each stack share one IAM role, instance profile and key
+# pair instead of creating their own, which shortens every deploy (same as
+# -c shared_instance_resources=true)
+SHARED_INSTANCE_RESOURCES = False
+if SHARED_INSTANCE_RESOURCES:
+    app.node.set_context(SHARED_INSTANCE_RESOURCES_CONTEXT, True)
 
 DC_CIDR = "10.0.0.0/16"
 VPC_CIDR = "10.1.0.0/16"
+# Every prefix behind the CGW and in the VPC, e.g. the datacenter's on-prem
+# ranges next to DC_CIDR. Routes, traffic selectors and firewall rules are
+# generated from the collapsed prefixes (see routing.py).
+ROUTES = RoutePlan(site_cidrs=(DC_CIDR,), vpc_cidrs=(VPC_CIDR,))
+# Tunnel inside CIDRs of the first VPN connection, further connections get
+# theirs from INSIDE_CIDRS keyed by stack, connection and tunnel. A free /30 is
+# e.g. INSIDE_CIDRS.allocate("infra-vpc/vpn1/tunnel1") on a fresh allocator.
+# Allocations are kept in inside-cidrs.json so they never move between synths.
 TUN1_LINK_LOCAL_INNER_CIDR = "169.254.88.80/30"
+TUN2_LINK_LOCAL_INNER_CIDR = "169.254.89.80/30"
+INSIDE_CIDRS = InsideCidrAllocator(state=DEFAULT_STATE_FILE)
+# Cipher suite negotiated by both the VPGW tunnel options and the CGW
+IPSEC_PROPOSAL = AES_GCM_128
+# Lifetimes of both sides: the CGW rekeys every SA make-before-break ahead of
+# the VPGW, with IKE rekeys between the CHILD_SA rekeys
+REKEY_PROFILE = HITLESS_REKEY
+# SWANCTL spreads ESP processing over all CGW cores (pcrypt + RPS/XPS)
+IPSEC_BACKEND = IpsecBackend.STARTER
+
+# Target site traffic; the gateway and the client generating the traffic are
+# sized from the bundled bandwidth table (see sizing.py) instead of by hand
+SITE_THROUGHPUT_GBPS = 1.25
+SITE_PPS = 150_000
+
+# TGW terminates one VPN connection per CGW and spreads traffic over all of
+# them with BGP ECMP, so site throughput scales with GATEWAY_COUNT. VGW keeps
+# the original single static VPN connection, VGW_BGP the same connection with
+# BGP routing and failover within seconds (both need GATEWAY_COUNT = 1).
+VPN_TOPOLOGY = VpnTopology.VGW
+GATEWAY_COUNT = 1
+
+# Bake the packages and the static network tuning of the CGW and the web
+# server into AMIs (EC2 Image Builder) so their user data only applies the
+# per-deployment configuration at boot
+GOLDEN_IMAGES = False
+
+# Run wrk2 and iperf3 from dc-client against the web server over the VPN at
+# boot and upload the results to S3, e.g. LOAD_TEST = LoadTest(http_rate=5_000)
+LOAD_TEST: LoadTest | None = None
+
+# Probe RTT and loss from dc-client to the web server over UDP, ICMP and TCP
+# and alarm on the SLOs, e.g. LATENCY_PROBE = LatencyProbe(rtt_p99_slo_ms=10)
+LATENCY_PROBE: LatencyProbe | None = None
+
+# Serve repeated requests for the web server from an nginx cache in the
+# datacenter VPC instead of over the tunnel, e.g. WanCache(max_size_mb=2048,
+# in_memory=True). Clients use the dc-cache WanCacheUrl output. None disables.
+WAN_CACHE: WanCache | None = None
 
 # tun1_pre_shared_key: Allowed characters are alphanumeric characters period . and underscores _. Must be between 8 and 64 characters in length and cannot start with zero (0).
 try:
@@ -30,48 +101,147 @@ except KeyError as e:
     print("Provide a .env with a TUN1_PRE_SHARED_KEY value")
     raise e
 
-dc_network_stack = DatacenterVPCStack(app, "dc-vpc", cidr=DC_CIDR)
-
-
-vpc_stack = VpcStack(
-    app,
-    "infra-vpc",
-    cidr=VPC_CIDR,
-    datacenter_cidr=DC_CIDR,
-    customer_gateway_public_ip=dc_network_stack.customer_gateway_public_ip,
-    tun1_pre_shared_key=TUN1_PRE_SHARED_KEY,
-    tun1_inner_cidr=TUN1_LINK_LOCAL_INNER_CIDR,
-)
-
-
-dc_ip_tunnel_gw_stack = DatacenterCustomerGatewayStack(
-    app,
-    "dc-gw",
-    dc_vpc=dc_network_stack.vpc,
-    cgw_eip_allocation_id=dc_network_stack.customer_gateway_public_ip_allocation_id,
-    vpc_cidr=VPC_CIDR,
-    vpgw_tun1_public_ip=vpc_stack.vpn_connection.vpgw_tun1_public_ip,
-    tun1_pre_shared_key=TUN1_PRE_SHARED_KEY,
-    cgw_tun1_link_local_ip=vpc_stack.vpn_connection.cgw_tun1_link_local_ip,
-    vpgw_tun1_link_local_ip=vpc_stack.vpn_connection.vpgw_tun1_link_local_ip,
-    dc_cidr=DC_CIDR,
-)
-dc_ip_tunnel_gw_stack.add_dependency(dc_network_stack)
-dc_ip_tunnel_gw_stack.add_dependency(vpc_stack)
-
-DatacenterClient(
-    app,
-    "dc-client",
-    dc_vpc=dc_network_stack.vpc,
-    dc_subnet=dc_network_stack.vpc.public_subnets[0],
+# Providing a second key enables active-active mode: both VPN tunnels are
+# configured and the CGW spreads traffic over them with ECMP.
+TUN2_PRE_SHARED_KEY = os.environ.get("TUN2_PRE_SHARED_KEY")
+
+# The CGW needs the ESP capacity for the site traffic on its tunnels' SAs,
+# STARTER processes each SA on one vCPU. The client only generates traffic.
+GATEWAY_SIZE = select_instance_size(
+    SITE_THROUGHPUT_GBPS,
+    SITE_PPS,
+    ipsec_sas=2 if TUN2_PRE_SHARED_KEY else 1,
+    parallel_esp=IPSEC_BACKEND is IpsecBackend.SWANCTL,
+    allow_arm=False,
 )
-
-WebServerStack(
-    app,
-    "infra-server",
-    vpc=vpc_stack.vpc,
-    subnet=vpc_stack.vpc.public_subnets[0],
-    access_from_cidr=DC_CIDR,
-)
-
-app.synth()
+CLIENT_SIZE = select_instance_size(SITE_THROUGHPUT_GBPS, SITE_PPS, allow_arm=False)
+
+# Stacks are built on demand: cdk deploy dc-gw -c stacks=dc-gw only builds
+# dc-gw and the stacks it depends on, and reuses the previous cloud assembly
+# when none of their inputs changed (see registry.py)
+registry = StackRegistry(app, shared_inputs=(OPERATOR_SETTINGS,))
+IMAGE_STACKS = ("images",) if GOLDEN_IMAGES else ()
+# dc-client only targets the web server when it load tests or probes it
+TARGET_STACKS = ("infra-server",) if LOAD_TEST or LATENCY_PROBE else ()
+
+
+@registry.stack("dc-vpc")
+def dc_vpc(stacks: StackRegistry) -> DatacenterVPCStack:
+    return DatacenterVPCStack(
+        stacks.app, "dc-vpc", cidr=DC_CIDR, gateway_count=GATEWAY_COUNT
+    )
+
+
+if GOLDEN_IMAGES:
+
+    @registry.stack("images", depends_on=("dc-vpc",))
+    def images(stacks: StackRegistry) -> ImageStack:
+        dc_network_stack = stacks.get("dc-vpc")
+        return ImageStack(
+            stacks.app,
+            "images",
+            vpc=dc_network_stack.vpc,
+            subnet=dc_network_stack.vpc.public_subnets[0],
+            ipsec_backend=IPSEC_BACKEND,
+            gateway_size=GATEWAY_SIZE,
+        )
+
+
+@registry.stack("infra-vpc", depends_on=("dc-vpc",))
+def infra_vpc(stacks: StackRegistry) -> VpcStack:
+    return VpcStack(
+        stacks.app,
+        "infra-vpc",
+        cidr=VPC_CIDR,
+        routes=ROUTES,
+        customer_gateway_public_ips=stacks.get("dc-vpc").customer_gateway_public_ips,
+        tun1_pre_shared_key=TUN1_PRE_SHARED_KEY,
+        tun1_inner_cidr=TUN1_LINK_LOCAL_INNER_CIDR,
+        tun2_pre_shared_key=TUN2_PRE_SHARED_KEY,
+        tun2_inner_cidr=TUN2_LINK_LOCAL_INNER_CIDR,
+        inside_cidrs=INSIDE_CIDRS,
+        proposal=IPSEC_PROPOSAL,
+        rekey=REKEY_PROFILE,
+        topology=VPN_TOPOLOGY,
+    )
+
+
+@registry.stack("dc-gw", depends_on=("dc-vpc", "infra-vpc", *IMAGE_STACKS))
+def dc_gw(stacks: StackRegistry) -> DatacenterCustomerGatewayStack:
+    dc_network_stack = stacks.get("dc-vpc")
+    vpc_stack = stacks.get("infra-vpc")
+    image_stack = stacks.get("images") if GOLDEN_IMAGES else None
+    dc_ip_tunnel_gw_stack = DatacenterCustomerGatewayStack(
+        stacks.app,
+        "dc-gw",
+        dc_vpc=dc_network_stack.vpc,
+        cgw_eip_allocation_ids=dc_network_stack.customer_gateway_public_ip_allocation_ids,
+        vpn_connections=vpc_stack.vpn_connections,
+        routes=ROUTES,
+        proposal=IPSEC_PROPOSAL,
+        rekey=REKEY_PROFILE,
+        ipsec_backend=IPSEC_BACKEND,
+        gateway_size=GATEWAY_SIZE,
+        placement_group_name=dc_network_stack.placement_group_name,
+        golden_image=image_stack and image_stack.customer_gateway_image,
+    )
+    dc_ip_tunnel_gw_stack.add_dependency(dc_network_stack)
+    dc_ip_tunnel_gw_stack.add_dependency(vpc_stack)
+    return dc_ip_tunnel_gw_stack
+
+
+@registry.stack("infra-server", depends_on=("infra-vpc", *IMAGE_STACKS))
+def infra_server(stacks: StackRegistry) -> WebServerStack:
+    vpc_stack = stacks.get("infra-vpc")
+    image_stack = stacks.get("images") if GOLDEN_IMAGES else None
+    return WebServerStack(
+        stacks.app,
+        "infra-server",
+        vpc=vpc_stack.vpc,
+        subnet=vpc_stack.vpc.public_subnets[0],
+        access_from_cidr=DC_CIDR,
+        golden_image=image_stack and image_stack.web_server_image,
+        load_test=LOAD_TEST,
+        probe=LATENCY_PROBE,
+    )
+
+
+@registry.stack("dc-client", depends_on=("dc-vpc", *TARGET_STACKS))
+def dc_client(stacks: StackRegistry) -> DatacenterClient:
+    dc_network_stack = stacks.get("dc-vpc")
+    web_server_ip = None
+    if TARGET_STACKS:
+        web_server_ip = stacks.get("infra-server").web_server.instance.private_ip
+    return DatacenterClient(
+        stacks.app,
+        "dc-client",
+        dc_vpc=dc_network_stack.vpc,
+        dc_subnet=dc_network_stack.vpc.public_subnets[0],
+        size=CLIENT_SIZE,
+        placement_group_name=dc_network_stack.placement_group_name,
+        load_test=LOAD_TEST,
+        probe=LATENCY_PROBE,
+        web_server_ip=web_server_ip,
+        s3_endpoint=dc_network_stack.s3_endpoint,
+    )
+
+
+if WAN_CACHE:
+
+    @registry.stack("dc-cache", depends_on=("dc-vpc", "infra-server"))
+    def dc_cache(stacks: StackRegistry) -> DatacenterCachingProxy:
+        dc_network_stack = stacks.get("dc-vpc")
+        web_server_stack = stacks.get("infra-server")
+        return DatacenterCachingProxy(
+            stacks.app,
+            "dc-cache",
+            dc_vpc=dc_network_stack.vpc,
+            dc_subnet=dc_network_stack.vpc.public_subnets[0],
+            origin_ip=web_server_stack.web_server.instance.private_ip,
+            access_from_cidr=DC_CIDR,
+            cache=WAN_CACHE,
+            placement_group_name=dc_network_stack.placement_group_name,
+        )
+
+
+registry.synth()
@@ -0,0 +1,210 @@
+from aws_cdk import RemovalPolicy
+import aws_cdk.aws_cloudwatch as cloudwatch
+import aws_cdk.aws_ec2 as ec2
+import aws_cdk.aws_iam as iam
+import aws_cdk.aws_logs as logs
+from constructs import Construct
+
+from .ec2 import Instance
+from .monitoring import (
+    CLOUDWATCH_AGENT_EMF,
+    CLOUDWATCH_AGENT_INSTALL,
+    embedded_script,
+    metric_period,
+)
+from .. import wan_cache
+from ..sizing import INSTANCE_SIZES, InstanceSize
+from ..wan_cache import ACCESS_LOG, NAMESPACE, WanCache
+
+CACHE_DIR = "/var/cache/nginx/wan"
+
+INSTALL = """sudo apt update
+sudo apt -y upgrade
+sudo apt -y install nginx
+"""
+
+# Upstream keepalive saves a TCP handshake across the tunnel per miss,
+# proxy_cache_lock collapses concurrent misses of a key into one fetch and
+# stale entries are served while they are refreshed in the background
+NGINX_CONFIG = """cat << 'EOF' > /etc/nginx/conf.d/wan-cache.conf
+proxy_cache_path {cache_dir} levels=1:2 keys_zone=wan:{keys_zone_mb}m max_size={max_size_mb}m inactive={inactive} use_temp_path=off;
+log_format wan_cache '$upstream_cache_status $body_bytes_sent';
+
+upstream origin {{
+    server {origin_ip}:{origin_port};
+    keepalive 32;
+}}
+
+server {{
+    listen {port} reuseport;
+    access_log {access_log} wan_cache buffer=64k flush=1s;
+
+    location / {{
+        proxy_pass http://origin;
+        proxy_http_version 1.1;
+        proxy_set_header Connection "";
+        proxy_set_header Host $host;
+        proxy_cache wan;
+        proxy_cache_valid 200 301 302 {valid};
+        proxy_cache_lock on;
+        proxy_cache_revalidate on;
+        proxy_cache_background_update on;
+        proxy_cache_use_stale error timeout updating http_500 http_502 http_503 http_504;
+        add_header X-Cache-Status $upstream_cache_status;
+    }}
+}}
+EOF
+sudo rm -f /etc/nginx/sites-enabled/default
+sudo sed -i 's/worker_connections [0-9]*;/worker_connections 4096;/' /etc/nginx/nginx.conf
+"""
+
+# tmpfs sized 10% above max_size, the cache manager evicts past max_size
+IN_MEMORY = """sudo mkdir -p {cache_dir}
+echo "tmpfs {cache_dir} tmpfs size={tmpfs_mb}m,uid=www-data,gid=www-data,mode=0700 0 0" | sudo tee -a /etc/fstab
+sudo mount {cache_dir}
+"""
+
+SERVICES = """sudo systemctl enable nginx
+sudo systemctl restart nginx
+{script}
+cat << EOF > /etc/systemd/system/wan-cache-exporter.service
+[Unit]
+Description=WAN cache hit ratio
+After=nginx.service
+
+[Service]
+ExecStart=/usr/local/sbin/wan-cache-exporter {args}
+Restart=always
+
+[Install]
+WantedBy=multi-user.target
+EOF
+sudo systemctl daemon-reload
+sudo systemctl enable --now wan-cache-exporter
+"""
+
+
+class CachingProxy(Construct):
+    # nginx in the datacenter VPC caching the web server's responses, so
+    # repeated fetches are served locally instead of crossing the tunnel
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        *,
+        vpc: ec2.IVpc,
+        subnet: ec2.ISubnet,
+        origin_ip: str,
+        access_from_cidr: str,
+        cache: WanCache = WanCache(),
+        size: InstanceSize = INSTANCE_SIZES["m7a.large"],
+        placement_group_name: str | None = None,
+        name: str = "wan-cache",
+    ):
+        super().__init__(scope, id)
+        self.cache = cache
+        self.period = metric_period(cache.window)
+        self.instance = Instance(
+            self,
+            "Proxy",
+            name=name,
+            vpc=vpc,
+            subnet=subnet,
+            instance_type=size.instance_type,
+            ami_id=size.ami_id,
+            user_data="#!/usr/bin/bash\n" + INSTALL,
+            placement_group_name=placement_group_name,
+            ena_express=size.ena_express,
+        )
+        self.log_group = logs.LogGroup(
+            self,
+            "LogGroup",
+            log_group_name=f"/vpn/{name}/metrics",
+            retention=logs.RetentionDays.ONE_WEEK,
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+        self.instance.role.add_managed_policy(
+            iam.ManagedPolicy.from_aws_managed_policy_name(
+                "CloudWatchAgentServerPolicy"
+            )
+        )
+        self.instance.add_user_data(
+            (
+                IN_MEMORY.format(
+                    cache_dir=CACHE_DIR, tmpfs_mb=int(cache.max_size_mb * 1.1)
+                )
+                if cache.in_memory
+                else ""
+            )
+            + NGINX_CONFIG.format(
+                cache_dir=CACHE_DIR,
+                keys_zone_mb=cache.keys_zone_mb,
+                max_size_mb=cache.max_size_mb,
+                inactive=cache.inactive,
+                valid=cache.valid,
+                origin_ip=origin_ip,
+                origin_port=cache.origin_port,
+                port=cache.port,
+                access_log=ACCESS_LOG,
+            )
+            + CLOUDWATCH_AGENT_INSTALL
+            + CLOUDWATCH_AGENT_EMF
+            + SERVICES.format(
+                script=embedded_script(
+                    wan_cache, path="/usr/local/sbin/wan-cache-exporter"
+                ),
+                args=" ".join(
+                    [
+                        f"--proxy-name {name}",
+                        f"--window {cache.window}",
+                        f"--log-group {self.log_group.log_group_name}",
+                    ]
+                ),
+            )
+        )
+        self.instance.security_group.add_ingress_rule(
+            peer=ec2.Peer.ipv4(access_from_cidr),
+            connection=ec2.Port.tcp(cache.port),
+            description="Allow HTTP to the WAN cache",
+        )
+        self.instance.allow_ssh_from_local()
+        self.instance.allow_ping_from(access_from_cidr)
+        self.url = f"http://{self.instance.private_ip}:{cache.port}/"
+
+        self.dashboard = cloudwatch.Dashboard(
+            self,
+            "Dashboard",
+            dashboard_name=name,
+            widgets=[
+                [
+                    cloudwatch.GraphWidget(
+                        title="Hit ratio",
+                        left=[
+                            self._metric("HitRatio", "Average"),
+                            self._metric("ByteHitRatio", "Average"),
+                        ],
+                        left_y_axis=cloudwatch.YAxisProps(min=0, max=100),
+                        width=12,
+                    ),
+                    # BytesFromCache is the response traffic kept off the tunnel
+                    cloudwatch.GraphWidget(
+                        title="Bytes served and kept off the tunnel",
+                        left=[
+                            self._metric("BytesServed", "Sum"),
+                            self._metric("BytesFromCache", "Sum"),
+                        ],
+                        right=[self._metric("Requests", "Sum")],
+                        width=12,
+                    ),
+                ]
+            ],
+        )
+
+    def _metric(self, name: str, statistic: str) -> cloudwatch.Metric:
+        return cloudwatch.Metric(
+            namespace=NAMESPACE,
+            metric_name=name,
+            dimensions_map={"Proxy": self.instance.instance_name},
+            statistic=statistic,
+            period=self.period,
+        )
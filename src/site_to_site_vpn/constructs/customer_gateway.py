@@ -1,88 +1,527 @@
+from enum import Enum
+import shlex
+
+from aws_cdk import Annotations, RemovalPolicy, Tags
+import aws_cdk.aws_iam as iam
+import aws_cdk.aws_logs as logs
+import aws_cdk.aws_s3_assets as s3_assets
 from constructs import Construct
 from .ec2 import Instance
-from .constants import Ubuntu
+from .golden_image import GoldenImage
+from .monitoring import CLOUDWATCH_AGENT_EMF, CLOUDWATCH_AGENT_INSTALL, asset_script
+from .. import exporter as metrics_exporter
+from ..ipsec import AES_GCM_128, HITLESS_REKEY, IpsecProposal, RekeyProfile
+from ..mtu import DEFAULT_UNDERLAY_MTU, tcp_mss, tunnel_mtu
+from ..routing import RoutePlan
+from ..sizing import INSTANCE_SIZES, InstanceSize
+from ..tuning import FORWARDING, NetworkTuningProfile
 import aws_cdk.aws_ec2 as ec2
 
 
-USER_DATA = """#!/usr/bin/bash
-sudo apt update
+class IpsecBackend(Enum):
+    # Legacy ipsec.conf loaded by the starter, one CHILD_SA per tunnel
+    STARTER = "strongswan-starter"
+    # swanctl.conf loaded over vici by charon-systemd, with pcrypt and
+    # RPS/XPS steering so ESP processing scales with the vCPU count
+    SWANCTL = "charon-systemd strongswan-swanctl"
+
+
+INSTALL = """sudo apt update
 sudo apt -y upgrade
-sudo apt install -y strongswan-starter
-sudo snap install aws-cli --classic
+sudo apt install -y {packages}
+"""
 
-# Fetch CGW private IP from IMDSv2
+METADATA = """# Fetch CGW private IP from IMDSv2
 TOKEN=$(curl -X PUT "http://169.254.169.254/latest/api/token" -H "X-aws-ec2-metadata-token-ttl-seconds: 21600")
 
-AWS_DEFAULT_REGION=$(curl -H "X-aws-ec2-metadata-token: $TOKEN" -s http://169.254.169.254/latest/dynamic/instance-identity/document | jq -r '.region')
-CGW_TUN1_PRIVATE_IP=$(curl -H "X-aws-ec2-metadata-token: $TOKEN" -s http://169.254.169.254/latest/meta-data/local-ipv4)
-CGW_TUN1_PUBLIC_IP=$(curl -H "X-aws-ec2-metadata-token: $TOKEN" -s http://169.254.169.254/latest/meta-data/public-ipv4)
+CGW_PRIVATE_IP=$(curl -H "X-aws-ec2-metadata-token: $TOKEN" -s http://169.254.169.254/latest/meta-data/local-ipv4)
+CGW_PUBLIC_IP=$(curl -H "X-aws-ec2-metadata-token: $TOKEN" -s http://169.254.169.254/latest/meta-data/public-ipv4)
+"""
 
+USER_DATA = """#!/usr/bin/bash
+{install}
+{metadata}
+# VPGW tunnel endpoints are rendered at deploy time. The instance tags carry the
+# same values for configurations rendered without them.
+{vpgw_public_ips}
+{tunnels}
+{ipsec_config}
+{routes}
 
-VPGW_TUN1_PUBLIC_IP=$(aws ssm get-parameter --name /vpn/vpgw/tunnel1/public_ip --query "Parameter.Value" --output text --region $AWS_DEFAULT_REGION)
-VPGW_TUN2_PUBLIC_IP=$(aws ssm get-parameter --name /vpn/vpgw/tunnel2/public_ip --query "Parameter.Value" --output text --region $AWS_DEFAULT_REGION)
 
+cat << EOF >> /etc/sysctl.conf
 
+net.ipv4.ip_forward=1
+{sysctls}net.ipv4.conf.$PRIMARY_INTERFACE.disable_xfrm=1 #This value disables crypto transformations on the physical interface
+net.ipv4.conf.$PRIMARY_INTERFACE.disable_policy=1 #This value disables IPsec policy (SPD) for the interface
+EOF
+sudo sysctl -p
 
-sudo sed -i 's/# install_routes = yes/install_routes = no/' /etc/strongswan.d/charon.conf
 
-sudo echo "$CGW_TUN1_PUBLIC_IP $VPGW_TUN1_PUBLIC_IP : PSK \"{tun1_pre_shared_key}\"" >> /etc/ipsec.secrets
-sudo ip link add Tunnel1 type vti local $CGW_TUN1_PRIVATE_IP remote $VPGW_TUN1_PUBLIC_IP key 100
-sudo ip addr add {cgw_tun1_link_local_inner_ip}/30 remote {vpgw_tun1_link_local_inner_ip}/30 dev Tunnel1
-sudo ip link set Tunnel1 up mtu 1419
-sudo ip route add {vpc_cidr} dev Tunnel1 metric 100
+{start}
+{exporter}"""
 
+VPGW_PUBLIC_IP = """VPGW_TUN{number}_PUBLIC_IP={vpgw_public_ip}
+VPGW_TUN{number}_PUBLIC_IP=${{VPGW_TUN{number}_PUBLIC_IP:-$(curl -H "X-aws-ec2-metadata-token: $TOKEN" -s http://169.254.169.254/latest/meta-data/tags/instance/{tag})}}
+"""
 
+TUNNEL_USER_DATA = """
+sudo ip link add Tunnel{number} type vti local $CGW_PRIVATE_IP remote $VPGW_TUN{number}_PUBLIC_IP key {mark}
+sudo ip addr add {cgw_link_local_inner_ip}/30 remote {vpgw_link_local_inner_ip}/30 dev Tunnel{number}
+sudo ip link set Tunnel{number} up mtu {mtu}
+# Clamp the MSS of TCP handshakes in both directions so flows never exceed the VTI MTU
+sudo iptables -t mangle -A FORWARD -o Tunnel{number} -p tcp --tcp-flags SYN,RST SYN -j TCPMSS --set-mss {mss}
+sudo iptables -t mangle -A FORWARD -i Tunnel{number} -p tcp --tcp-flags SYN,RST SYN -j TCPMSS --set-mss {mss}
+"""
+
+STARTER_CONFIG = """
+sudo sed -i 's/# install_routes = yes/install_routes = no/' /etc/strongswan.d/charon.conf
+sudo sed -i 's/# make_before_break = no/make_before_break = yes/' /etc/strongswan.d/charon.conf
+{rekey_log}{secrets}
 cat << EOF > /etc/ipsec.conf
 config setup
         charondebug="all"
         uniqueids=yes
         strictcrlpolicy=no
 
-conn Tunnel1
+conn %default
         type=tunnel
-        auto=start
         keyexchange=ikev2
         authby=psk
-        leftid=$CGW_TUN1_PRIVATE_IP
         leftsubnet={dc_cidr}
-        right=$VPGW_TUN1_PUBLIC_IP
         rightsubnet={vpc_cidr}
         aggressive=no
-        ikelifetime=28800s
-        lifetime=3600s
-        margintime=270s
+        ikelifetime={ikelifetime}
+        lifetime={lifetime}
+        margintime={margintime}
         rekey=yes
-        rekeyfuzz=100%
+        rekeyfuzz={rekeyfuzz}
+        reauth=no
         fragmentation=yes
         replay_window=1024
         dpddelay=30s
         dpdtimeout=120s
         dpdaction=restart
-        ike=aes128-sha1-modp1024
-        esp=aes128-sha1
+        ike={ike}
+        esp={esp}
         keyingtries=%forever
+{updown}{connections}EOF
+sudo sed -i 's/        /\t/g' /etc/ipsec.conf
+"""
+
+STARTER_SECRET = """sudo echo "$CGW_PUBLIC_IP $VPGW_TUN{number}_PUBLIC_IP : PSK \"{pre_shared_key}\"" >> /etc/ipsec.secrets
+"""
+
+TUNNEL_CONNECTION = """
+conn Tunnel{number}
+        auto=start
+        leftid=$CGW_PRIVATE_IP
+        right=$VPGW_TUN{number}_PUBLIC_IP
 
         ## Please note the following line assumes you only have two tunnels in your Strongswan configuration file. This "mark" value must be unique and may need to be changed based on other entries in your configuration file.
-        mark=100
+        mark={mark}
+"""
+
+STARTER_START = """sudo ipsec restart"""
+
+SWANCTL_CONFIG = """
+cat << EOF > /etc/strongswan.d/charon-systemd-vti.conf
+charon-systemd {{
+        install_routes = no
+        make_before_break = yes
+}}
 EOF
-sudo sed -i 's/        /\t/g' /etc/ipsec.conf
+{rekey_log}
+cat << EOF > /etc/swanctl/conf.d/tunnels.conf
+connections {{
+{connections}}}
 
+secrets {{
+{secrets}}}
+EOF
+sudo chmod 600 /etc/swanctl/conf.d/tunnels.conf
+"""
 
+# Same lifetimes as the starter config, both come from the RekeyProfile
+SWANCTL_CONNECTION = """        Tunnel{number} {{
+                version = 2
+                local_addrs = $CGW_PRIVATE_IP
+                remote_addrs = $VPGW_TUN{number}_PUBLIC_IP
+                proposals = {ike}
+                rekey_time = {ike_rekey_time}s
+                over_time = {ike_over_time}s
+                rand_time = {rand_time}s
+                dpd_delay = 30s
+                fragmentation = yes
+                mobike = no
+                keyingtries = 0
+                local {{
+                        auth = psk
+                        id = $CGW_PRIVATE_IP
+                }}
+                remote {{
+                        auth = psk
+                        id = $VPGW_TUN{number}_PUBLIC_IP
+                }}
+                children {{
+                        Tunnel{number} {{
+                                local_ts = {dc_cidr}
+                                remote_ts = {vpc_cidr}
+                                esp_proposals = {esp}
+                                rekey_time = {child_rekey_time}s
+                                life_time = {child_life_time}s
+                                rand_time = {rand_time}s
+                                replay_window = 1024
+                                mark_in = {mark}
+                                mark_out = {mark}
+                                start_action = start
+                                dpd_action = restart
+{updown}                        }}
+                }}
+        }}
+"""
 
-cat << EOF >> /etc/sysctl.conf
+# IKE and CHILD_SA exchanges with millisecond timestamps and the IKE_SA name,
+# which the exporter turns into rekey durations. A filelog replaces the default
+# syslog logger of the starter's charon, so that one is configured explicitly.
+REKEY_LOG = """cat << EOF > /etc/strongswan.d/rekey-log.conf
+{daemon} {{
+{syslog}        filelog {{
+                rekey {{
+                        path = {path}
+                        time_format = %s
+                        time_precision = ms
+                        ike_name = yes
+                        default = -1
+                        enc = 1
+                }}
+        }}
+}}
+EOF
+"""
 
-net.ipv4.ip_forward=1
-net.ipv4.conf.Tunnel1.rp_filter=2 #This value allows the Linux kernel to handle asymmetric routing
-net.ipv4.conf.Tunnel1.disable_policy=1 #This value disables IPsec policy (SPD) for the interface
-net.ipv4.conf.enp39s0.disable_xfrm=1 #This value disables crypto transformations on the physical interface
-net.ipv4.conf.enp39s0.disable_policy=1 #This value disables IPsec policy (SPD) for the interface
+REKEY_SYSLOG = """        syslog {
+                daemon {
+                        default = 1
+                }
+        }
+"""
+
+REKEY_LOG_PATH = "/var/log/charon-rekey.log"
+
+SWANCTL_SECRET = """        ike-Tunnel{number} {{
+                id = $VPGW_TUN{number}_PUBLIC_IP
+                secret = "{pre_shared_key}"
+        }}
+"""
+
+SWANCTL_UPDOWN = """                                updown = /usr/local/sbin/ecmp-updown
+"""
+
+# A VPGW tunnel accepts a single SA pair, so one SA is decrypted on one core.
+# pcrypt spreads the crypto of every SA over all CPUs: registering
+# pcrypt(<aead>) through the crypto netlink API makes it the highest priority
+# implementation, which SAs negotiated afterwards pick up. RPS then spreads
+# the decapsulated packets of the VTIs, XPS pins each ENA tx queue to a CPU.
+SWANCTL_START = """
+sudo modprobe pcrypt
+cat << 'EOF' > /usr/local/sbin/pcrypt-register
+#!/usr/bin/python3
+import errno, socket, struct, sys
+
+NETLINK_CRYPTO = 21
+CRYPTO_MSG_NEWALG = 0x10
+CRYPTO_ALG_TYPE_AEAD = 0x3
+CRYPTO_ALG_TYPE_MASK = 0xF
+NLM_F_REQUEST_ACK = 0x1 | 0x4
+
+sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_CRYPTO)
+for seq, name in enumerate(sys.argv[1:], start=1):
+    driver = ("pcrypt(" + name + ")").encode()
+    alg = struct.pack("64s64s64sIIII", b"", driver, b"", CRYPTO_ALG_TYPE_AEAD, CRYPTO_ALG_TYPE_MASK, 0, 0)
+    sock.sendto(struct.pack("IHHII", 16 + len(alg), CRYPTO_MSG_NEWALG, NLM_F_REQUEST_ACK, seq, 0) + alg, (0, 0))
+    error = -struct.unpack("i", sock.recv(4096)[16:20])[0]
+    if error not in (0, errno.EEXIST):
+        sys.exit("pcrypt(" + name + "): " + errno.errorcode.get(error, str(error)))
 EOF
-sudo sysctl -p
+sudo chmod 755 /usr/local/sbin/pcrypt-register
+sudo /usr/local/sbin/pcrypt-register {kernel_aeads}
 
+CPUS=$(nproc)
+# sysfs CPU masks are comma separated 32 bit words, the highest first. A
+# single shift overflows the shell's 64 bit integers on larger instances.
+cpu_mask() {{
+    local FIRST=$1 LAST=$2 MASK="" WORD BIT BITS
+    for (( WORD = (CPUS - 1) / 32; WORD >= 0; WORD-- )); do
+        BITS=0
+        for (( BIT = 0; BIT < 32; BIT++ )); do
+            if (( WORD * 32 + BIT >= FIRST && WORD * 32 + BIT <= LAST )); then
+                BITS=$(( BITS | (1 << BIT) ))
+            fi
+        done
+        MASK="$MASK${{MASK:+,}}$(printf '%08x' $BITS)"
+    done
+    echo $MASK
+}}
+CPU_MASK=$(cpu_mask 0 $(( CPUS - 1 )))
+for QUEUE in /sys/class/net/Tunnel*/queues/rx-*; do
+    echo $CPU_MASK | sudo tee $QUEUE/rps_cpus
+done
+for QUEUE in /sys/class/net/$PRIMARY_INTERFACE/queues/tx-*; do
+    INDEX=${{QUEUE##*-}}
+    cpu_mask $(( INDEX % CPUS )) $(( INDEX % CPUS )) | sudo tee $QUEUE/xps_cpus
+done
 
-sudo ipsec restart
+sudo systemctl restart strongswan"""
+
+STATIC_ROUTE = """sudo ip route add {vpc_cidr} dev Tunnel1 metric 100"""
+
+TUNNEL_SYSCTLS = """net.ipv4.conf.Tunnel{number}.rp_filter=2 #This value allows the Linux kernel to handle asymmetric routing
+net.ipv4.conf.Tunnel{number}.disable_policy=1 #This value disables IPsec policy (SPD) for the interface
 """
 
+# In active-active mode the route to the VPC is an ECMP route over every tunnel
+# whose CHILD_SA is up. strongSwan calls the updown script on every SA state
+# change, so a dead tunnel is removed from the nexthops instead of blackholing
+# its share of the flows.
+ECMP_UPDOWN = """        leftupdown=/usr/local/sbin/ecmp-updown
+"""
+
+ECMP_ROUTES = """
+cat << 'EOF' > /usr/local/sbin/ecmp-updown
+#!/usr/bin/bash
+mkdir -p /run/ecmp
+case "$PLUTO_VERB" in
+    up-client) touch "/run/ecmp/$PLUTO_CONNECTION" ;;
+    down-client) rm -f "/run/ecmp/$PLUTO_CONNECTION" ;;
+    *) exit 0 ;;
+esac
+NEXTHOPS=""
+for TUNNEL in $(ls /run/ecmp); do
+    NEXTHOPS="$NEXTHOPS nexthop dev $TUNNEL weight 1"
+done
+for PREFIX in {vpc_cidrs}; do
+    if [ -n "$NEXTHOPS" ]; then
+        ip route replace $PREFIX metric 100 $NEXTHOPS
+    else
+        ip route del $PREFIX metric 100
+    fi
+done
+EOF
+sudo chmod 755 /usr/local/sbin/ecmp-updown"""
+
+# Dynamic VPN connections advertise routes over BGP inside the tunnels instead
+# of static routes. bgpd installs the VPC routes learned from every tunnel as
+# one multipath route, and drops a tunnel's routes when its session's hold
+# timer expires. The traffic selectors are 0.0.0.0/0, the VTIs do the routing.
+BGP_ROUTES = """
+sudo sed -i 's/^bgpd=no/bgpd=yes/' /etc/frr/daemons
+cat << EOF > /etc/frr/frr.conf
+frr defaults traditional
+router bgp {asn}
+ bgp router-id $CGW_PRIVATE_IP
+ no bgp ebgp-requires-policy
+ no bgp network import-check
+ bgp bestpath as-path multipath-relax
+{neighbors} address-family ipv4 unicast
+{networks}  maximum-paths {maximum_paths}
+ exit-address-family
+EOF
+sudo systemctl enable frr
+sudo systemctl restart frr"""
+
+# BGP sessions use the lower hold time of both peers. The AWS endpoints propose
+# 10s/30s, proposing 3s/9s withdraws the routes of a dead tunnel on both sides
+# within seconds, where DPD (30s delay, 120s timeout) would take minutes. AWS
+# VPN endpoints do not speak BFD, so the hold timer is the failure detector.
+BGP_NEIGHBOR = """ neighbor {vpgw_link_local_inner_ip} remote-as {peer_asn}
+ neighbor {vpgw_link_local_inner_ip} timers {keepalive} {hold}
+ neighbor {vpgw_link_local_inner_ip} timers connect 5
+"""
+
+BGP_NETWORK = """  network {dc_cidr}
+"""
+
+BGP_KEEPALIVE = 3
+BGP_HOLD = 9
+
+BGP_TRAFFIC_SELECTOR = "0.0.0.0/0"
+
+# Hash on the L4 ports as well so flows between the same two hosts are spread
+# over both tunnels.
+ECMP_SYSCTLS = """net.ipv4.fib_multipath_hash_policy=1
+"""
+
+
+# Samples the xfrm, ENA and softirq counters of the CGW (see exporter.py) and
+# hands the metrics to the CloudWatch agent as EMF. The script is an asset,
+# the CGW user data is close to the 16 KB limit without it.
+EXPORTER = """
+{script}
+{agent}
+cat << EOF > /etc/systemd/system/cgw-exporter.service
+[Unit]
+Description=CGW data plane metrics exporter
+After=network-online.target amazon-cloudwatch-agent.service
+
+[Service]
+ExecStart=/usr/bin/python3 /usr/local/sbin/cgw-exporter --vpn-id {vpn_id} --local-ip $CGW_PRIVATE_IP --interface $PRIMARY_INTERFACE {tunnels} --rekey-log {rekey_log} --log-group {log_group}
+Restart=always
+
+[Install]
+WantedBy=multi-user.target
+EOF
+sudo systemctl daemon-reload
+sudo systemctl enable --now cgw-exporter
+"""
+
+
+def install_script(
+    backend: IpsecBackend, *, bgp: bool = False, metrics: bool = False
+) -> str:
+    packages = f"{backend.value} frr" if bgp else backend.value
+    script = INSTALL.format(packages=packages)
+    if metrics:
+        script += CLOUDWATCH_AGENT_INSTALL
+    return script
+
+
+def exporter_script(
+    tunnels: list[dict], *, script: s3_assets.Asset, vpn_id: str, log_group: str
+) -> str:
+    return EXPORTER.format(
+        script=asset_script(script, path="/usr/local/sbin/cgw-exporter"),
+        agent=CLOUDWATCH_AGENT_EMF,
+        vpn_id=vpn_id,
+        tunnels=" ".join(
+            f"--tunnel Tunnel{tunnel['number']}={tunnel['mark']}" for tunnel in tunnels
+        ),
+        rekey_log=REKEY_LOG_PATH,
+        log_group=log_group,
+    )
+
+
+def render_user_data(
+    tunnels: list[dict],
+    *,
+    routes: RoutePlan,
+    proposal: IpsecProposal = AES_GCM_128,
+    rekey: RekeyProfile = HITLESS_REKEY,
+    underlay_mtu: int = DEFAULT_UNDERLAY_MTU,
+    backend: IpsecBackend = IpsecBackend.STARTER,
+    bgp_asn: int | None = None,
+    peer_asn: int | None = None,
+    install: bool = True,
+    metadata: str = METADATA,
+    start: str | None = None,
+    exporter: str = "",
+) -> str:
+    # Pure rendering of the CGW bootstrap script, also used by the emulator.
+    # metadata and start default to the EC2 instance metadata and services.
+    active_active = len(tunnels) > 1
+    if bgp_asn:
+        local_ts = remote_ts = BGP_TRAFFIC_SELECTOR
+    else:
+        local_ts, remote_ts = routes.traffic_selectors
+    # The CGW sits behind a 1:1 EIP NAT, so ESP is always UDP encapsulated
+    mtu = tunnel_mtu(proposal, underlay_mtu=underlay_mtu, nat_traversal=True)
+    mss = tcp_mss(mtu)
+
+    if backend is IpsecBackend.SWANCTL:
+        ipsec_config = SWANCTL_CONFIG.format(
+            connections="".join(
+                SWANCTL_CONNECTION.format(
+                    number=tunnel["number"],
+                    mark=tunnel["mark"],
+                    ike=proposal.ike_proposals,
+                    esp=proposal.esp_proposals,
+                    ike_rekey_time=rekey.ike_rekey_time,
+                    ike_over_time=rekey.phase1_lifetime - rekey.ike_rekey_time,
+                    child_rekey_time=rekey.child_rekey_time,
+                    child_life_time=rekey.phase2_lifetime,
+                    rand_time=rekey.rand_time,
+                    dc_cidr=local_ts,
+                    vpc_cidr=remote_ts,
+                    updown=SWANCTL_UPDOWN if active_active and not bgp_asn else "",
+                )
+                for tunnel in tunnels
+            ),
+            secrets="".join(SWANCTL_SECRET.format(**tunnel) for tunnel in tunnels),
+            rekey_log=REKEY_LOG.format(
+                daemon="charon-systemd", syslog="", path=REKEY_LOG_PATH
+            ),
+        )
+        start = start or SWANCTL_START.format(
+            kernel_aeads=" ".join(map(shlex.quote, proposal.kernel_aeads))
+        )
+    else:
+        ipsec_config = STARTER_CONFIG.format(
+            secrets="".join(STARTER_SECRET.format(**tunnel) for tunnel in tunnels),
+            connections="".join(
+                TUNNEL_CONNECTION.format(**tunnel) for tunnel in tunnels
+            ),
+            updown=ECMP_UPDOWN if active_active and not bgp_asn else "",
+            vpc_cidr=remote_ts,
+            dc_cidr=local_ts,
+            ike=proposal.ike,
+            esp=proposal.esp,
+            rekey_log=REKEY_LOG.format(
+                daemon="charon", syslog=REKEY_SYSLOG, path=REKEY_LOG_PATH
+            ),
+            **rekey.starter,
+        )
+        start = start or STARTER_START
+
+    if bgp_asn:
+        routing = BGP_ROUTES.format(
+            asn=bgp_asn,
+            neighbors="".join(
+                BGP_NEIGHBOR.format(
+                    peer_asn=peer_asn,
+                    keepalive=BGP_KEEPALIVE,
+                    hold=BGP_HOLD,
+                    **tunnel,
+                )
+                for tunnel in tunnels
+            ),
+            networks="".join(
+                BGP_NETWORK.format(dc_cidr=dc_cidr) for dc_cidr in routes.site_prefixes
+            ),
+            maximum_paths=len(tunnels),
+        )
+    elif active_active:
+        routing = ECMP_ROUTES.format(vpc_cidrs=" ".join(routes.cgw_routes))
+    else:
+        routing = "\n".join(
+            STATIC_ROUTE.format(vpc_cidr=vpc_cidr) for vpc_cidr in routes.cgw_routes
+        )
+
+    return USER_DATA.format(
+        install=(
+            install_script(backend, bgp=bool(bgp_asn), metrics=bool(exporter))
+            if install
+            else ""
+        ),
+        metadata=metadata,
+        vpgw_public_ips="".join(
+            VPGW_PUBLIC_IP.format(
+                number=tunnel["number"],
+                vpgw_public_ip=tunnel["vpgw_public_ip"] or "",
+                tag=f"VpgwTun{tunnel['number']}PublicIp",
+            )
+            for tunnel in tunnels
+        ),
+        tunnels="".join(
+            TUNNEL_USER_DATA.format(mtu=mtu, mss=mss, **tunnel) for tunnel in tunnels
+        ),
+        ipsec_config=ipsec_config,
+        routes=routing,
+        sysctls="".join(TUNNEL_SYSCTLS.format(**tunnel) for tunnel in tunnels)
+        + (ECMP_SYSCTLS if active_active else ""),
+        start=start,
+        exporter=exporter,
+    )
+
 
 class CustomerGateway(Construct):
     def __init__(
@@ -90,41 +529,135 @@ class CustomerGateway(Construct):
         scope: Construct,
         id: str,
         *,
+        name: str = "customer-gateway",
         dc_vpc: ec2.Vpc,
         dc_public_subnet: ec2.ISubnet,
         cgw_eip_allocation_id: str,
-        vpgw_tun1_public_ip: str,
+        vpgw_tun1_public_ip: str | None,
         tun1_pre_shared_key: str,
         cgw_tun1_link_local_inner_ip: str,
         vpgw_tun1_link_local_inner_ip: str,
-        vpc_cidr: str,
-        dc_cidr: str,
+        routes: RoutePlan,
+        vpgw_tun2_public_ip: str | None = None,
+        tun2_pre_shared_key: str | None = None,
+        cgw_tun2_link_local_inner_ip: str | None = None,
+        vpgw_tun2_link_local_inner_ip: str | None = None,
+        proposal: IpsecProposal = AES_GCM_128,
+        rekey: RekeyProfile = HITLESS_REKEY,
+        underlay_mtu: int = DEFAULT_UNDERLAY_MTU,
+        backend: IpsecBackend = IpsecBackend.STARTER,
+        tuning_profile: NetworkTuningProfile = FORWARDING,
+        size: InstanceSize = INSTANCE_SIZES["m7a.xlarge"],
+        placement_group_name: str | None = None,
+        bgp_asn: int | None = None,
+        peer_asn: int | None = None,
+        golden_image: GoldenImage | None = None,
+        vpn_id: str | None = None,
     ):
         super().__init__(scope, id)
-        formatted_user_data = USER_DATA.format(
-            vpgw_tun1_public_ip=vpgw_tun1_public_ip,
-            tun1_pre_shared_key=tun1_pre_shared_key,
-            cgw_tun1_link_local_inner_ip=cgw_tun1_link_local_inner_ip,
-            vpgw_tun1_link_local_inner_ip=vpgw_tun1_link_local_inner_ip,
-            vpc_cidr=vpc_cidr,
-            dc_cidr=dc_cidr,
+        tunnels = [
+            dict(
+                number=1,
+                mark=100,
+                vpgw_public_ip=vpgw_tun1_public_ip,
+                pre_shared_key=tun1_pre_shared_key,
+                cgw_link_local_inner_ip=cgw_tun1_link_local_inner_ip,
+                vpgw_link_local_inner_ip=vpgw_tun1_link_local_inner_ip,
+            )
+        ]
+        if tun2_pre_shared_key:
+            if not (cgw_tun2_link_local_inner_ip and vpgw_tun2_link_local_inner_ip):
+                raise ValueError(
+                    "Active-active mode requires the link-local inner IPs of tunnel 2"
+                )
+            tunnels.append(
+                dict(
+                    number=2,
+                    mark=200,
+                    vpgw_public_ip=vpgw_tun2_public_ip,
+                    pre_shared_key=tun2_pre_shared_key,
+                    cgw_link_local_inner_ip=cgw_tun2_link_local_inner_ip,
+                    vpgw_link_local_inner_ip=vpgw_tun2_link_local_inner_ip,
+                )
+            )
+        if bgp_asn and not peer_asn:
+            raise ValueError("BGP requires the Amazon side ASN as peer_asn")
+        for warning in rekey.warnings(proposal):
+            Annotations.of(self).add_warning(warning)
+        self.active_active = len(tunnels) > 1
+        self.bgp = bool(bgp_asn)
+        self.backend = backend
+        # The CGW sits behind a 1:1 EIP NAT, so ESP is always UDP encapsulated
+        self.tunnel_mtu = tunnel_mtu(
+            proposal, underlay_mtu=underlay_mtu, nat_traversal=True
+        )
+        self.tcp_mss = tcp_mss(self.tunnel_mtu)
+        # Data plane metrics are published per VPN connection, next to the
+        # AWS/VPN metrics of the same VpnId
+        self.metrics_log_group = self.exporter_asset = None
+        exporter = ""
+        if vpn_id:
+            self.exporter_asset = s3_assets.Asset(
+                self, "Exporter", path=str(metrics_exporter.__file__)
+            )
+            self.metrics_log_group = logs.LogGroup(
+                self,
+                "MetricsLogGroup",
+                log_group_name=f"/vpn/{name}/metrics",
+                retention=logs.RetentionDays.ONE_WEEK,
+                removal_policy=RemovalPolicy.DESTROY,
+            )
+            exporter = exporter_script(
+                tunnels,
+                script=self.exporter_asset,
+                vpn_id=vpn_id,
+                log_group=self.metrics_log_group.log_group_name,
+            )
+        formatted_user_data = render_user_data(
+            tunnels,
+            routes=routes,
+            proposal=proposal,
+            rekey=rekey,
+            underlay_mtu=underlay_mtu,
+            backend=backend,
+            bgp_asn=bgp_asn,
+            peer_asn=peer_asn,
+            install=not golden_image,
+            exporter=exporter,
         )
         self.instance = Instance(
             self,
             "CustomerGateway",
-            name="customer-gateway",
+            name=name,
             vpc=dc_vpc,
             subnet=dc_public_subnet,
-            instance_type="m7a.xlarge",
-            ami_id=Ubuntu.X86.value,
+            instance_type=size.instance_type,
+            ami_id=size.ami_id,
             allow_packet_forwarding=True,
+            tuning_profile=tuning_profile,
             user_data=formatted_user_data,
+            placement_group_name=placement_group_name,
+            ena_express=size.ena_express,
+            golden_image=golden_image,
         )
+        for tunnel in tunnels:
+            if tunnel["vpgw_public_ip"]:
+                Tags.of(self.instance.cfn_instance).add(
+                    f"VpgwTun{tunnel['number']}PublicIp", tunnel["vpgw_public_ip"]
+                )
+        if self.metrics_log_group:
+            self.exporter_asset.grant_read(self.instance.role)
+            self.instance.role.add_managed_policy(
+                iam.ManagedPolicy.from_aws_managed_policy_name(
+                    "CloudWatchAgentServerPolicy"
+                )
+            )
         self.instance.allow_ssh_from_local()
         self.instance.add_eip(eip_allocation=cgw_eip_allocation_id)
-        self.instance.security_group.add_ingress_rule(
-            peer=ec2.Peer.ipv4(dc_cidr), connection=ec2.Port.all_traffic()
-        )
+        for dc_cidr in routes.site_prefixes:
+            self.instance.security_group.add_ingress_rule(
+                peer=ec2.Peer.ipv4(dc_cidr), connection=ec2.Port.all_traffic()
+            )
         # Note: CGW establishes a long-lived connection with the vpgw endpoint
         # on which other traffic is piggy-backing. I.e. vpgw tunnel endpoints does not
         # connect to the cgw, i.e. no further inbound route is required
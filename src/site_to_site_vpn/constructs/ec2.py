@@ -1,8 +1,58 @@
-from aws_cdk import CfnOutput, CfnTag
+from aws_cdk import CfnOutput, CfnTag, Fn, Stack
 import aws_cdk.aws_ec2 as ec2
 import aws_cdk.aws_iam as iam
 from constructs import Construct
-import base64
+
+from ..operator_context import OperatorContext
+from ..tuning import NetworkTuningProfile
+from .golden_image import GoldenImage
+
+# CDK context key (cdk synth -c shared_instance_resources=true) making every
+# Instance share the role, instance profile and key pair of its stack
+SHARED_INSTANCE_RESOURCES_CONTEXT = "shared_instance_resources"
+# EC2 rejects user data above 16 KB before base64 encoding. Deploy-time
+# tokens count with the length of their placeholder, which is longer than
+# the IPs and ids they resolve to.
+USER_DATA_LIMIT = 16 * 1024
+
+
+class SharedInstanceResources(Construct):
+    # IAM resources are among the slowest to create, so the instances of a
+    # stack can share one role, instance profile and key pair. Policies added
+    # to the role apply to all of them. Roles are not shared across stacks, a
+    # grant from a consuming stack would make the stacks depend on each other.
+    ID = "SharedInstanceResources"
+
+    def __init__(self, scope: Construct, id: str):
+        super().__init__(scope, id)
+        self.role = iam.Role(
+            self,
+            "Role",
+            assumed_by=iam.ServicePrincipal("ec2.amazonaws.com"),  # type: ignore
+        )
+        self.role.add_managed_policy(
+            iam.ManagedPolicy.from_aws_managed_policy_name(
+                "AmazonSSMManagedInstanceCore"
+            )
+        )
+        self.instance_profile = iam.InstanceProfile(
+            self,
+            "InstanceProfile",
+            role=self.role,  # type: ignore
+        )
+        self._key_pair: ec2.KeyPair | None = None
+
+    @classmethod
+    def of(cls, scope: Construct) -> "SharedInstanceResources":
+        stack = Stack.of(scope)
+        return stack.node.try_find_child(cls.ID) or cls(stack, cls.ID)
+
+    def key_pair(self, public_key: str) -> ec2.KeyPair:
+        if not self._key_pair:
+            self._key_pair = ec2.KeyPair(
+                self, "KeyPair", public_key_material=public_key
+            )
+        return self._key_pair
 
 
 class Instance(Construct):
@@ -19,29 +69,53 @@ class Instance(Construct):
         user_data: str = "",
         ssh_key_name: str | None = None,
         allow_packet_forwarding: bool = False,
+        tuning_profile: NetworkTuningProfile | None = None,
+        placement_group_name: str | None = None,
+        ena_express: bool = False,
+        golden_image: GoldenImage | None = None,
+        share_resources: bool | None = None,
     ):
         super().__init__(scope, id)
+        if share_resources is None:
+            share_resources = str(
+                self.node.try_get_context(SHARED_INSTANCE_RESOURCES_CONTEXT)
+            ).lower() in ("1", "true", "yes")
+        if golden_image:
+            ami_id = golden_image.image_id
+        if tuning_profile:
+            if golden_image and golden_image.tuning_profile == tuning_profile:
+                preamble = tuning_profile.boot_user_data
+            else:
+                preamble = tuning_profile.user_data
+            user_data = self._with_preamble(user_data, preamble)
         self.instance_name = name
+        self.user_data = self._checked_user_data(user_data)
         self.vpc = vpc
         self.subnet = subnet
         self.subnet_id = subnet.subnet_id
-        role_name = f"{self.instance_name}-role"
-        self.role = iam.Role(
-            self,
-            "Role",
-            assumed_by=iam.ServicePrincipal("ec2.amazonaws.com"),  # type: ignore
-            role_name=role_name,
-        )
-        self.role.add_managed_policy(
-            iam.ManagedPolicy.from_aws_managed_policy_name(
-                "AmazonSSMManagedInstanceCore"
+        self.shared_resources = None
+        if share_resources:
+            self.shared_resources = SharedInstanceResources.of(self)
+            self.role = self.shared_resources.role
+            instance_profile = self.shared_resources.instance_profile
+        else:
+            role_name = f"{self.instance_name}-role"
+            self.role = iam.Role(
+                self,
+                "Role",
+                assumed_by=iam.ServicePrincipal("ec2.amazonaws.com"),  # type: ignore
+                role_name=role_name,
+            )
+            self.role.add_managed_policy(
+                iam.ManagedPolicy.from_aws_managed_policy_name(
+                    "AmazonSSMManagedInstanceCore"
+                )
+            )
+            instance_profile = iam.InstanceProfile(
+                self,
+                "InstanceProfile",
+                role=self.role,  # type: ignore
             )
-        )
-        instance_profile = iam.InstanceProfile(
-            self,
-            "InstanceProfile",
-            role=self.role,  # type: ignore
-        )
         self.security_group = ec2.SecurityGroup(
             self,
             "SecurityGroup",
@@ -49,6 +123,26 @@ class Instance(Construct):
             allow_all_outbound=True,
             security_group_name=f"{name}-sg",
         )
+        # ENA Express (SRD) is configured per network interface, so the primary
+        # interface has to be declared explicitly
+        network_interfaces = None
+        subnet_id = self.subnet_id
+        security_group_ids = [self.security_group.security_group_id]
+        if ena_express:
+            network_interfaces = [
+                ec2.CfnInstance.NetworkInterfaceProperty(
+                    device_index="0",
+                    subnet_id=self.subnet_id,
+                    group_set=security_group_ids,
+                    ena_srd_specification=ec2.CfnInstance.EnaSrdSpecificationProperty(
+                        ena_srd_enabled=True,
+                        ena_srd_udp_specification=ec2.CfnInstance.EnaSrdUdpSpecificationProperty(
+                            ena_srd_udp_enabled=True
+                        ),
+                    ),
+                )
+            ]
+            subnet_id = security_group_ids = None
         self.cfn_instance = ec2.CfnInstance(
             self,
             "Instance",
@@ -74,12 +168,15 @@ class Instance(Construct):
                 http_tokens="required",
                 instance_metadata_tags="enabled",
             ),
+            network_interfaces=network_interfaces,
+            placement_group_name=placement_group_name,
             propagate_tags_to_volume_on_creation=True,
-            security_group_ids=[self.security_group.security_group_id],
+            security_group_ids=security_group_ids,
             source_dest_check=not allow_packet_forwarding,
-            subnet_id=self.subnet_id,
+            subnet_id=subnet_id,
             tags=[CfnTag(key="Name", value=self.instance_name)],
-            user_data=base64.b64encode(user_data.encode("utf-8")).decode("utf-8"),
+            # Fn.base64 keeps deploy-time tokens in the user data resolvable
+            user_data=Fn.base64(self.user_data),
         )
         self.instance_id = self.cfn_instance.get_att("InstanceId").to_string()
         self.private_ip = self.cfn_instance.get_att("PrivateIp").to_string()
@@ -118,28 +215,59 @@ class Instance(Construct):
         )
 
     def allow_ssh_from_local(self):
-        from pathlib import Path
-
-        ssh_dir = Path.home() / ".ssh"
-
-        pub_files = list(ssh_dir.glob("*.pub"))
-
-        public_key = pub_files[0].read_text().strip()
+        # The admin CIDR and SSH key are resolved once per app, see
+        # operator_context.py
+        operator = OperatorContext.of(self)
+        if operator.ssh_public_key:
+            if self.shared_resources:
+                kp = self.shared_resources.key_pair(operator.ssh_public_key)
+            else:
+                kp = ec2.KeyPair(
+                    self, "KeyPair", public_key_material=operator.ssh_public_key
+                )
+            self.cfn_instance.key_name = kp.key_pair_name
+        if operator.admin_cidr:
+            self.security_group.add_ingress_rule(
+                peer=ec2.Peer.ipv4(operator.admin_cidr),
+                connection=ec2.Port.tcp(22),
+                description="Allow SSH from my IP",
+            )
 
-        kp = ec2.KeyPair(self, "KeyPair", public_key_material=public_key)
-        self.cfn_instance.key_name = kp.key_pair_name
+    @staticmethod
+    def _with_preamble(user_data: str, preamble: str) -> str:
+        # Run the preamble right after the shebang, before the instance script
+        if user_data.startswith("#!"):
+            shebang, _, script = user_data.partition("\n")
+        else:
+            shebang, script = "#!/usr/bin/bash", user_data
+        return "\n".join([shebang, preamble, script])
 
-        import urllib.request
+    def add_user_data(self, script: str):
+        # Runs after the instance's own user data
+        if not self.user_data:
+            self.user_data = "#!/usr/bin/bash"
+        self.user_data = self._checked_user_data("\n".join([self.user_data, script]))
+        self.cfn_instance.user_data = Fn.base64(self.user_data)
 
-        with urllib.request.urlopen("https://checkip.amazonaws.com") as response:
-            your_public_ip = response.read().decode("utf-8").strip()
-        self.security_group.add_ingress_rule(
-            peer=ec2.Peer.ipv4(f"{your_public_ip}/32"),
-            connection=ec2.Port.tcp(22),
-            description="Allow SSH from my IP",
-        )
+    def _checked_user_data(self, user_data: str) -> str:
+        size = len(user_data.encode())
+        if size > USER_DATA_LIMIT:
+            raise ValueError(
+                f"User data of {self.instance_name} is {size} bytes, "
+                f"EC2 allows {USER_DATA_LIMIT}"
+            )
+        return user_data
 
     def allow_ping_from(self, cidr: str):
         self.security_group.add_ingress_rule(
             peer=ec2.Peer.ipv4(cidr), connection=ec2.Port.all_icmp()
         )
+
+    def allow_probes_from(self, cidr: str, port: int):
+        # UDP echo and TCP connects on the reflector port, ICMP is allow_ping_from
+        for connection in (ec2.Port.udp(port), ec2.Port.tcp(port)):
+            self.security_group.add_ingress_rule(
+                peer=ec2.Peer.ipv4(cidr),
+                connection=connection,
+                description="Allow latency probes",
+            )
@@ -0,0 +1,115 @@
+import hashlib
+import json
+
+import aws_cdk.aws_ec2 as ec2
+import aws_cdk.aws_iam as iam
+import aws_cdk.aws_imagebuilder as imagebuilder
+from constructs import Construct
+
+from ..tuning import NetworkTuningProfile
+
+# Builds only install packages, a small instance of the right architecture will do
+BUILD_INSTANCE_TYPES = {False: "m7a.large", True: "c7g.large"}
+
+
+class GoldenImage(Construct):
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        *,
+        name: str,
+        vpc: ec2.IVpc,
+        subnet: ec2.ISubnet,
+        parent_image: str,
+        setup: str,
+        arm: bool = False,
+        tuning_profile: NetworkTuningProfile | None = None,
+    ):
+        super().__init__(scope, id)
+        self.tuning_profile = tuning_profile
+        if tuning_profile:
+            setup += tuning_profile.image_setup
+        # Recipes and components are immutable, a changed setup script gets a
+        # new name so CloudFormation replaces them and rebuilds the image
+        digest = hashlib.sha256((parent_image + setup).encode("utf-8")).hexdigest()
+        versioned_name = f"{name}-{digest[:8]}"
+
+        component = imagebuilder.CfnComponent(
+            self,
+            "Component",
+            name=versioned_name,
+            platform="Linux",
+            version="1.0.0",
+            # Component documents are YAML, which is a superset of JSON
+            data=json.dumps(
+                {
+                    "name": versioned_name,
+                    "schemaVersion": 1.0,
+                    "phases": [
+                        {
+                            "name": "build",
+                            "steps": [
+                                {
+                                    "name": "Setup",
+                                    "action": "ExecuteBash",
+                                    "inputs": {"commands": [setup]},
+                                }
+                            ],
+                        }
+                    ],
+                }
+            ),
+        )
+        recipe = imagebuilder.CfnImageRecipe(
+            self,
+            "Recipe",
+            name=versioned_name,
+            version="1.0.0",
+            parent_image=parent_image,
+            components=[
+                imagebuilder.CfnImageRecipe.ComponentConfigurationProperty(
+                    component_arn=component.attr_arn
+                )
+            ],
+        )
+
+        role = iam.Role(
+            self,
+            "Role",
+            assumed_by=iam.ServicePrincipal("ec2.amazonaws.com"),  # type: ignore
+            managed_policies=[
+                iam.ManagedPolicy.from_aws_managed_policy_name(
+                    "AmazonSSMManagedInstanceCore"
+                ),
+                iam.ManagedPolicy.from_aws_managed_policy_name(
+                    "EC2InstanceProfileForImageBuilder"
+                ),
+            ],
+        )
+        instance_profile = iam.InstanceProfile(self, "InstanceProfile", role=role)  # type: ignore
+        security_group = ec2.SecurityGroup(
+            self, "SecurityGroup", vpc=vpc, allow_all_outbound=True
+        )
+        infrastructure = imagebuilder.CfnInfrastructureConfiguration(
+            self,
+            "Infrastructure",
+            name=versioned_name,
+            instance_profile_name=instance_profile.instance_profile_name,
+            instance_types=[BUILD_INSTANCE_TYPES[arm]],
+            subnet_id=subnet.subnet_id,
+            security_group_ids=[security_group.security_group_id],
+            terminate_instance_on_failure=True,
+        )
+
+        # Built while the stack deploys, so the AMI id can be consumed directly
+        self.image = imagebuilder.CfnImage(
+            self,
+            "Image",
+            image_recipe_arn=recipe.attr_arn,
+            infrastructure_configuration_arn=infrastructure.attr_arn,
+            image_tests_configuration=imagebuilder.CfnImage.ImageTestsConfigurationProperty(
+                image_tests_enabled=False
+            ),
+        )
+        self.image_id = self.image.attr_image_id
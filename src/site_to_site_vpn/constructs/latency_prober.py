@@ -0,0 +1,128 @@
+from aws_cdk import RemovalPolicy
+import aws_cdk.aws_cloudwatch as cloudwatch
+import aws_cdk.aws_iam as iam
+import aws_cdk.aws_logs as logs
+from constructs import Construct
+
+from .ec2 import Instance
+from .monitoring import (
+    CLOUDWATCH_AGENT_EMF,
+    CLOUDWATCH_AGENT_INSTALL,
+    embedded_script,
+    metric_period,
+)
+from .. import prober
+from ..prober import NAMESPACE, PROTOCOLS, LatencyProbe
+
+SERVICE = """{script}
+cat << EOF > /etc/systemd/system/vpn-prober.service
+[Unit]
+Description=VPN latency and loss {role}
+After=network-online.target
+
+[Service]
+ExecStart=/usr/local/sbin/vpn-prober {args}
+Restart=always
+
+[Install]
+WantedBy=multi-user.target
+EOF
+sudo systemctl daemon-reload
+sudo systemctl enable --now vpn-prober
+"""
+
+
+def reflector_user_data(probe: LatencyProbe) -> str:
+    return SERVICE.format(
+        script=embedded_script(prober, path="/usr/local/sbin/vpn-prober"),
+        role="reflector",
+        args=f"--reflect --port {probe.port}",
+    )
+
+
+class LatencyProber(Construct):
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        *,
+        instance: Instance,
+        target_ip: str,
+        target_name: str,
+        probe: LatencyProbe = LatencyProbe(),
+    ):
+        super().__init__(scope, id)
+        period = metric_period(probe.window)
+        self.log_group = logs.LogGroup(
+            self,
+            "LogGroup",
+            log_group_name=f"/vpn/{instance.instance_name}/probes",
+            retention=logs.RetentionDays.ONE_WEEK,
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+        instance.role.add_managed_policy(
+            iam.ManagedPolicy.from_aws_managed_policy_name(
+                "CloudWatchAgentServerPolicy"
+            )
+        )
+        instance.add_user_data(
+            CLOUDWATCH_AGENT_INSTALL
+            + CLOUDWATCH_AGENT_EMF
+            + SERVICE.format(
+                script=embedded_script(prober, path="/usr/local/sbin/vpn-prober"),
+                role="prober",
+                args=" ".join(
+                    [
+                        f"--target {target_ip}",
+                        f"--source-name {instance.instance_name}",
+                        f"--target-name {target_name}",
+                        f"--port {probe.port}",
+                        f"--interval {probe.interval}",
+                        f"--timeout {probe.timeout}",
+                        f"--window {probe.window}",
+                        f"--log-group {self.log_group.log_group_name}",
+                    ]
+                ),
+            )
+        )
+
+        # One window per datapoint, alarm when 3 of the last 5 miss the SLO
+        self.alarms = []
+        for protocol in PROTOCOLS:
+            dimensions = {
+                "Source": instance.instance_name,
+                "Target": target_name,
+                "Protocol": protocol,
+            }
+            for metric_name, threshold, description in (
+                (
+                    "RttP99",
+                    probe.rtt_p99_slo_ms,
+                    f"p99 {protocol} RTT above {probe.rtt_p99_slo_ms} ms",
+                ),
+                (
+                    "Loss",
+                    probe.loss_slo_percent,
+                    f"{protocol} probe loss above {probe.loss_slo_percent}%",
+                ),
+            ):
+                self.alarms.append(
+                    cloudwatch.Alarm(
+                        self,
+                        f"{protocol.title()}{metric_name}Alarm",
+                        alarm_description=(
+                            f"{instance.instance_name} -> {target_name}: {description}"
+                        ),
+                        metric=cloudwatch.Metric(
+                            namespace=NAMESPACE,
+                            metric_name=metric_name,
+                            dimensions_map=dimensions,
+                            statistic="Maximum",
+                            period=period,
+                        ),
+                        threshold=threshold,
+                        comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
+                        evaluation_periods=5,
+                        datapoints_to_alarm=3,
+                    )
+                )
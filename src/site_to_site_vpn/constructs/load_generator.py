@@ -0,0 +1,67 @@
+from dataclasses import asdict
+import json
+
+from ..load_test import LoadTest
+
+INSTALL = """sudo apt update
+sudo apt -y upgrade
+sudo apt install -y build-essential git iperf3 libssl-dev zlib1g-dev
+sudo snap install aws-cli --classic
+
+# wrk2 is not packaged, build it from source
+git clone --depth 1 https://github.com/giltene/wrk2 /opt/wrk2
+make -C /opt/wrk2
+sudo install /opt/wrk2/wrk /usr/local/bin/wrk2
+"""
+
+# Installed as a command so a run can be repeated after every infrastructure
+# change: `sudo vpn-load-test` on the dc-client
+LOAD_TEST = """#!/usr/bin/bash
+set -euo pipefail
+RUN_ID=$(date -u +%Y%m%dT%H%M%SZ)
+RUN_DIR=$(mktemp -d)
+
+TOKEN=$(curl -s -X PUT "http://169.254.169.254/latest/api/token" -H "X-aws-ec2-metadata-token-ttl-seconds: 300")
+INSTANCE_TYPE=$(curl -s -H "X-aws-ec2-metadata-token: $TOKEN" http://169.254.169.254/latest/meta-data/instance-type)
+
+# Wait until the tunnel is up and the web server answers
+for attempt in $(seq 60); do
+    curl -sf -o /dev/null --max-time 5 http://{target_ip}/ && break
+    sleep 10
+done
+
+cat << META > $RUN_DIR/meta.json
+{{"run_id": "$RUN_ID", "target_ip": "{target_ip}", "instance_type": "$INSTANCE_TYPE", "load_test": {load_test}}}
+META
+wrk2 -t{threads} -c{connections} -d{duration}s -R{http_rate} --latency http://{target_ip}/ > $RUN_DIR/wrk2.txt
+iperf3 -c {target_ip} -p {iperf3_port} -P {iperf3_streams} -t {duration} -J > $RUN_DIR/iperf3.json
+iperf3 -c {target_ip} -p {iperf3_port} -P {iperf3_streams} -t {duration} -J -R > $RUN_DIR/iperf3-reverse.json
+
+# The regional endpoint resolves to the S3 gateway endpoint of the VPC
+aws s3 cp --recursive --region {region} $RUN_DIR s3://{bucket_name}/$RUN_ID/
+echo "Uploaded s3://{bucket_name}/$RUN_ID/"
+"""
+
+USER_DATA = """#!/usr/bin/bash
+{install}
+cat << 'EOF' > /usr/local/bin/vpn-load-test
+{load_test}
+EOF
+sudo chmod +x /usr/local/bin/vpn-load-test
+sudo vpn-load-test
+"""
+
+
+def render_user_data(
+    load_test: LoadTest, *, target_ip: str, bucket_name: str, region: str
+) -> str:
+    return USER_DATA.format(
+        install=INSTALL,
+        load_test=LOAD_TEST.format(
+            target_ip=target_ip,
+            bucket_name=bucket_name,
+            region=region,
+            load_test=json.dumps(asdict(load_test)),
+            **asdict(load_test),
+        ),
+    )
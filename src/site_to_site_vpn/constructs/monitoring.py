@@ -0,0 +1,71 @@
+import base64
+import gzip
+import re
+from pathlib import Path
+from types import ModuleType
+
+from aws_cdk import Duration, Stack
+import aws_cdk.aws_s3_assets as s3_assets
+
+# The CGW exporter and the latency prober publish their metrics as EMF through
+# the CloudWatch agent, which listens for EMF documents on 127.0.0.1:25888
+CLOUDWATCH_AGENT_INSTALL = """curl -sSo /tmp/amazon-cloudwatch-agent.deb https://amazoncloudwatch-agent.s3.amazonaws.com/ubuntu/$(dpkg --print-architecture)/latest/amazon-cloudwatch-agent.deb
+sudo dpkg -i /tmp/amazon-cloudwatch-agent.deb
+"""
+
+CLOUDWATCH_AGENT_EMF = """cat << EOF > /opt/aws/amazon-cloudwatch-agent/etc/amazon-cloudwatch-agent.json
+{"logs": {"metrics_collected": {"emf": {}}}}
+EOF
+sudo /opt/aws/amazon-cloudwatch-agent/bin/amazon-cloudwatch-agent-ctl -a fetch-config -m ec2 -s -c file:/opt/aws/amazon-cloudwatch-agent/etc/amazon-cloudwatch-agent.json
+"""
+
+# Standalone scripts are embedded gzipped and without their comment lines, user
+# data is limited to 16 KB
+EMBEDDED_SCRIPT = """echo {source} | base64 -d | gunzip | sudo tee {path} > /dev/null
+sudo chmod 755 {path}
+"""
+
+
+def embedded_script(module: ModuleType, *, path: str) -> str:
+    source = re.sub(
+        rb"^[ \t]*#.*\n", b"", Path(str(module.__file__)).read_bytes(), flags=re.M
+    )
+    source = b"#!/usr/bin/python3\n" + source
+    return EMBEDDED_SCRIPT.format(
+        source=base64.b64encode(gzip.compress(source, mtime=0)).decode(), path=path
+    )
+
+
+# Scripts too large for the user data are uploaded as assets. The download is
+# signed by curl with the instance role's credentials from IMDS, so it needs
+# no AWS CLI on the instance. S3 wants the payload hash as a header, which
+# older curl does not add: the hash of the empty GET body.
+ASSET_SCRIPT = """IMDS_TOKEN=$(curl -sX PUT http://169.254.169.254/latest/api/token -H "X-aws-ec2-metadata-token-ttl-seconds: 300")
+CREDENTIALS_URL=http://169.254.169.254/latest/meta-data/iam/security-credentials/
+CREDENTIALS=$(curl -s -H "X-aws-ec2-metadata-token: $IMDS_TOKEN" $CREDENTIALS_URL$(curl -s -H "X-aws-ec2-metadata-token: $IMDS_TOKEN" $CREDENTIALS_URL))
+credential() {{ echo "$CREDENTIALS" | python3 -c "import json, sys; print(json.load(sys.stdin)['$1'])"; }}
+sudo curl -sSf --retry 5 --aws-sigv4 "aws:amz:{region}:s3" --user "$(credential AccessKeyId):$(credential SecretAccessKey)" -H "x-amz-security-token: $(credential Token)" -H "x-amz-content-sha256: e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855" -o {path} https://{bucket}.s3.{region}.amazonaws.com/{key}
+sudo chmod 755 {path}
+"""
+
+
+def asset_script(asset: s3_assets.Asset, *, path: str) -> str:
+    # Installs a script uploaded as an asset, the instance role needs
+    # asset.grant_read
+    return ASSET_SCRIPT.format(
+        region=Stack.of(asset).region,
+        bucket=asset.s3_bucket_name,
+        key=asset.s3_object_key,
+        path=path,
+    )
+
+
+def metric_period(window: int) -> Duration:
+    # Period of the metrics a script publishes once per window. CloudWatch
+    # periods are 10s, 30s or a multiple of 60s, and the scripts publish
+    # windows below 60s as high resolution metrics so they have datapoints.
+    if window not in (10, 30) and window % 60:
+        raise ValueError(
+            f"Metric window must be 10, 30 or a multiple of 60s, got {window}"
+        )
+    return Duration.seconds(window)
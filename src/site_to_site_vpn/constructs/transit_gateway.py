@@ -0,0 +1,63 @@
+import aws_cdk.aws_ec2 as ec2
+from constructs import Construct
+
+from .vpn_connection import DEFAULT_AMAZON_SIDE_ASN
+
+
+class TransitGateway(Construct):
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        *,
+        vpc: ec2.IVpc,
+        amazon_side_asn: int = DEFAULT_AMAZON_SIDE_ASN,
+    ):
+        super().__init__(scope, id)
+        self.vpc = vpc
+        self.amazon_side_asn = amazon_side_asn
+        # With VPN ECMP the transit gateway spreads flows over every VPN tunnel
+        # advertising the datacenter CIDR with the same AS path, across all
+        # VPN connections. A virtual private gateway only ever uses one tunnel.
+        self.transit_gateway = ec2.CfnTransitGateway(
+            self,
+            "TransitGateway",
+            amazon_side_asn=amazon_side_asn,
+            vpn_ecmp_support="enable",
+            default_route_table_association="enable",
+            default_route_table_propagation="enable",
+            auto_accept_shared_attachments="disable",
+            description="Site-to-site VPN with ECMP across customer gateways",
+        )
+        self.transit_gateway_id = self.transit_gateway.ref
+
+        self.attachment = ec2.CfnTransitGatewayVpcAttachment(
+            self,
+            "VpcAttachment",
+            transit_gateway_id=self.transit_gateway_id,
+            vpc_id=vpc.vpc_id,
+            subnet_ids=vpc.select_subnets(
+                subnet_type=ec2.SubnetType.PRIVATE_ISOLATED, one_per_az=True
+            ).subnet_ids,
+        )
+
+    def add_routes_to_tgw(self, destination_cidrs: list[str]):
+        all_subnets = (
+            self.vpc.select_subnets(subnet_type=ec2.SubnetType.PUBLIC).subnets
+            + self.vpc.select_subnets(
+                subnet_type=ec2.SubnetType.PRIVATE_ISOLATED
+            ).subnets
+            + self.vpc.select_subnets(
+                subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS
+            ).subnets
+        )
+        for subnet in all_subnets:
+            for number, destination_cidr in enumerate(destination_cidrs):
+                route = ec2.CfnRoute(
+                    self,
+                    f"{subnet.node.id}DcRoute{number or ''}",
+                    route_table_id=subnet.route_table.route_table_id,
+                    destination_cidr_block=destination_cidr,
+                    transit_gateway_id=self.transit_gateway_id,
+                )
+                route.add_dependency(self.attachment)
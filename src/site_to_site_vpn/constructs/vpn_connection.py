@@ -1,10 +1,31 @@
-import ipaddress
+from enum import Enum
 import aws_cdk.aws_ec2 as ec2
 import aws_cdk.custom_resources as cr
 from aws_cdk import aws_ssm as ssm
-from aws_cdk import CfnOutput, SecretValue
+from aws_cdk import Annotations, CfnOutput, SecretValue, Stack
 from constructs import Construct
 
+from ..inside_cidrs import tunnel_addresses
+from ..ipsec import AES_GCM_128, HITLESS_REKEY, IpsecProposal, RekeyProfile
+from ..routing import RoutePlan
+from ..tunnel_lookup import VPN_CONNECTION_METADATA, context_key
+from .vpn_dashboard import VpnDashboard
+
+DEFAULT_CGW_ASN = 65000
+DEFAULT_AMAZON_SIDE_ASN = 64512
+
+
+class VpnTopology(Enum):
+    # One VPN connection on the VPC's virtual private gateway, static routes
+    VGW = "vgw"
+    # Same, but the CGW and the VGW exchange routes over BGP and the VGW
+    # propagates them into the VPC route tables. A dead tunnel is withdrawn
+    # after the BGP hold time instead of waiting for DPD.
+    VGW_BGP = "vgw-bgp"
+    # One VPN connection per CGW on a transit gateway, BGP with ECMP across all
+    # of them so site bandwidth grows with the number of gateways
+    TGW = "tgw"
+
 
 class VpnConnection(Construct):
     def __init__(
@@ -13,39 +34,154 @@ class VpnConnection(Construct):
         id: str,
         *,
         vpc: ec2.IVpc,
-        datacenter_cidr: str,
+        routes: RoutePlan,
         customer_gateway_public_ip: str,
         tun1_pre_shared_key: str,
         tun1_inner_cidr: str,
+        tun2_pre_shared_key: str | None = None,
+        tun2_inner_cidr: str | None = None,
+        proposal: IpsecProposal = AES_GCM_128,
+        rekey: RekeyProfile = HITLESS_REKEY,
+        transit_gateway_id: str | None = None,
+        bgp_asn: int | None = None,
+        amazon_side_asn: int = DEFAULT_AMAZON_SIDE_ASN,
+        ssm_prefix: str = "/vpn/vpgw",
     ):
         super().__init__(scope, id)
+        for warning in rekey.warnings(proposal):
+            Annotations.of(self).add_warning(warning)
         self.vpc = vpc
-        self.datacenter_cidr = datacenter_cidr
+        self.bgp_asn = bgp_asn
+        self.amazon_side_asn = amazon_side_asn
+        self.ssm_prefix = ssm_prefix
+        self.routes = routes
+        self.tun1_pre_shared_key = tun1_pre_shared_key
+        self.tun2_pre_shared_key = tun2_pre_shared_key
         self.tun1_inner_cidr = tun1_inner_cidr
-        self.vpgw_tun1_link_local_ip, self.cgw_tun1_link_local_ip = self._get_hosts(
+        self.vpgw_tun1_link_local_ip, self.cgw_tun1_link_local_ip = tunnel_addresses(
             self.tun1_inner_cidr
         )
-        # use this instead of add_vpn_connection for dynamic routing via bgp
-        # vpc.enable_vpn_gateway(
-        #    vpn_route_propagation=[
-        #        ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC),
-        #        ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS),
-        #        ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_ISOLATED),
-        #    ],
-        #    type="ipsec.1",
-        # )
+        self.tun2_inner_cidr = tun2_inner_cidr
+        self.vpgw_tun2_link_local_ip = self.cgw_tun2_link_local_ip = None
+        if tun2_pre_shared_key:
+            if not tun2_inner_cidr:
+                raise ValueError("Active-active mode requires tun2_inner_cidr")
+            self.vpgw_tun2_link_local_ip, self.cgw_tun2_link_local_ip = (
+                tunnel_addresses(self.tun2_inner_cidr)
+            )
+        if bgp_asn and not transit_gateway_id:
+            # Dynamic routing: routes learned over BGP are propagated into the
+            # route tables, add_routes_to_vpgw is not needed
+            vpc.enable_vpn_gateway(
+                vpn_route_propagation=[
+                    ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC),
+                    ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS),
+                    ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_ISOLATED),
+                ],
+                type="ipsec.1",
+                amazon_side_asn=amazon_side_asn,
+            )
 
         tun1_secret = SecretValue.unsafe_plain_text(tun1_pre_shared_key)
         tun1 = ec2.VpnTunnelOption(
             pre_shared_key_secret=tun1_secret, tunnel_inside_cidr=self.tun1_inner_cidr
         )
-        self._vpn_connection = self.vpc.add_vpn_connection(
-            "Site2SiteVPN",
-            ip=customer_gateway_public_ip,
-            static_routes=[self.datacenter_cidr],
-            tunnel_options=[tun1],
+        tunnel_options = [tun1]
+        if tun2_pre_shared_key:
+            tun2_secret = SecretValue.unsafe_plain_text(tun2_pre_shared_key)
+            tun2 = ec2.VpnTunnelOption(
+                pre_shared_key_secret=tun2_secret,
+                tunnel_inside_cidr=self.tun2_inner_cidr,
+            )
+            tunnel_options.append(tun2)
+        if transit_gateway_id:
+            # The L2 VpnConnection only attaches to a virtual private gateway
+            if not bgp_asn:
+                raise ValueError("Transit gateway ECMP requires BGP, set bgp_asn")
+            customer_gateway = ec2.CfnCustomerGateway(
+                self,
+                "CustomerGateway",
+                bgp_asn=bgp_asn,
+                ip_address=customer_gateway_public_ip,
+                type="ipsec.1",
+            )
+            self._cfn_vpn_connection = ec2.CfnVPNConnection(
+                self,
+                "Site2SiteVPN",
+                customer_gateway_id=customer_gateway.ref,
+                transit_gateway_id=transit_gateway_id,
+                type="ipsec.1",
+                static_routes_only=False,
+                vpn_tunnel_options_specifications=[
+                    ec2.CfnVPNConnection.VpnTunnelOptionsSpecificationProperty(
+                        pre_shared_key=tunnel.pre_shared_key_secret.unsafe_unwrap(),
+                        tunnel_inside_cidr=tunnel.tunnel_inside_cidr,
+                    )
+                    for tunnel in tunnel_options
+                    if tunnel.pre_shared_key_secret
+                ],
+            )
+            self.vpn_id = self._cfn_vpn_connection.ref
+        else:
+            self._vpn_connection = self.vpc.add_vpn_connection(
+                "Site2SiteVPN",
+                ip=customer_gateway_public_ip,
+                asn=bgp_asn,
+                static_routes=None if bgp_asn else routes.vpn_static_routes,
+                tunnel_options=tunnel_options,
+            )
+            # ec2.VpnTunnelOption only covers the PSK and the inside CIDR, the
+            # proposal and the rekey profile go onto the underlying
+            # AWS::EC2::VPNConnection.
+            self._cfn_vpn_connection: ec2.CfnVPNConnection = (
+                self._vpn_connection.node.default_child  # type: ignore
+            )
+            self.vpn_id = self._vpn_connection.vpn_id
+        for index, _ in enumerate(tunnel_options):
+            for key, value in (proposal.tunnel_options | rekey.tunnel_options).items():
+                self._cfn_vpn_connection.add_property_override(
+                    f"VpnTunnelOptionsSpecifications.{index}.{key}", value
+                )
+
+        # Tunnel outside IPs are assigned by AWS. Once the connection is
+        # deployed, tunnel_lookup.py caches them in cdk.context.json, before
+        # that a custom resource reads them.
+        self.node.add_metadata(
+            VPN_CONNECTION_METADATA,
+            Stack.of(self).get_logical_id(self._cfn_vpn_connection),
+        )
+        tunnels = self.node.try_get_context(context_key(self.node.path))
+        if tunnels:
+            self._use_looked_up_tunnels(tunnels)
+        else:
+            self._fetch_tunnels()
+
+        CfnOutput(self, "VpgwTun1PublicIp", value=self.vpgw_tun1_public_ip)
+        CfnOutput(self, "VpgwTun2PublicIp", value=self.vpgw_tun2_public_ip)
+
+        CfnOutput(
+            self, "VpgwTun1LinkLocalInnerIp", value=self.vpgw_tun1_link_local_inner_ip
+        )
+        CfnOutput(
+            self, "VpgwTun2LinkLocalInnerIp", value=self.vpgw_tun2_link_local_inner_ip
+        )
+
+        # Publish to SSM so EC2/UserData can fetch them at runtime
+        ssm.StringParameter(
+            self,
+            "VpgwTun1PublicIpParam",
+            parameter_name=f"{self.ssm_prefix}/tunnel1/public_ip",
+            string_value=self.vpgw_tun1_public_ip,
         )
 
+        ssm.StringParameter(
+            self,
+            "VpgwTun2PublicIpParam",
+            parameter_name=f"{self.ssm_prefix}/tunnel2/public_ip",
+            string_value=self.vpgw_tun2_public_ip,
+        )
+
+    def _fetch_tunnels(self):
         # Custom resource to fetch tunnel IPs
         provider = cr.AwsCustomResource(
             self,
@@ -54,7 +190,7 @@ class VpnConnection(Construct):
                 service="EC2",
                 action="describeVpnConnections",
                 parameters={
-                    "VpnConnectionIds": [self._vpn_connection.vpn_id],
+                    "VpnConnectionIds": [self.vpn_id],
                 },
                 physical_resource_id=cr.PhysicalResourceId.of("FetchVpnTunnels"),
                 output_paths=[
@@ -85,29 +221,24 @@ class VpnConnection(Construct):
             "VpnConnections.0.Options.TunnelOptions.1.TunnelInsideCidr"
         )
 
-        CfnOutput(self, "VpgwTun1PublicIp", value=self.vpgw_tun1_public_ip)
-        CfnOutput(self, "VpgwTun2PublicIp", value=self.vpgw_tun2_public_ip)
-
-        CfnOutput(
-            self, "VpgwTun1LinkLocalInnerIp", value=self.vpgw_tun1_link_local_inner_ip
-        )
-        CfnOutput(
-            self, "VpgwTun2LinkLocalInnerIp", value=self.vpgw_tun2_link_local_inner_ip
-        )
-
-        # Publish to SSM so EC2/UserData can fetch them at runtime
-        ssm.StringParameter(
-            self,
-            "VpgwTun1PublicIpParam",
-            parameter_name="/vpn/vpgw/tunnel1/public_ip",
-            string_value=self.vpgw_tun1_public_ip,
-        )
-
-        ssm.StringParameter(
-            self,
-            "VpgwTun2PublicIpParam",
-            parameter_name="/vpn/vpgw/tunnel2/public_ip",
-            string_value=self.vpgw_tun2_public_ip,
+    def _use_looked_up_tunnels(self, tunnels: dict):
+        # The inside CIDRs of the configured tunnels are pinned, a mismatch
+        # means the cached tunnels belong to an earlier connection
+        pinned = [self.tun1_inner_cidr]
+        if self.tun2_pre_shared_key:
+            pinned.append(self.tun2_inner_cidr)
+        for number, (cidr, looked_up) in enumerate(
+            zip(pinned, tunnels["inside_cidrs"]), start=1
+        ):
+            if cidr != looked_up:
+                raise ValueError(
+                    f"Tunnel {number} of {tunnels['vpn_connection_id']} uses "
+                    f"{looked_up}, not {cidr}. Rerun python -m "
+                    "site_to_site_vpn.tunnel_lookup after deploying, or --clear it."
+                )
+        self.vpgw_tun1_public_ip, self.vpgw_tun2_public_ip = tunnels["outside_ips"]
+        self.vpgw_tun1_link_local_inner_ip, self.vpgw_tun2_link_local_inner_ip = (
+            tunnels["inside_cidrs"]
         )
 
     def add_routes_to_vpgw(self):
@@ -121,19 +252,25 @@ class VpnConnection(Construct):
             ).subnets
         )
         for subnet in all_subnets:
-            route = ec2.CfnRoute(
-                self,
-                f"{subnet.node.id}DcRoute",
-                route_table_id=subnet.route_table.route_table_id,
-                destination_cidr_block=self.datacenter_cidr,
-                gateway_id=self.vpc.vpn_gateway_id,
-            )
-            route.add_dependency(self._vpn_connection.node.default_child)  # type: ignore
-
-    @staticmethod
-    def _get_hosts(cidr) -> list[str]:
-        network = ipaddress.ip_network(cidr)
-        if not isinstance(network, ipaddress.IPv4Network):
-            raise ValueError(f"Only IPv4 networks are supported, got {network}")
-        hosts = [str(h) for h in network.hosts()]
-        return hosts
+            for number, datacenter_cidr in enumerate(self.routes.vpc_routes):
+                route = ec2.CfnRoute(
+                    self,
+                    f"{subnet.node.id}DcRoute{number or ''}",
+                    route_table_id=subnet.route_table.route_table_id,
+                    destination_cidr_block=datacenter_cidr,
+                    gateway_id=self.vpc.vpn_gateway_id,
+                )
+                route.add_dependency(self._cfn_vpn_connection)
+
+    def add_dashboard(self, dashboard_name: str) -> VpnDashboard:
+        # The CGW exporter publishes under the same VpnId as AWS/VPN
+        tunnel_public_ips = [self.vpgw_tun1_public_ip]
+        if self.tun2_pre_shared_key:
+            tunnel_public_ips.append(self.vpgw_tun2_public_ip)
+        return VpnDashboard(
+            self,
+            "Dashboard",
+            dashboard_name=dashboard_name,
+            vpn_id=self.vpn_id,
+            tunnel_public_ips=tunnel_public_ips,
+        )
@@ -0,0 +1,150 @@
+from aws_cdk import Duration
+import aws_cdk.aws_cloudwatch as cloudwatch
+from constructs import Construct
+
+from ..exporter import NAMESPACE
+
+# AWS/VPN publishes the tunnel metrics every 5 minutes, the CGW exporter every
+# second. Bytes are compared over the AWS period, everything else at 1 minute.
+AWS_PERIOD = Duration.minutes(5)
+CGW_PERIOD = Duration.minutes(1)
+
+
+class VpnDashboard(Construct):
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        *,
+        dashboard_name: str,
+        vpn_id: str,
+        tunnel_public_ips: list[str],
+        namespace: str = NAMESPACE,
+    ):
+        super().__init__(scope, id)
+        self.vpn_id = vpn_id
+        self.namespace = namespace
+
+        widgets: list[cloudwatch.IWidget] = []
+        for number, tunnel_public_ip in enumerate(tunnel_public_ips, start=1):
+            tunnel = f"Tunnel{number}"
+            # The AWS side counts what the CGW's SAs encrypted and vice versa,
+            # a gap between the two lines is traffic lost on the underlay
+            widgets.append(
+                cloudwatch.GraphWidget(
+                    title=f"{tunnel} bytes, AWS vs CGW",
+                    left=[
+                        self._aws_metric("TunnelDataIn", tunnel_public_ip),
+                        self._cgw_metric("EspBytesOut", tunnel, period=AWS_PERIOD),
+                        self._aws_metric("TunnelDataOut", tunnel_public_ip),
+                        self._cgw_metric("EspBytesIn", tunnel, period=AWS_PERIOD),
+                    ],
+                    right=[
+                        self._aws_metric(
+                            "TunnelState", tunnel_public_ip, statistic="Minimum"
+                        )
+                    ],
+                    width=12,
+                )
+            )
+        tunnels = [f"Tunnel{number}" for number in range(1, len(tunnel_public_ips) + 1)]
+        widgets += [
+            cloudwatch.GraphWidget(
+                title="ESP packets per tunnel",
+                left=[
+                    self._cgw_metric(name, tunnel)
+                    for tunnel in tunnels
+                    for name in ("EspPacketsIn", "EspPacketsOut")
+                ],
+                width=12,
+            ),
+            # Rekeys initiated by the VPGW should stay at zero, the CGW rekeys
+            # ahead of it
+            cloudwatch.GraphWidget(
+                title="Rekeys and rekey duration per tunnel",
+                left=[
+                    self._cgw_metric(name, tunnel)
+                    for tunnel in tunnels
+                    for name in ("Rekeys", "PeerRekeys")
+                ],
+                right=[
+                    self._cgw_metric("RekeyDuration", tunnel, statistic="Maximum")
+                    for tunnel in tunnels
+                ],
+                width=12,
+            ),
+            cloudwatch.GraphWidget(
+                title="xfrm errors, replay and integrity drops",
+                left=[
+                    self._cgw_metric(name)
+                    for name in ("XfrmInErrors", "XfrmOutErrors", "XfrmReplayErrors")
+                ]
+                + [
+                    self._cgw_metric(name, tunnel)
+                    for tunnel in tunnels
+                    for name in ("SaReplayErrors", "SaIntegrityErrors")
+                ],
+                width=12,
+            ),
+            cloudwatch.GraphWidget(
+                title="Softirq CPU",
+                left=[
+                    self._cgw_metric("SoftirqCpuPercent", statistic="Average"),
+                    self._cgw_metric("SoftirqMaxCpuPercent", statistic="Maximum"),
+                ],
+                width=12,
+            ),
+            cloudwatch.GraphWidget(
+                title="ENA allowance exceeded",
+                left=[
+                    self._cgw_metric(name)
+                    for name in (
+                        "BwInAllowanceExceeded",
+                        "BwOutAllowanceExceeded",
+                        "PpsAllowanceExceeded",
+                        "ConntrackAllowanceExceeded",
+                        "LinklocalAllowanceExceeded",
+                    )
+                ],
+                width=12,
+            ),
+        ]
+        self.dashboard = cloudwatch.Dashboard(
+            self,
+            "Dashboard",
+            dashboard_name=dashboard_name,
+            widgets=[widgets[index : index + 2] for index in range(0, len(widgets), 2)],
+        )
+
+    @staticmethod
+    def _aws_metric(
+        name: str, tunnel_public_ip: str, *, statistic: str = "Sum"
+    ) -> cloudwatch.Metric:
+        return cloudwatch.Metric(
+            namespace="AWS/VPN",
+            metric_name=name,
+            dimensions_map={"TunnelIpAddress": tunnel_public_ip},
+            statistic=statistic,
+            period=AWS_PERIOD,
+            label=f"AWS {name}",
+        )
+
+    def _cgw_metric(
+        self,
+        name: str,
+        tunnel: str | None = None,
+        *,
+        statistic: str = "Sum",
+        period: Duration = CGW_PERIOD,
+    ) -> cloudwatch.Metric:
+        dimensions = {"VpnId": self.vpn_id}
+        if tunnel:
+            dimensions["Tunnel"] = tunnel
+        return cloudwatch.Metric(
+            namespace=self.namespace,
+            metric_name=name,
+            dimensions_map=dimensions,
+            statistic=statistic,
+            period=period,
+            label=f"{tunnel} {name}" if tunnel else name,
+        )
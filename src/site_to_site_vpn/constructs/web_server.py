@@ -2,18 +2,42 @@ from constructs import Construct
 from .ec2 import Instance
 import aws_cdk.aws_ec2 as ec2
 from .constants import Ubuntu
+from .golden_image import GoldenImage
+from .latency_prober import reflector_user_data
+from ..load_test import LoadTest
+from ..prober import LatencyProbe
 
-
-USER_DATA = """#!/usr/bin/bash
-sudo apt update
+INSTALL = """sudo apt update
 sudo apt -y upgrade
 
 # Install Apache if not already installed
-sudo apt -y install apache2
+sudo apt -y install apache2 iperf3
+"""
 
+USER_DATA = """#!/usr/bin/bash
+{install}
 # Start and enable Apache
 sudo systemctl start apache2
 sudo systemctl enable apache2
+{services}"""
+
+# Receives the TCP throughput runs of the dc-client load generator
+IPERF3_SERVER = """
+cat << EOF > /etc/systemd/system/iperf3-server.service
+[Unit]
+Description=iperf3 server for VPN load tests
+After=network-online.target
+
+[Service]
+ExecStart=/usr/bin/iperf3 --server --port {port}
+DynamicUser=yes
+Restart=always
+
+[Install]
+WantedBy=multi-user.target
+EOF
+sudo systemctl daemon-reload
+sudo systemctl enable --now iperf3-server
 """
 
 
@@ -26,6 +50,9 @@ class WebServer(Construct):
         vpc: ec2.IVpc,
         subnet: ec2.ISubnet,
         access_from_cidr: str,
+        golden_image: GoldenImage | None = None,
+        load_test: LoadTest | None = None,
+        probe: LatencyProbe | None = None,
     ):
         super().__init__(scope, id)
         self.instance = Instance(
@@ -36,12 +63,29 @@ class WebServer(Construct):
             subnet=subnet,
             instance_type="m7a.xlarge",
             ami_id=Ubuntu.X86.value,
-            user_data=USER_DATA,
+            user_data=USER_DATA.format(
+                install="" if golden_image else INSTALL,
+                services=(
+                    IPERF3_SERVER.format(port=load_test.iperf3_port)
+                    if load_test
+                    else ""
+                ),
+            ),
+            golden_image=golden_image,
         )
         # TODO: add option to provide port as arg
         self.instance.security_group.add_ingress_rule(
             peer=ec2.Peer.ipv4(access_from_cidr),
             connection=ec2.Port.tcp(80),  # default port of apache httpd
         )
+        if load_test:
+            self.instance.security_group.add_ingress_rule(
+                peer=ec2.Peer.ipv4(access_from_cidr),
+                connection=ec2.Port.tcp(load_test.iperf3_port),
+                description="Allow iperf3 load tests",
+            )
         self.instance.allow_ssh_from_local()
         self.instance.allow_ping_from(access_from_cidr)
+        if probe:
+            self.instance.allow_probes_from(access_from_cidr, probe.port)
+            self.instance.add_user_data(reflector_user_data(probe))
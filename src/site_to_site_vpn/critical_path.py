@@ -0,0 +1,543 @@
+import argparse
+from dataclasses import dataclass
+import heapq
+import json
+from pathlib import Path
+import re
+from typing import Mapping
+
+# Rough CloudFormation create times in seconds, as seen in stack events. They
+# vary by region and load, pass --durations to use measured ones.
+CREATE_SECONDS: dict[str, float] = {
+    "AWS::CloudWatch::Alarm": 5,
+    "AWS::CloudWatch::Dashboard": 5,
+    "AWS::EC2::CustomerGateway": 10,
+    "AWS::EC2::EIP": 10,
+    "AWS::EC2::EIPAssociation": 15,
+    "AWS::EC2::Instance": 60,
+    "AWS::EC2::InternetGateway": 20,
+    "AWS::EC2::KeyPair": 5,
+    "AWS::EC2::NatGateway": 120,
+    "AWS::EC2::PlacementGroup": 5,
+    "AWS::EC2::Route": 5,
+    "AWS::EC2::RouteTable": 5,
+    "AWS::EC2::SecurityGroup": 10,
+    "AWS::EC2::Subnet": 10,
+    "AWS::EC2::SubnetRouteTableAssociation": 5,
+    "AWS::EC2::TransitGateway": 300,
+    "AWS::EC2::TransitGatewayVpcAttachment": 180,
+    "AWS::EC2::VPC": 20,
+    "AWS::EC2::VPCEndpoint": 30,
+    "AWS::EC2::VPCGatewayAttachment": 30,
+    "AWS::EC2::VPNConnection": 420,
+    "AWS::EC2::VPNConnectionRoute": 10,
+    "AWS::EC2::VPNGateway": 60,
+    "AWS::EC2::VPNGatewayRoutePropagation": 10,
+    "AWS::IAM::InstanceProfile": 120,
+    "AWS::IAM::Policy": 20,
+    "AWS::IAM::Role": 20,
+    "AWS::ImageBuilder::Component": 10,
+    "AWS::ImageBuilder::Image": 1800,
+    "AWS::ImageBuilder::ImageRecipe": 10,
+    "AWS::ImageBuilder::InfrastructureConfiguration": 10,
+    "AWS::Lambda::Function": 15,
+    "AWS::Logs::LogGroup": 5,
+    "AWS::S3::Bucket": 20,
+    "AWS::S3::BucketPolicy": 5,
+    "AWS::SSM::Parameter": 5,
+    # AwsCustomResource: a Lambda invocation making one SDK call
+    "Custom::AWS": 30,
+}
+DEFAULT_CREATE_SECONDS = 10
+# Change set creation and execution, paid by every stack before its resources
+STACK_OVERHEAD_SECONDS = 30
+# Splits saving less than this are not worth another stack
+DEFAULT_MIN_SAVING = 60
+
+SUB_VARIABLE = re.compile(r"\$\{(?!!)([^}]+)\}")
+
+# (stack, logical id)
+ResourceKey = tuple[str, str]
+
+
+@dataclass(frozen=True)
+class Resource:
+    stack: str
+    logical_id: str
+    type: str
+    # Construct path within the stack, the logical id when unknown
+    path: str
+    seconds: float
+
+
+@dataclass(frozen=True)
+class DeployGraph:
+    # Stacks in manifest order
+    stacks: tuple[str, ...]
+    resources: dict[ResourceKey, Resource]
+    # What every resource waits for: references and DependsOn within its
+    # stack, the resources behind its Fn::ImportValue in other stacks
+    needs: dict[ResourceKey, frozenset[ResourceKey]]
+    # Stack dependencies without an import (Stack.add_dependency), which
+    # only order the deploy
+    explicit: dict[str, frozenset[str]]
+
+
+@dataclass(frozen=True)
+class Schedule:
+    stack_of: dict[ResourceKey, str]
+    members: dict[str, list[ResourceKey]]
+    depends_on: dict[str, set[str]]
+    start: dict[str, float]
+    finish: dict[str, float]
+    resource_start: dict[ResourceKey, float]
+    resource_finish: dict[ResourceKey, float]
+
+    @property
+    def seconds(self) -> float:
+        return max(self.finish.values(), default=0.0)
+
+
+@dataclass(frozen=True)
+class Step:
+    resource: Resource
+    stack: str
+    start: float
+    finish: float
+
+
+@dataclass(frozen=True)
+class Split:
+    # Move `moved` out of `stack` into `new_stack`, which depends on
+    # `depends_on` only
+    stack: str
+    new_stack: str
+    moved: tuple[Resource, ...]
+    depends_on: tuple[str, ...]
+    reason: str
+    seconds: float
+    saving: float
+
+
+def load_assembly(
+    assembly: Path, *, create_seconds: Mapping[str, float] = CREATE_SECONDS
+) -> DeployGraph:
+    manifest = json.loads((assembly / "manifest.json").read_text())
+    artifacts = {
+        name: artifact
+        for name, artifact in manifest["artifacts"].items()
+        if artifact["type"] == "aws:cloudformation:stack"
+    }
+    templates = {
+        name: json.loads(
+            (assembly / artifact["properties"]["templateFile"]).read_text()
+        )
+        for name, artifact in artifacts.items()
+    }
+
+    exports: dict[str, set[ResourceKey]] = {}
+    for name, template in templates.items():
+        for output in template.get("Outputs", {}).values():
+            export = output.get("Export", {}).get("Name")
+            if isinstance(export, str):
+                refs, _ = _references(output["Value"])
+                exports[export] = {
+                    (name, ref) for ref in refs if ref in template["Resources"]
+                }
+
+    resources: dict[ResourceKey, Resource] = {}
+    needs: dict[ResourceKey, frozenset[ResourceKey]] = {}
+    explicit: dict[str, frozenset[str]] = {}
+    for name, template in templates.items():
+        paths = _construct_paths(assembly, name, artifacts[name])
+        imported_stacks = set()
+        for logical_id, resource in template.get("Resources", {}).items():
+            key = (name, logical_id)
+            resources[key] = Resource(
+                stack=name,
+                logical_id=logical_id,
+                type=resource["Type"],
+                path=paths.get(logical_id, logical_id),
+                seconds=create_seconds.get(resource["Type"], DEFAULT_CREATE_SECONDS),
+            )
+            refs, imports = _references(resource.get("Properties", {}))
+            depends_on = resource.get("DependsOn", [])
+            refs.update([depends_on] if isinstance(depends_on, str) else depends_on)
+            resource_needs = {
+                (name, ref)
+                for ref in refs
+                if ref in template["Resources"] and ref != logical_id
+            }
+            for export in imports:
+                # Imports from outside the assembly are already deployed
+                resource_needs |= exports.get(export, set())
+            imported_stacks |= {stack for stack, _ in resource_needs} - {name}
+            needs[key] = frozenset(resource_needs)
+        explicit[name] = frozenset(
+            (set(artifacts[name].get("dependencies", [])) & artifacts.keys())
+            - imported_stacks
+        )
+    return DeployGraph(
+        stacks=tuple(artifacts),
+        resources=resources,
+        needs=needs,
+        explicit=explicit,
+    )
+
+
+def stack_metadata(assembly: Path, artifact: dict) -> dict[str, list[dict]]:
+    # Construct metadata by construct path, inline in the manifest or in a
+    # file next to it
+    metadata = dict(artifact.get("metadata", {}))
+    if "additionalMetadataFile" in artifact:
+        metadata |= json.loads(
+            (assembly / artifact["additionalMetadataFile"]).read_text()
+        )
+    return metadata
+
+
+def schedule(
+    graph: DeployGraph,
+    *,
+    stack_of: Mapping[ResourceKey, str] | None = None,
+    concurrency: int | None = None,
+) -> Schedule:
+    # cdk deploy starts a stack once all the stacks it depends on are
+    # deployed, at most `concurrency` at a time. Within a stack CloudFormation
+    # creates every resource as soon as the resources it needs exist.
+    stack_of = dict(stack_of or {key: key[0] for key in graph.resources})
+    members: dict[str, list[ResourceKey]] = {stack: [] for stack in graph.stacks}
+    for key, stack in stack_of.items():
+        members.setdefault(stack, []).append(key)
+    depends_on: dict[str, set[str]] = {stack: set() for stack in members}
+    for key, needs in graph.needs.items():
+        for need in needs:
+            if stack_of[need] != stack_of[key]:
+                depends_on[stack_of[key]].add(stack_of[need])
+    for stack, explicit in graph.explicit.items():
+        depends_on[stack] |= explicit
+
+    # Offsets from the start of the resource's stack
+    finish_offset: dict[ResourceKey, float] = {}
+
+    def offset(key: ResourceKey) -> float:
+        if key not in finish_offset:
+            start = max(
+                (
+                    offset(need)
+                    for need in graph.needs[key]
+                    if stack_of[need] == stack_of[key]
+                ),
+                default=STACK_OVERHEAD_SECONDS,
+            )
+            finish_offset[key] = start + graph.resources[key].seconds
+        return finish_offset[key]
+
+    duration = {
+        stack: max((offset(key) for key in keys), default=float(STACK_OVERHEAD_SECONDS))
+        for stack, keys in members.items()
+    }
+
+    start: dict[str, float] = {}
+    finish: dict[str, float] = {}
+    pending = list(members)
+    running: list[tuple[float, str]] = []
+    deployed: set[str] = set()
+    now = 0.0
+    while pending or running:
+        for stack in [stack for stack in pending if depends_on[stack] <= deployed]:
+            if concurrency and len(running) >= concurrency:
+                break
+            pending.remove(stack)
+            start[stack] = now
+            finish[stack] = now + duration[stack]
+            heapq.heappush(running, (finish[stack], stack))
+        if not running:
+            raise ValueError(f"Stack dependency cycle between {', '.join(pending)}")
+        now, stack = heapq.heappop(running)
+        deployed.add(stack)
+
+    resource_finish = {
+        key: start[stack_of[key]] + finish_offset[key] for key in graph.resources
+    }
+    return Schedule(
+        stack_of=stack_of,
+        members=members,
+        depends_on=depends_on,
+        start=start,
+        finish=finish,
+        resource_start={
+            key: at - graph.resources[key].seconds
+            for key, at in resource_finish.items()
+        },
+        resource_finish=resource_finish,
+    )
+
+
+def unbounded_seconds(graph: DeployGraph) -> float:
+    # Lower bound: every resource starts as soon as the resources it needs
+    # exist, as if there were a single stack
+    finish: dict[ResourceKey, float] = {}
+
+    def at(key: ResourceKey) -> float:
+        if key not in finish:
+            finish[key] = (
+                max(
+                    (at(need) for need in graph.needs[key]),
+                    default=STACK_OVERHEAD_SECONDS,
+                )
+                + graph.resources[key].seconds
+            )
+        return finish[key]
+
+    return max((at(key) for key in graph.resources), default=0.0)
+
+
+def critical_path(graph: DeployGraph, plan: Schedule) -> list[Step]:
+    # Walk back from the last resource to finish, through whatever it waited
+    # for: a resource of its stack, else the stack that finished when its
+    # stack started, a dependency or, with limited concurrency, the stack
+    # freeing the deploy slot
+    steps: list[Step] = []
+    stack: str | None = max(plan.finish, key=plan.finish.__getitem__, default=None)
+    while stack:
+        if not plan.members[stack]:
+            break
+        key = max(plan.members[stack], key=plan.resource_finish.__getitem__)
+        while key:
+            steps.append(
+                Step(
+                    resource=graph.resources[key],
+                    stack=stack,
+                    start=plan.resource_start[key],
+                    finish=plan.resource_finish[key],
+                )
+            )
+            key = max(
+                (
+                    need
+                    for need in graph.needs[key]
+                    if plan.stack_of[need] == stack
+                    and plan.resource_finish[need] >= plan.resource_start[key]
+                ),
+                key=plan.resource_finish.__getitem__,
+                default=None,
+            )
+        waited = {
+            other
+            for other, finish in plan.finish.items()
+            if finish == plan.start[stack] and other != stack
+        }
+        stack = min(waited & plan.depends_on[stack] or waited, default=None)
+    return steps[::-1]
+
+
+def suggest_splits(
+    graph: DeployGraph,
+    *,
+    concurrency: int | None = None,
+    min_saving: float = DEFAULT_MIN_SAVING,
+) -> list[Split]:
+    # Two kinds of candidates per stack dependency:
+    # - the resources of a stack that need nothing from the stack it waits for
+    #   longest, moved to a stack that can deploy alongside it
+    # - the resources a consumer imports from a stack, with what they need,
+    #   moved out so the consumer no longer waits for the rest of it
+    # Every candidate is scheduled on its own and kept if it saves enough.
+    base = schedule(graph, concurrency=concurrency)
+    candidates: dict[tuple[str, frozenset[ResourceKey]], tuple[str, str]] = {}
+    for stack in graph.stacks:
+        members = set(base.members[stack])
+        if not base.depends_on[stack]:
+            continue
+        gate = max(base.depends_on[stack], key=base.finish.__getitem__)
+        late = {
+            key
+            for key in members
+            if any(base.stack_of[need] == gate for need in graph.needs[key])
+        }
+        early = frozenset(
+            key for key in members if not _upstream(graph, base.stack_of, {key}) & late
+        )
+        if early and early != members:
+            candidates[(stack, early)] = (
+                f"{stack}-early",
+                f"they do not wait for {gate}",
+            )
+        for producer in base.depends_on[stack]:
+            imported = {
+                need
+                for key in members
+                for need in graph.needs[key]
+                if base.stack_of[need] == producer
+            }
+            needed = frozenset(_upstream(graph, base.stack_of, imported))
+            if needed and needed != set(base.members[producer]):
+                candidates[(producer, needed)] = (
+                    f"{producer}-core",
+                    f"{stack} does not wait for the rest of {producer}",
+                )
+
+    splits = []
+    for (stack, moved), (new_stack, reason) in candidates.items():
+        stack_of = dict(base.stack_of)
+        for key in moved:
+            stack_of[key] = new_stack
+        plan = schedule(graph, stack_of=stack_of, concurrency=concurrency)
+        saving = base.seconds - plan.seconds
+        if saving >= min_saving:
+            splits.append(
+                Split(
+                    stack=stack,
+                    new_stack=new_stack,
+                    moved=tuple(
+                        graph.resources[key]
+                        for key in sorted(moved, key=plan.resource_start.__getitem__)
+                    ),
+                    depends_on=tuple(sorted(plan.depends_on[new_stack])),
+                    reason=reason,
+                    seconds=plan.seconds,
+                    saving=saving,
+                )
+            )
+    return sorted(splits, key=lambda split: -split.saving)
+
+
+def _references(value) -> tuple[set[str], set[str]]:
+    # Logical ids referenced by Ref, Fn::GetAtt and Fn::Sub, and the export
+    # names of Fn::ImportValue
+    refs: set[str] = set()
+    imports: set[str] = set()
+
+    def walk(value):
+        if isinstance(value, dict):
+            for function, argument in value.items():
+                if function == "Ref" and isinstance(argument, str):
+                    refs.add(argument)
+                elif function == "Fn::GetAtt":
+                    target = argument[0] if isinstance(argument, list) else argument
+                    refs.add(target.split(".")[0])
+                elif function == "Fn::Sub":
+                    text = argument[0] if isinstance(argument, list) else argument
+                    refs.update(
+                        name.split(".")[0] for name in SUB_VARIABLE.findall(text)
+                    )
+                elif function == "Fn::ImportValue" and isinstance(argument, str):
+                    imports.add(argument)
+                walk(argument)
+        elif isinstance(value, list):
+            for item in value:
+                walk(item)
+
+    walk(value)
+    return refs, imports
+
+
+def _construct_paths(assembly: Path, stack: str, artifact: dict) -> dict[str, str]:
+    paths = {}
+    for path, entries in stack_metadata(assembly, artifact).items():
+        for entry in entries:
+            if entry["type"] == "aws:cdk:logicalId":
+                path = path.removeprefix(f"/{stack}/")
+                paths[entry["data"]] = re.sub(r"/(Resource|Default)$", "", path)
+    return paths
+
+
+def _upstream(
+    graph: DeployGraph, stack_of: Mapping[ResourceKey, str], keys: set[ResourceKey]
+) -> set[ResourceKey]:
+    # keys and the resources of their stacks they need, transitively
+    found = set(keys)
+    todo = list(keys)
+    while todo:
+        key = todo.pop()
+        for need in graph.needs[key]:
+            if stack_of[need] == stack_of[key] and need not in found:
+                found.add(need)
+                todo.append(need)
+    return found
+
+
+def _names(resources: tuple[Resource, ...], limit: int = 6) -> str:
+    names = [resource.path for resource in resources[:limit]]
+    if len(resources) > limit:
+        names.append(f"{len(resources) - limit} more")
+    return ", ".join(names)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description="Estimate the deploy critical path of a cloud assembly and "
+        "suggest stack splits that shorten it"
+    )
+    parser.add_argument("assembly", type=Path, nargs="?", default=Path("cdk.out"))
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        help="cdk deploy --concurrency, unlimited by default",
+    )
+    parser.add_argument(
+        "--durations",
+        type=Path,
+        help="JSON object of create seconds per resource type",
+    )
+    parser.add_argument(
+        "--min-saving",
+        type=float,
+        default=DEFAULT_MIN_SAVING,
+        help="seconds a split must save to be suggested",
+    )
+    args = parser.parse_args(argv)
+
+    create_seconds = CREATE_SECONDS
+    if args.durations:
+        create_seconds = CREATE_SECONDS | json.loads(args.durations.read_text())
+    graph = load_assembly(args.assembly, create_seconds=create_seconds)
+    plan = schedule(graph, concurrency=args.concurrency)
+    one_at_a_time = schedule(graph, concurrency=1)
+    print(
+        f"Estimated deploy: {plan.seconds:.0f} s with --concurrency "
+        f"{args.concurrency or len(graph.stacks)}, {one_at_a_time.seconds:.0f} s "
+        f"one stack at a time, {unbounded_seconds(graph):.0f} s without stack "
+        "boundaries"
+    )
+    print(f"\n{'start':>6} {'end':>6}  critical path")
+    stack = None
+    for step in critical_path(graph, plan):
+        if step.stack != stack:
+            stack = step.stack
+            ready = max(
+                (plan.finish[dependency] for dependency in plan.depends_on[stack]),
+                default=0.0,
+            )
+            waits = ", waited for a deploy slot" if plan.start[stack] > ready else ""
+            print(f"{plan.start[stack]:>6.0f} {'':>6}  {stack} (stack{waits})")
+        print(
+            f"{step.start:>6.0f} {step.finish:>6.0f}    {step.resource.path} "
+            f"({step.resource.type})"
+        )
+
+    for stack in graph.stacks:
+        if graph.explicit[stack]:
+            print(
+                f"\n{stack} depends on {', '.join(sorted(graph.explicit[stack]))} "
+                "without importing from it, this only serializes the deploy"
+            )
+
+    splits = suggest_splits(
+        graph, concurrency=args.concurrency, min_saving=args.min_saving
+    )
+    if splits:
+        print("\nStack splits (CloudFormation only sees references: check that")
+        print("the moved resources do not need the rest at runtime, e.g. routes)")
+    for split in splits:
+        print(
+            f"-{split.saving:.0f} s: move {len(split.moved)} resource(s) of "
+            f"{split.stack} into {split.new_stack}, depending on "
+            f"{', '.join(split.depends_on) or 'no stack'}, so {split.reason}: "
+            f"{_names(split.moved)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
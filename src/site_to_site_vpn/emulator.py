@@ -0,0 +1,454 @@
+import argparse
+from dataclasses import asdict, dataclass
+from itertools import product
+import json
+import os
+from pathlib import Path
+import re
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from .constructs.customer_gateway import (
+    SWANCTL_START,
+    IpsecBackend,
+    render_user_data,
+)
+from .ipsec import HITLESS_REKEY, PROPOSALS, IpsecProposal, RekeyProfile
+from .load_test import parse_iperf3
+from .mtu import DEFAULT_UNDERLAY_MTU, tunnel_mtu
+from .routing import RoutePlan
+from .tuning import FORWARDING, NetworkTuningProfile
+
+# Emulates the deployment on one box: client -- CGW -- VPGW -- server, each in
+# its own network namespace. The CGW runs the rendered user data, a policy based
+# strongSwan responder stands in for the VPGW.
+DC_NAMESPACE = "s2s-dc"
+CGW_NAMESPACE = "s2s-cgw"
+VPGW_NAMESPACE = "s2s-vpgw"
+VPC_NAMESPACE = "s2s-vpc"
+NAMESPACES = (DC_NAMESPACE, CGW_NAMESPACE, VPGW_NAMESPACE, VPC_NAMESPACE)
+
+DC_CIDR = "10.0.0.0/16"
+VPC_CIDR = "10.1.0.0/16"
+CLIENT_IP = "10.0.1.10"
+CGW_LAN_IP = "10.0.1.1"
+SERVER_IP = "10.1.1.10"
+VPGW_LAN_IP = "10.1.1.1"
+# TEST-NET-2 stands in for the EIP of the CGW and the VPGW tunnel endpoint
+CGW_WAN_IP = "198.51.100.1"
+VPGW_WAN_IP = "198.51.100.2"
+PRE_SHARED_KEY = "emulator.pre_shared.key"
+
+TUNING_PROFILES = {
+    "none": None,
+    "forwarding": FORWARDING,
+    "no-offload": NetworkTuningProfile(gro=False, gso=False),
+}
+
+BACKENDS = {backend.name.lower(): backend for backend in IpsecBackend}
+
+# Replaces the IMDS lookups of the user data
+METADATA = """sudo() {{ "$@"; }}
+CGW_PRIVATE_IP={cgw_ip}
+CGW_PUBLIC_IP={cgw_ip}
+PRIMARY_INTERFACE=wan0
+"""
+
+# Daemons are started directly inside the namespace, systemctl would act on the
+# host. SWANCTL runs charon-systemd itself so its charon-systemd settings
+# (install_routes, make_before_break, rekey log) are the ones measured, and
+# pcrypt registration and RPS are kept, they are part of what SWANCTL is
+# measured for.
+STARTER_EMULATED_START = """ipsec start"""
+
+SWANCTL_EMULATED_START = """charon-systemd > /run/charon-systemd.log 2>&1 &
+for attempt in $(seq 50); do
+  [ -S /run/charon.vici ] && break
+  sleep 0.2
+done
+swanctl --load-all"""
+
+# Interface level steps of the tuning profile; RSS queues and IRQ affinity are
+# properties of the ENA device and not emulated
+TUNING = """{sysctls}sysctl -p /etc/sysctl.d/60-network-tuning.conf
+ethtool -K wan0 gro {gro} gso {gso}
+"""
+
+# AWS endpoints are behind no NAT, but the CGW is: forceencaps reproduces the
+# NAT-T overhead the tunnel MTU is sized for. Lifetimes and rekey margins are
+# the tunnel options of the rekey profile.
+VPGW_CONFIG = """#!/usr/bin/bash
+sysctl -w net.ipv4.ip_forward=1
+cat << EOF > /etc/ipsec.conf
+config setup
+        uniqueids=yes
+
+conn vpgw
+        type=tunnel
+        keyexchange=ikev2
+        authby=psk
+        left={vpgw_ip}
+        leftsubnet={vpc_cidr}
+        right={cgw_ip}
+        rightsubnet={dc_cidr}
+        ike={ike}
+        esp={esp}
+        ikelifetime={phase1_lifetime}s
+        lifetime={phase2_lifetime}s
+        margintime={margin}s
+        rekeyfuzz={fuzz}%
+        forceencaps=yes
+        auto=add
+EOF
+echo '{vpgw_ip} {cgw_ip} : PSK "{pre_shared_key}"' > /etc/ipsec.secrets
+ipsec start
+"""
+
+# Keeps /etc, /run and /usr/local/sbin writes of the scripts inside the
+# namespace. Daemons started by the script stay in this mount namespace, and
+# log to a file so they do not hold on to the pipe of the caller.
+ISOLATED = """mount -t overlay overlay -o lowerdir=/etc,upperdir={root}/etc,workdir={root}/work /etc
+mount -t tmpfs tmpfs /run
+mount -t tmpfs tmpfs /usr/local/sbin
+bash {root}/script.sh > {root}/script.log 2>&1
+"""
+
+REQUIRED_TOOLS = ("ip", "unshare", "iperf3", "ping", "ethtool", "iptables")
+BACKEND_TOOLS = {
+    IpsecBackend.STARTER: ("ipsec",),
+    IpsecBackend.SWANCTL: ("charon-systemd", "swanctl"),
+}
+
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    proposal: str
+    underlay_mtu: int
+    tuning: str
+    backend: str
+    tunnel_mtu: int
+    gbps: float
+    pps: int
+    retransmits: int
+    rtt_p50_ms: float
+    rtt_p99_ms: float
+
+    @property
+    def key(self) -> tuple:
+        return (self.proposal, self.underlay_mtu, self.tuning, self.backend)
+
+
+def render_cgw_script(
+    proposal: IpsecProposal,
+    *,
+    underlay_mtu: int = DEFAULT_UNDERLAY_MTU,
+    backend: IpsecBackend = IpsecBackend.STARTER,
+    tuning_profile: NetworkTuningProfile | None = None,
+) -> str:
+    if backend is IpsecBackend.SWANCTL:
+        start = SWANCTL_START.format(
+            kernel_aeads=" ".join(map(shlex.quote, proposal.kernel_aeads))
+        ).replace("sudo systemctl restart strongswan", SWANCTL_EMULATED_START)
+    else:
+        start = STARTER_EMULATED_START
+    script = render_user_data(
+        [
+            dict(
+                number=1,
+                mark=100,
+                vpgw_public_ip=VPGW_WAN_IP,
+                pre_shared_key=PRE_SHARED_KEY,
+                cgw_link_local_inner_ip="169.254.88.82",
+                vpgw_link_local_inner_ip="169.254.88.81",
+            )
+        ],
+        routes=RoutePlan(site_cidrs=(DC_CIDR,), vpc_cidrs=(VPC_CIDR,)),
+        proposal=proposal,
+        underlay_mtu=underlay_mtu,
+        backend=backend,
+        install=False,
+        metadata=METADATA.format(cgw_ip=CGW_WAN_IP),
+        start=start,
+    )
+    if tuning_profile:
+        script += TUNING.format(
+            sysctls=tuning_profile.sysctls,
+            gro="on" if tuning_profile.gro else "off",
+            gso="on" if tuning_profile.gso else "off",
+        )
+    return script
+
+
+def render_vpgw_script(
+    proposal: IpsecProposal, rekey: RekeyProfile = HITLESS_REKEY
+) -> str:
+    return VPGW_CONFIG.format(
+        vpgw_ip=VPGW_WAN_IP,
+        cgw_ip=CGW_WAN_IP,
+        vpc_cidr=VPC_CIDR,
+        dc_cidr=DC_CIDR,
+        ike=proposal.ike,
+        esp=proposal.esp,
+        phase1_lifetime=rekey.phase1_lifetime,
+        phase2_lifetime=rekey.phase2_lifetime,
+        margin=rekey.margin,
+        fuzz=rekey.fuzz,
+        pre_shared_key=PRE_SHARED_KEY,
+    )
+
+
+def parse_ping(output: str) -> list[float]:
+    return [float(rtt) for rtt in re.findall(r"time=([\d.]+) ms", output)]
+
+
+def parse_link_packets(output: str) -> int:
+    # `ip -s -j link show` of one interface, packets in both directions
+    stats = json.loads(output)[0]["stats64"]
+    return stats["rx"]["packets"] + stats["tx"]["packets"]
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def regressions(
+    results: list[BenchmarkResult],
+    baseline: list[BenchmarkResult],
+    *,
+    tolerance: float,
+) -> list[str]:
+    previous = {result.key: result for result in baseline}
+    messages = []
+    for result in results:
+        before = previous.get(result.key)
+        if before and result.gbps < before.gbps * (1 - tolerance):
+            messages.append(
+                f"{'/'.join(map(str, result.key))}: "
+                f"{before.gbps:.2f} -> {result.gbps:.2f} Gbps"
+            )
+    return messages
+
+
+def _run(*args: str, namespace: str | None = None, check: bool = True) -> str:
+    command = ["ip", "netns", "exec", namespace, *args] if namespace else list(args)
+    return subprocess.run(command, check=check, capture_output=True, text=True).stdout
+
+
+def _run_isolated(namespace: str, script: str, root: Path):
+    (root / "etc").mkdir(parents=True)
+    (root / "work").mkdir()
+    (root / "script.sh").write_text(script)
+    _run(
+        "unshare",
+        "--mount",
+        "--propagation",
+        "private",
+        "bash",
+        "-c",
+        ISOLATED.format(root=root),
+        namespace=namespace,
+    )
+
+
+def _create_topology(underlay_mtu: int):
+    for namespace in NAMESPACES:
+        _run("ip", "netns", "add", namespace)
+        _run("ip", "link", "set", "lo", "up", namespace=namespace)
+    links = (
+        (DC_NAMESPACE, "dc0", CGW_NAMESPACE, "lan0"),
+        (CGW_NAMESPACE, "wan0", VPGW_NAMESPACE, "wan0"),
+        (VPGW_NAMESPACE, "lan0", VPC_NAMESPACE, "vpc0"),
+    )
+    for namespace, name, peer_namespace, peer_name in links:
+        _run(
+            *("ip", "link", "add", name, "netns", namespace, "type", "veth"),
+            *("peer", "name", peer_name, "netns", peer_namespace),
+        )
+    addresses = (
+        (DC_NAMESPACE, "dc0", f"{CLIENT_IP}/24"),
+        (CGW_NAMESPACE, "lan0", f"{CGW_LAN_IP}/24"),
+        (CGW_NAMESPACE, "wan0", f"{CGW_WAN_IP}/24"),
+        (VPGW_NAMESPACE, "wan0", f"{VPGW_WAN_IP}/24"),
+        (VPGW_NAMESPACE, "lan0", f"{VPGW_LAN_IP}/24"),
+        (VPC_NAMESPACE, "vpc0", f"{SERVER_IP}/24"),
+    )
+    for namespace, device, address in addresses:
+        _run("ip", "addr", "add", address, "dev", device, namespace=namespace)
+        mtu = underlay_mtu if device == "wan0" else DEFAULT_UNDERLAY_MTU
+        _run("ip", "link", "set", device, "up", "mtu", str(mtu), namespace=namespace)
+    _run("ip", "route", "add", "default", "via", CGW_LAN_IP, namespace=DC_NAMESPACE)
+    _run("ip", "route", "add", "default", "via", VPGW_LAN_IP, namespace=VPC_NAMESPACE)
+
+
+def _destroy_topology():
+    for namespace in NAMESPACES:
+        for pid in _run("ip", "netns", "pids", namespace, check=False).split():
+            try:
+                os.kill(int(pid), signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        _run("ip", "netns", "del", namespace, check=False)
+
+
+def _wait_for_tunnel(timeout: float = 30):
+    # One inbound and one outbound ESP SA once the CHILD_SA is up
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        states = _run("ip", "xfrm", "state", namespace=CGW_NAMESPACE)
+        if states.count("proto esp") >= 2:
+            return
+        time.sleep(0.5)
+    raise RuntimeError("The emulated tunnel did not come up")
+
+
+def benchmark(
+    proposal_name: str,
+    *,
+    underlay_mtu: int,
+    tuning: str,
+    backend_name: str,
+    duration: int,
+    streams: int,
+) -> BenchmarkResult:
+    proposal = PROPOSALS[proposal_name]
+    _destroy_topology()
+    with tempfile.TemporaryDirectory(prefix="s2s-emulator-") as root:
+        try:
+            _create_topology(underlay_mtu)
+            _run_isolated(
+                VPGW_NAMESPACE, render_vpgw_script(proposal), Path(root) / "vpgw"
+            )
+            _run_isolated(
+                CGW_NAMESPACE,
+                render_cgw_script(
+                    proposal,
+                    underlay_mtu=underlay_mtu,
+                    backend=BACKENDS[backend_name],
+                    tuning_profile=TUNING_PROFILES[tuning],
+                ),
+                Path(root) / "cgw",
+            )
+            _wait_for_tunnel()
+            _run("iperf3", "--server", "--daemon", namespace=VPC_NAMESPACE)
+            time.sleep(1)
+
+            link = ("ip", "-s", "-j", "link", "show", "Tunnel1")
+            before = parse_link_packets(_run(*link, namespace=CGW_NAMESPACE))
+            gbps, retransmits = parse_iperf3(
+                _run(
+                    *("iperf3", "--client", SERVER_IP, "--json"),
+                    *("--time", str(duration), "--parallel", str(streams)),
+                    namespace=DC_NAMESPACE,
+                )
+            )
+            after = parse_link_packets(_run(*link, namespace=CGW_NAMESPACE))
+            rtts = parse_ping(
+                _run(
+                    "ping", "-c", "200", "-i", "0.01", SERVER_IP, namespace=DC_NAMESPACE
+                )
+            )
+        finally:
+            # Stop the daemons before their overlay directories are removed
+            _destroy_topology()
+    return BenchmarkResult(
+        proposal=proposal_name,
+        underlay_mtu=underlay_mtu,
+        tuning=tuning,
+        backend=backend_name,
+        tunnel_mtu=tunnel_mtu(proposal, underlay_mtu=underlay_mtu),
+        gbps=round(gbps, 3),
+        pps=(after - before) // duration,
+        retransmits=retransmits,
+        rtt_p50_ms=percentile(rtts, 50),
+        rtt_p99_ms=percentile(rtts, 99),
+    )
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        prog="python -m site_to_site_vpn.emulator",
+        description="Benchmark the CGW configuration in local network namespaces",
+    )
+    parser.add_argument("--proposal", action="append", choices=PROPOSALS)
+    parser.add_argument("--underlay-mtu", action="append", type=int)
+    parser.add_argument("--tuning", action="append", choices=TUNING_PROFILES)
+    parser.add_argument("--backend", action="append", choices=BACKENDS)
+    parser.add_argument("--duration", type=int, default=10)
+    parser.add_argument("--streams", type=int, default=4)
+    parser.add_argument("--json", type=Path, help="write the results to this file")
+    parser.add_argument("--baseline", type=Path, help="results of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument(
+        "--render", action="store_true", help="print the CGW script and exit"
+    )
+    args = parser.parse_args(argv)
+    proposals = args.proposal or ["aes-gcm-128"]
+    underlay_mtus = args.underlay_mtu or [DEFAULT_UNDERLAY_MTU]
+    tunings = args.tuning or ["forwarding"]
+    backends = args.backend or ["starter"]
+
+    if args.render:
+        print(
+            render_cgw_script(
+                PROPOSALS[proposals[0]],
+                underlay_mtu=underlay_mtus[0],
+                backend=BACKENDS[backends[0]],
+                tuning_profile=TUNING_PROFILES[tunings[0]],
+            )
+        )
+        return
+    if os.geteuid() != 0:
+        sys.exit("Network namespaces require root")
+    tools = REQUIRED_TOOLS + tuple(
+        tool for backend in backends for tool in BACKEND_TOOLS[BACKENDS[backend]]
+    )
+    missing = [tool for tool in dict.fromkeys(tools) if not shutil.which(tool)]
+    if missing:
+        sys.exit(f"Missing tools: {', '.join(missing)}")
+
+    results = []
+    print(
+        f"{'proposal':<12} {'mtu':>5} {'tuning':<11} {'backend':<8} "
+        f"{'tun mtu':>7} {'Gbps':>7} {'PPS':>9} {'retr':>6} {'p50 ms':>7} {'p99 ms':>7}"
+    )
+    for proposal, underlay_mtu, tuning, backend in product(
+        proposals, underlay_mtus, tunings, backends
+    ):
+        result = benchmark(
+            proposal,
+            underlay_mtu=underlay_mtu,
+            tuning=tuning,
+            backend_name=backend,
+            duration=args.duration,
+            streams=args.streams,
+        )
+        results.append(result)
+        print(
+            f"{result.proposal:<12} {result.underlay_mtu:>5} {result.tuning:<11} "
+            f"{result.backend:<8} {result.tunnel_mtu:>7} {result.gbps:>7.2f} "
+            f"{result.pps:>9} {result.retransmits:>6} {result.rtt_p50_ms:>7.3f} "
+            f"{result.rtt_p99_ms:>7.3f}"
+        )
+
+    if args.json:
+        args.json.write_text(json.dumps([asdict(r) for r in results], indent=2))
+    if args.baseline:
+        baseline = [
+            BenchmarkResult(**result)
+            for result in json.loads(args.baseline.read_text())
+        ]
+        messages = regressions(results, baseline, tolerance=args.tolerance)
+        if messages:
+            sys.exit("Throughput regressions:\n" + "\n".join(messages))
+
+
+if __name__ == "__main__":
+    main()
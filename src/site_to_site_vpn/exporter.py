@@ -0,0 +1,354 @@
+import argparse
+import json
+import os
+import re
+import socket
+import subprocess
+import time
+from typing import TextIO
+
+# Samples the CGW data plane every second and sends the deltas as CloudWatch
+# embedded metric format (EMF) documents, in batches, to the CloudWatch agent.
+# Installed as a standalone script on the CGW, so it only uses the standard
+# library. A capture holds the raw counter dumps of one sample, the parsing
+# runs offline against captures with --replay.
+NAMESPACE = "SiteToSiteVpn/CustomerGateway"
+EMF_ENDPOINT = ("127.0.0.1", 25888)
+
+# ENA counters of packets shaped or dropped because the instance exceeded its
+# bandwidth, PPS, conntrack or link-local allowance
+ALLOWANCE_METRICS = {
+    "bw_in_allowance_exceeded": "BwInAllowanceExceeded",
+    "bw_out_allowance_exceeded": "BwOutAllowanceExceeded",
+    "pps_allowance_exceeded": "PpsAllowanceExceeded",
+    "conntrack_allowance_exceeded": "ConntrackAllowanceExceeded",
+    "linklocal_allowance_exceeded": "LinklocalAllowanceExceeded",
+}
+# Sequence numbers outside the replay window or replayed
+REPLAY_ERRORS = ("XfrmInStateSeqError",)
+# CREATE_CHILD_SA messages of the charon rekey log, e.g.
+# 1700000000.123 09[ENC] <Tunnel1|3> generating CREATE_CHILD_SA request 7 [ N(REKEY_SA) SA No KE TSi TSr ]
+CREATE_CHILD_SA = re.compile(
+    r"^(?P<time>\d+(?:\.\d+)?) \S+ <(?P<ike_sa>[^|>]+)\|(?P<unique_id>\d+)> "
+    r"(?P<action>generating|parsed) CREATE_CHILD_SA (?P<message>request|response) "
+    r"(?P<message_id>\d+) \[ (?P<payloads>.*) \]"
+)
+# Key lines of an SA in `ip -s xfrm state`, e.g.
+#     aead rfc4106(gcm(aes)) 0x3f1c... 128
+XFRM_KEY = re.compile(r"^[ \t]+(?:aead|enc|auth|auth-trunc) .*\n?", re.MULTILINE)
+
+
+def parse_xfrm_states(output: str) -> list[dict]:
+    # `ip -s xfrm state`, one SA per block starting with "src"
+    states = []
+    for block in re.split(r"^(?=src )", output, flags=re.MULTILINE):
+        spi = re.search(r"proto esp spi (0x[0-9a-f]+)", block)
+        if not spi:
+            continue
+        current = re.search(r"(\d+)\(bytes\), (\d+)\(packets\)", block)
+        mark = re.search(r"mark (0x[0-9a-f]+)", block)
+        replay = re.search(r"replay (\d+) failed (\d+)", block)
+        states.append(
+            dict(
+                src=block.split()[1],
+                spi=spi.group(1),
+                mark=int(mark.group(1), 16) if mark else 0,
+                bytes=int(current.group(1)) if current else 0,
+                packets=int(current.group(2)) if current else 0,
+                replay=int(replay.group(1)) if replay else 0,
+                integrity_failed=int(replay.group(2)) if replay else 0,
+            )
+        )
+    return states
+
+
+def strip_keys(output: str) -> str:
+    # The parsers only need the counters and SPIs, the ESP keys of live SAs
+    # must not end up in --capture files
+    return XFRM_KEY.sub("", output)
+
+
+def parse_xfrm_stat(output: str) -> dict[str, int]:
+    # /proc/net/xfrm_stat
+    return {
+        name: int(value)
+        for name, value in re.findall(r"^(\w+)\s+(\d+)$", output, re.MULTILINE)
+    }
+
+
+def parse_ethtool_stats(output: str) -> dict[str, int]:
+    # `ethtool -S <interface>`
+    return {
+        name: int(value)
+        for name, value in re.findall(r"^\s+([\w.\[\]]+): (\d+)$", output, re.MULTILINE)
+    }
+
+
+def parse_cpu_times(output: str) -> dict[str, tuple[int, int]]:
+    # /proc/stat, (total jiffies, softirq jiffies) of every CPU
+    times = {}
+    for line in output.splitlines():
+        fields = line.split()
+        if fields and re.fullmatch(r"cpu\d+", fields[0]):
+            values = list(map(int, fields[1:]))
+            times[fields[0]] = (sum(values), values[6])
+    return times
+
+
+def parse_rekeys(before: str, after: str) -> list[dict]:
+    # IKE and CHILD_SA rekeys whose response is logged in after, the request
+    # may be logged in before. Exchanges are keyed by the IKE_SA and the
+    # message ID of the initiator, both peers count their requests separately.
+    pending, rekeys = {}, []
+    for output, report in ((before, False), (after, True)):
+        for line in output.splitlines():
+            message = CREATE_CHILD_SA.match(line)
+            if not message:
+                continue
+            request = message["message"] == "request"
+            initiator = (message["action"] == "generating") == request
+            key = (message["ike_sa"], message["unique_id"], message["message_id"])
+            if request:
+                pending[key, initiator] = message
+                continue
+            sent = pending.pop((key, initiator), None)
+            if not report or not sent:
+                continue
+            # New CHILD_SAs carry traffic selectors without N(REKEY_SA)
+            payloads = sent["payloads"].split()
+            if "TSi" in payloads and "N(REKEY_SA)" not in payloads:
+                continue
+            rekeys.append(
+                dict(
+                    tunnel=message["ike_sa"],
+                    sa="CHILD_SA" if "TSi" in payloads else "IKE_SA",
+                    initiator="local" if initiator else "peer",
+                    time=float(sent["time"]),
+                    duration=round(
+                        1000 * (float(message["time"]) - float(sent["time"])), 3
+                    ),
+                )
+            )
+    return rekeys
+
+
+def capture(interface: str, rekey_log: TextIO | None = None) -> dict:
+    def run(*args: str) -> str:
+        return subprocess.run(args, capture_output=True, text=True).stdout
+
+    with open("/proc/net/xfrm_stat") as xfrm_stat, open("/proc/stat") as stat:
+        return dict(
+            time=time.time(),
+            xfrm_state=strip_keys(run("ip", "-s", "xfrm", "state")),
+            xfrm_stat=xfrm_stat.read(),
+            ethtool=run("ethtool", "-S", interface),
+            stat=stat.read(),
+            rekey_log=rekey_log.read() if rekey_log else "",
+        )
+
+
+def _delta(before: int, after: int) -> int:
+    # Counters reset when a driver or module reloads
+    return after - before if after >= before else after
+
+
+def metrics(
+    previous: dict, current: dict, *, local_ip: str, tunnels: dict[int, str]
+) -> dict:
+    # Gateway and per tunnel metrics between two captures
+    gateway = {}
+    before = parse_ethtool_stats(previous["ethtool"])
+    after = parse_ethtool_stats(current["ethtool"])
+    for counter, name in ALLOWANCE_METRICS.items():
+        if counter in after:
+            gateway[name] = _delta(before.get(counter, 0), after[counter])
+
+    before = parse_xfrm_stat(previous["xfrm_stat"])
+    after = parse_xfrm_stat(current["xfrm_stat"])
+    deltas = {name: _delta(before.get(name, 0), value) for name, value in after.items()}
+    gateway["XfrmInErrors"] = sum(
+        value for name, value in deltas.items() if name.startswith("XfrmIn")
+    )
+    gateway["XfrmOutErrors"] = sum(
+        value for name, value in deltas.items() if name.startswith("XfrmOut")
+    )
+    gateway["XfrmReplayErrors"] = sum(deltas.get(name, 0) for name in REPLAY_ERRORS)
+
+    before = parse_cpu_times(previous["stat"])
+    after = parse_cpu_times(current["stat"])
+    softirq = [
+        100 * (after[cpu][1] - before[cpu][1]) / max(after[cpu][0] - before[cpu][0], 1)
+        for cpu in after
+        if cpu in before
+    ]
+    if softirq:
+        gateway["SoftirqCpuPercent"] = sum(softirq) / len(softirq)
+        gateway["SoftirqMaxCpuPercent"] = max(softirq)
+
+    per_tunnel = {
+        name: dict(
+            EspBytesIn=0,
+            EspBytesOut=0,
+            EspPacketsIn=0,
+            EspPacketsOut=0,
+            SaReplayErrors=0,
+            SaIntegrityErrors=0,
+            Rekeys=0,
+        )
+        for name in tunnels.values()
+    }
+    # Deltas per SA: a rekey installs SAs with new SPIs next to the old ones
+    known = {state["spi"]: state for state in parse_xfrm_states(previous["xfrm_state"])}
+    for state in parse_xfrm_states(current["xfrm_state"]):
+        tunnel = per_tunnel.get(tunnels.get(state["mark"], ""))
+        if tunnel is None:
+            continue
+        direction = "Out" if state["src"] == local_ip else "In"
+        old = known.get(
+            state["spi"], dict(bytes=0, packets=0, replay=0, integrity_failed=0)
+        )
+        tunnel[f"EspBytes{direction}"] += _delta(old["bytes"], state["bytes"])
+        tunnel[f"EspPackets{direction}"] += _delta(old["packets"], state["packets"])
+        tunnel["SaReplayErrors"] += _delta(old["replay"], state["replay"])
+        tunnel["SaIntegrityErrors"] += _delta(
+            old["integrity_failed"], state["integrity_failed"]
+        )
+        # New outbound SAs are CHILD_SA rekeys, or re-establishments
+        if direction == "Out" and state["spi"] not in known:
+            tunnel["Rekeys"] += 1
+    # The CGW initiates every rekey, rekeys of the VPGW mean the lifetimes of
+    # both sides drifted apart
+    for rekey in parse_rekeys(
+        previous.get("rekey_log", ""), current.get("rekey_log", "")
+    ):
+        tunnel = per_tunnel.get(rekey["tunnel"])
+        if tunnel is None:
+            continue
+        if rekey["initiator"] == "peer":
+            tunnel["PeerRekeys"] = tunnel.get("PeerRekeys", 0) + 1
+        else:
+            tunnel["RekeyDuration"] = max(
+                tunnel.get("RekeyDuration", 0), rekey["duration"]
+            )
+    return dict(gateway=gateway, tunnels=per_tunnel)
+
+
+def emf_document(
+    values: dict,
+    dimensions: dict[str, str],
+    *,
+    timestamp: float,
+    namespace: str,
+    log_group: str,
+) -> dict:
+    units = {name: _unit(name) for name in values}
+    return {
+        "_aws": {
+            "Timestamp": int(timestamp * 1000),
+            "LogGroupName": log_group,
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": namespace,
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": [
+                        dict(Name=name, Unit=units[name], StorageResolution=1)
+                        for name in values
+                    ],
+                }
+            ],
+        },
+        **dimensions,
+        **values,
+    }
+
+
+def emf_documents(
+    previous: dict, current: dict, args: argparse.Namespace
+) -> list[dict]:
+    sample = metrics(
+        previous, current, local_ip=args.local_ip, tunnels=dict(args.tunnel)
+    )
+    options = dict(
+        timestamp=current["time"], namespace=args.namespace, log_group=args.log_group
+    )
+    documents = [emf_document(sample["gateway"], dict(VpnId=args.vpn_id), **options)]
+    for tunnel, values in sample["tunnels"].items():
+        documents.append(
+            emf_document(values, dict(VpnId=args.vpn_id, Tunnel=tunnel), **options)
+        )
+    return documents
+
+
+def _unit(name: str) -> str:
+    if name.endswith("Percent"):
+        return "Percent"
+    if name.endswith("Duration"):
+        return "Milliseconds"
+    return "Bytes" if "Bytes" in name else "Count"
+
+
+def _tunnel(value: str) -> tuple[int, str]:
+    # Tunnel1=100, the VTI name and its xfrm mark
+    name, mark = value.split("=")
+    return int(mark), name
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description="Export CGW data plane metrics as CloudWatch EMF"
+    )
+    parser.add_argument("--vpn-id", required=True)
+    parser.add_argument(
+        "--local-ip", required=True, help="private IP the SAs are bound to"
+    )
+    parser.add_argument("--interface", default="ens5")
+    parser.add_argument(
+        "--tunnel", action="append", type=_tunnel, default=[], help="e.g. Tunnel1=100"
+    )
+    parser.add_argument(
+        "--rekey-log", help="charon log of the CREATE_CHILD_SA exchanges"
+    )
+    parser.add_argument("--namespace", default=NAMESPACE)
+    parser.add_argument("--log-group", default="/vpn/customer-gateway/metrics")
+    parser.add_argument("--interval", type=float, default=1)
+    parser.add_argument("--flush-interval", type=float, default=10)
+    parser.add_argument("--capture", help="also append every raw capture to this file")
+    parser.add_argument(
+        "--replay", help="print the EMF documents of a capture file and exit"
+    )
+    args = parser.parse_args(argv)
+
+    if args.replay:
+        with open(args.replay) as replay:
+            captures = [json.loads(line) for line in replay]
+        for previous, current in zip(captures, captures[1:]):
+            for document in emf_documents(previous, current, args):
+                print(json.dumps(document))
+        return
+
+    # Only rekeys from now on, charon appends to the log
+    rekey_log = open(args.rekey_log, "a+") if args.rekey_log else None
+    if rekey_log:
+        rekey_log.seek(0, os.SEEK_END)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    previous, batch, flushed = None, [], time.monotonic()
+    while True:
+        current = capture(args.interface, rekey_log)
+        if args.capture:
+            with open(args.capture, "a") as dump:
+                dump.write(json.dumps(current) + "\n")
+        if previous:
+            batch.extend(emf_documents(previous, current, args))
+            # Every rekey also goes to the journal
+            for rekey in parse_rekeys(previous["rekey_log"], current["rekey_log"]):
+                print(json.dumps(rekey), flush=True)
+        previous = current
+        if time.monotonic() - flushed >= args.flush_interval:
+            for document in batch:
+                sock.sendto(json.dumps(document).encode(), EMF_ENDPOINT)
+            batch, flushed = [], time.monotonic()
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
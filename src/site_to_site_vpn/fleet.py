@@ -0,0 +1,266 @@
+import argparse
+from dataclasses import dataclass, fields
+import os
+from pathlib import Path
+import re
+import tomllib
+from typing import Mapping
+
+from aws_cdk import App
+from dotenv import find_dotenv, load_dotenv
+
+from .constructs.customer_gateway import IpsecBackend
+from .constructs.vpn_connection import VpnTopology
+from .inside_cidrs import DEFAULT_STATE_FILE, InsideCidrAllocator
+from .ipsec import AES_GCM_128, HITLESS_REKEY, PROPOSALS, IpsecProposal, RekeyProfile
+from .routing import RoutePlan
+from .sizing import select_instance_size
+from .stacks.datacenter import DatacenterCustomerGatewayStack, DatacenterVPCStack
+from .stacks.vpc import VpcStack
+
+# Site names prefix stack ids, IAM roles, log groups, SSM parameters and
+# dashboards, so they are kept short and DNS-like
+SITE_NAME = re.compile(r"^[a-z][a-z0-9-]{0,30}$")
+
+
+@dataclass(frozen=True)
+class Site:
+    name: str
+    dc_cidr: str
+    vpc_cidr: str
+    # Further prefixes behind the CGW and in the VPC, see routing.py
+    site_cidrs: tuple[str, ...] = ()
+    vpc_cidrs: tuple[str, ...] = ()
+    # Both tunnels with ECMP, needs a second PSK
+    active_active: bool = False
+    topology: VpnTopology = VpnTopology.VGW
+    gateway_count: int = 1
+    throughput_gbps: float = 1.25
+    pps: int = 150_000
+    # Pinned inside CIDRs of the first VPN connection, allocated if unset
+    tun1_inner_cidr: str | None = None
+    tun2_inner_cidr: str | None = None
+
+    def __post_init__(self):
+        if not SITE_NAME.match(self.name):
+            raise ValueError(
+                f"Site names are lowercase letters, digits and dashes, got {self.name!r}"
+            )
+        if self.gateway_count < 1:
+            raise ValueError(f"{self.name}: gateway_count must be at least 1")
+        if self.topology is not VpnTopology.TGW and self.gateway_count != 1:
+            raise ValueError(f"{self.name}: only the TGW topology scales out gateways")
+        # Fails early on overlapping or oversized prefix lists
+        try:
+            _ = self.routes
+        except ValueError as error:
+            raise ValueError(f"{self.name}: {error}") from error
+
+    @property
+    def routes(self) -> RoutePlan:
+        return RoutePlan(
+            site_cidrs=(self.dc_cidr, *self.site_cidrs),
+            vpc_cidrs=(self.vpc_cidr, *self.vpc_cidrs),
+        )
+
+    def pre_shared_key_env(self, tunnel: int) -> str:
+        return f"{self.name.upper().replace('-', '_')}_TUN{tunnel}_PRE_SHARED_KEY"
+
+    @property
+    def pre_shared_key_envs(self) -> list[str]:
+        return [
+            self.pre_shared_key_env(tunnel)
+            for tunnel in ((1, 2) if self.active_active else (1,))
+        ]
+
+
+@dataclass(frozen=True)
+class Fleet:
+    sites: tuple[Site, ...]
+    proposal: IpsecProposal = AES_GCM_128
+    rekey: RekeyProfile = HITLESS_REKEY
+    ipsec_backend: IpsecBackend = IpsecBackend.STARTER
+    allow_arm: bool = False
+
+    def __post_init__(self):
+        if not self.sites:
+            raise ValueError("A fleet needs at least one site")
+        names = [site.name for site in self.sites]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Duplicate site names: {', '.join(duplicates)}")
+        # Distinct names can still map to the same env vars (a-b and a_b)
+        envs = [env for site in self.sites for env in site.pre_shared_key_envs]
+        if len(set(envs)) != len(envs):
+            raise ValueError("Site names must map to distinct PSK env vars")
+
+
+@dataclass
+class SiteStacks:
+    dc_vpc: DatacenterVPCStack
+    vpc: VpcStack
+    customer_gateway: DatacenterCustomerGatewayStack
+
+
+def load_fleet(path: str | Path) -> Fleet:
+    # [fleet] holds the fleet wide settings, [defaults] the site fields shared
+    # by every [[sites]] entry
+    with open(path, "rb") as file:
+        config = tomllib.load(file)
+    unknown = set(config) - {"fleet", "defaults", "sites"}
+    if unknown:
+        raise ValueError(f"Unknown fleet file tables: {', '.join(sorted(unknown))}")
+    settings = dict(config.get("fleet", {}))
+    _check_keys("fleet setting", settings, Fleet)
+    if "proposal" in settings:
+        if settings["proposal"] not in PROPOSALS:
+            raise ValueError(
+                f"Unknown proposal {settings['proposal']!r}, "
+                f"choose from {', '.join(PROPOSALS)}"
+            )
+        settings["proposal"] = PROPOSALS[settings["proposal"]]
+    if "ipsec_backend" in settings:
+        backends = {backend.name.lower(): backend for backend in IpsecBackend}
+        if settings["ipsec_backend"] not in backends:
+            raise ValueError(
+                f"Unknown ipsec_backend {settings['ipsec_backend']!r}, "
+                f"choose from {', '.join(backends)}"
+            )
+        settings["ipsec_backend"] = backends[settings["ipsec_backend"]]
+    defaults = config.get("defaults", {})
+    sites = []
+    for entry in config.get("sites", []):
+        values = defaults | entry
+        _check_keys("site field", values, Site)
+        for key in ("site_cidrs", "vpc_cidrs"):
+            values[key] = tuple(values.get(key, ()))
+        if "topology" in values:
+            topologies = [topology.value for topology in VpnTopology]
+            if values["topology"] not in topologies:
+                raise ValueError(
+                    f"Unknown topology {values['topology']!r}, "
+                    f"choose from {', '.join(topologies)}"
+                )
+            values["topology"] = VpnTopology(values["topology"])
+        sites.append(Site(**values))
+    return Fleet(sites=tuple(sites), **settings)
+
+
+def _check_keys(kind: str, values: dict, cls: type):
+    unknown = set(values) - {field.name for field in fields(cls)}
+    if unknown:
+        raise ValueError(f"Unknown {kind}s: {', '.join(sorted(unknown))}")
+
+
+def build_fleet(
+    app: App,
+    fleet: Fleet,
+    *,
+    environ: Mapping[str, str] = os.environ,
+    inside_cidrs: InsideCidrAllocator | None = None,
+) -> dict[str, SiteStacks]:
+    # Every site is its own dc-vpc/infra-vpc/dc-gw trio without references to
+    # other sites, so synth time and memory grow linearly with the fleet
+    missing = [
+        env
+        for site in fleet.sites
+        for env in site.pre_shared_key_envs
+        if not environ.get(env)
+    ]
+    if missing:
+        raise ValueError(f"Missing pre-shared keys: {', '.join(missing)}")
+    inside_cidrs = inside_cidrs or InsideCidrAllocator()
+    stacks = {}
+    for site in fleet.sites:
+        routes = site.routes
+        gateway_size = select_instance_size(
+            site.throughput_gbps,
+            site.pps,
+            ipsec_sas=2 if site.active_active else 1,
+            parallel_esp=fleet.ipsec_backend is IpsecBackend.SWANCTL,
+            allow_arm=fleet.allow_arm,
+        )
+        vpc_stack_id = f"{site.name}-infra-vpc"
+        dc_network_stack = DatacenterVPCStack(
+            app,
+            f"{site.name}-dc-vpc",
+            cidr=site.dc_cidr,
+            gateway_count=site.gateway_count,
+            vpc_name=f"{site.name}-datacenter",
+        )
+        vpc_stack = VpcStack(
+            app,
+            vpc_stack_id,
+            cidr=site.vpc_cidr,
+            routes=routes,
+            customer_gateway_public_ips=dc_network_stack.customer_gateway_public_ips,
+            tun1_pre_shared_key=environ[site.pre_shared_key_env(1)],
+            tun1_inner_cidr=site.tun1_inner_cidr
+            or inside_cidrs.allocate(f"{vpc_stack_id}/vpn1/tunnel1"),
+            tun2_pre_shared_key=(
+                environ[site.pre_shared_key_env(2)] if site.active_active else None
+            ),
+            tun2_inner_cidr=(
+                site.tun2_inner_cidr
+                or inside_cidrs.allocate(f"{vpc_stack_id}/vpn1/tunnel2")
+                if site.active_active
+                else None
+            ),
+            inside_cidrs=inside_cidrs,
+            proposal=fleet.proposal,
+            rekey=fleet.rekey,
+            topology=site.topology,
+            vpc_name=f"{site.name}-webservers-vpc",
+            dashboard_name=f"{site.name}-vpn",
+            ssm_prefix=f"/vpn/{site.name}/vpgw",
+        )
+        customer_gateway_stack = DatacenterCustomerGatewayStack(
+            app,
+            f"{site.name}-dc-gw",
+            dc_vpc=dc_network_stack.vpc,
+            cgw_eip_allocation_ids=dc_network_stack.customer_gateway_public_ip_allocation_ids,
+            vpn_connections=vpc_stack.vpn_connections,
+            routes=routes,
+            proposal=fleet.proposal,
+            rekey=fleet.rekey,
+            ipsec_backend=fleet.ipsec_backend,
+            gateway_size=gateway_size,
+            placement_group_name=dc_network_stack.placement_group_name,
+            name=f"{site.name}-cgw",
+        )
+        customer_gateway_stack.add_dependency(dc_network_stack)
+        customer_gateway_stack.add_dependency(vpc_stack)
+        stacks[site.name] = SiteStacks(
+            dc_vpc=dc_network_stack,
+            vpc=vpc_stack,
+            customer_gateway=customer_gateway_stack,
+        )
+    return stacks
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description="Synthesize one datacenter, VPC and CGW per site of a fleet file"
+    )
+    parser.add_argument("fleet_file", type=Path)
+    parser.add_argument(
+        "--missing-psks",
+        action="store_true",
+        help="print the PSK env vars that are not set yet and exit",
+    )
+    args = parser.parse_args(argv)
+    load_dotenv(find_dotenv(usecwd=True))
+    fleet = load_fleet(args.fleet_file)
+    if args.missing_psks:
+        for site in fleet.sites:
+            for env in site.pre_shared_key_envs:
+                if not os.environ.get(env):
+                    print(env)
+        return
+    app = App()
+    build_fleet(app, fleet, inside_cidrs=InsideCidrAllocator(state=DEFAULT_STATE_FILE))
+    app.synth()
+
+
+if __name__ == "__main__":
+    main()
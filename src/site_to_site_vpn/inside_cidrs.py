@@ -0,0 +1,136 @@
+import hashlib
+import ipaddress
+import json
+from pathlib import Path
+
+# Tunnel inside CIDRs are /30s of 169.254.0.0/16, unique per virtual private
+# or transit gateway. AWS rejects these ones.
+LINK_LOCAL = ipaddress.IPv4Network("169.254.0.0/16")
+INSIDE_PREFIX_LENGTH = 30
+AWS_RESERVED = (
+    "169.254.0.0/30",
+    "169.254.1.0/30",
+    "169.254.2.0/30",
+    "169.254.3.0/30",
+    "169.254.4.0/30",
+    "169.254.5.0/30",
+    "169.254.169.252/30",
+)
+BLOCKS = 2 ** (INSIDE_PREFIX_LENGTH - LINK_LOCAL.prefixlen)
+# Allocations of app.py and fleet synths, commit it next to cdk.context.json
+DEFAULT_STATE_FILE = Path("inside-cidrs.json")
+
+
+class InsideCidrAllocator:
+    # One bit per /30 of 169.254.0.0/16. A tunnel key (e.g. site/vpn/tunnel)
+    # hashes to its preferred /30 and probes forward on collisions, which
+    # stays constant time while the space is sparsely used. Probing depends
+    # on the allocation order, so with a state file every allocation is
+    # persisted and pinned on the next synth: a new key never takes the /30
+    # of an existing tunnel, whose replacement would replace its VPN
+    # connection.
+    def __init__(
+        self,
+        *,
+        reserved: tuple[str, ...] = AWS_RESERVED,
+        state: Path | None = None,
+    ):
+        self._bitmap = bytearray(BLOCKS // 8)
+        self._free = BLOCKS
+        self._allocations: dict[str, int] = {}
+        # Persisted keys not pinned or allocated by this synth yet
+        self._persisted: set[str] = set()
+        self.state = None
+        for cidr in reserved:
+            network = _inside_network(cidr)
+            self._set(_block(network))
+        if state and state.exists():
+            for key, cidr in json.loads(state.read_text()).items():
+                self.pin(key, cidr)
+            self._persisted = set(self._allocations)
+        self.state = state
+
+    def __repr__(self) -> str:
+        return f"InsideCidrAllocator({self.allocations!r})"
+
+    @property
+    def allocations(self) -> dict[str, str]:
+        return {key: _cidr(block) for key, block in self._allocations.items()}
+
+    def allocate(self, key: str) -> str:
+        self._persisted.discard(key)
+        if key in self._allocations:
+            return _cidr(self._allocations[key])
+        if not self._free:
+            raise ValueError("No tunnel inside CIDR left in 169.254.0.0/16")
+        digest = hashlib.sha256(key.encode()).digest()
+        block = int.from_bytes(digest[:4], "big") % BLOCKS
+        while self._taken(block):
+            block = (block + 1) % BLOCKS
+        self._set(block)
+        self._allocations[key] = block
+        self._save()
+        return _cidr(block)
+
+    def pin(self, key: str, cidr: str) -> str:
+        # Keeps the CIDR of an existing tunnel, replacing it replaces the VPN
+        # connection. A configured CIDR overrides a persisted one.
+        block = _block(_inside_network(cidr))
+        if key in self._persisted and self._allocations[key] != block:
+            self._release(self._allocations.pop(key))
+        self._persisted.discard(key)
+        if self._allocations.get(key, block) != block:
+            raise ValueError(
+                f"{key} already has the inside CIDR {_cidr(self._allocations[key])}"
+            )
+        if key not in self._allocations:
+            if self._taken(block):
+                raise ValueError(f"Inside CIDR {cidr} is reserved or allocated")
+            self._set(block)
+            self._allocations[key] = block
+            self._save()
+        return cidr
+
+    def _save(self):
+        if self.state:
+            self.state.write_text(
+                json.dumps(dict(sorted(self.allocations.items())), indent=2) + "\n"
+            )
+
+    def _taken(self, block: int) -> bool:
+        return bool(self._bitmap[block >> 3] & (1 << (block & 7)))
+
+    def _set(self, block: int):
+        if not self._taken(block):
+            self._free -= 1
+        self._bitmap[block >> 3] |= 1 << (block & 7)
+
+    def _release(self, block: int):
+        if self._taken(block):
+            self._free += 1
+        self._bitmap[block >> 3] &= ~(1 << (block & 7))
+
+
+def tunnel_addresses(cidr: str) -> tuple[str, str]:
+    # The first host of an inside CIDR is the AWS side, the second the CGW
+    network = _inside_network(cidr)
+    return str(network.network_address + 1), str(network.network_address + 2)
+
+
+def _inside_network(cidr: str) -> ipaddress.IPv4Network:
+    network = ipaddress.ip_network(cidr)
+    if (
+        not isinstance(network, ipaddress.IPv4Network)
+        or network.prefixlen != INSIDE_PREFIX_LENGTH
+        or not network.subnet_of(LINK_LOCAL)
+    ):
+        raise ValueError(f"Tunnel inside CIDRs are /30s of {LINK_LOCAL}, got {cidr}")
+    return network
+
+
+def _block(network: ipaddress.IPv4Network) -> int:
+    return (int(network.network_address) - int(LINK_LOCAL.network_address)) >> 2
+
+
+def _cidr(block: int) -> str:
+    return f"{LINK_LOCAL.network_address + (block << 2)}/{INSIDE_PREFIX_LENGTH}"
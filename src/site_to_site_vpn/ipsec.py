@@ -0,0 +1,306 @@
+from dataclasses import dataclass
+from enum import Enum
+import math
+
+
+class Encryption(Enum):
+    AES128 = "AES128"
+    AES256 = "AES256"
+    AES128_GCM_16 = "AES128-GCM-16"
+    AES256_GCM_16 = "AES256-GCM-16"
+
+    @property
+    def strongswan(self) -> str:
+        return _STRONGSWAN_ENCRYPTION[self]
+
+    @property
+    def aead(self) -> bool:
+        return self in (Encryption.AES128_GCM_16, Encryption.AES256_GCM_16)
+
+    @property
+    def kernel(self) -> str:
+        return "rfc4106(gcm(aes))" if self.aead else "cbc(aes)"
+
+
+class Integrity(Enum):
+    SHA1 = "SHA1"
+    SHA2_256 = "SHA2-256"
+    SHA2_384 = "SHA2-384"
+    SHA2_512 = "SHA2-512"
+
+    @property
+    def strongswan(self) -> str:
+        return _STRONGSWAN_INTEGRITY[self]
+
+    @property
+    def strongswan_prf(self) -> str:
+        return f"prf{self.strongswan}"
+
+    @property
+    def kernel(self) -> str:
+        return f"hmac({self.strongswan})"
+
+
+class DhGroup(Enum):
+    MODP1024 = 2
+    MODP1536 = 5
+    MODP2048 = 14
+    MODP3072 = 15
+    MODP4096 = 16
+    MODP6144 = 17
+    MODP8192 = 18
+    ECP256 = 19
+    ECP384 = 20
+    ECP521 = 21
+    MODP2048S256 = 24
+
+    @property
+    def strongswan(self) -> str:
+        return self.name.lower()
+
+    @property
+    def elliptic(self) -> bool:
+        return self in (DhGroup.ECP256, DhGroup.ECP384, DhGroup.ECP521)
+
+
+_STRONGSWAN_ENCRYPTION = {
+    Encryption.AES128: "aes128",
+    Encryption.AES256: "aes256",
+    Encryption.AES128_GCM_16: "aes128gcm16",
+    Encryption.AES256_GCM_16: "aes256gcm16",
+}
+
+_STRONGSWAN_INTEGRITY = {
+    Integrity.SHA1: "sha1",
+    Integrity.SHA2_256: "sha256",
+    Integrity.SHA2_384: "sha384",
+    Integrity.SHA2_512: "sha512",
+}
+
+
+@dataclass(frozen=True)
+class IpsecProposal:
+    phase1_encryption: tuple[Encryption, ...]
+    phase1_integrity: tuple[Integrity, ...]
+    phase1_dh_groups: tuple[DhGroup, ...]
+    phase2_encryption: tuple[Encryption, ...]
+    phase2_integrity: tuple[Integrity, ...]
+    phase2_dh_groups: tuple[DhGroup, ...]
+
+    def __post_init__(self):
+        for field in (
+            "phase1_encryption",
+            "phase1_integrity",
+            "phase1_dh_groups",
+            "phase2_encryption",
+        ):
+            if not getattr(self, field):
+                raise ValueError(f"IpsecProposal.{field} must not be empty")
+        if not self.phase2_integrity and not all(
+            encryption.aead for encryption in self.phase2_encryption
+        ):
+            raise ValueError(
+                "IpsecProposal.phase2_integrity is required for non-AEAD ciphers"
+            )
+
+    @property
+    def ike(self) -> str:
+        return f"{self.ike_proposals}!"
+
+    @property
+    def esp(self) -> str:
+        return f"{self.esp_proposals}!"
+
+    @property
+    def ike_proposals(self) -> str:
+        # AEAD and classic ciphers cannot share a proposal. With AEAD the
+        # phase 1 integrity algorithms are only used as PRF.
+        proposals = []
+        aead = [e.strongswan for e in self.phase1_encryption if e.aead]
+        classic = [e.strongswan for e in self.phase1_encryption if not e.aead]
+        groups = [g.strongswan for g in self.phase1_dh_groups]
+        if aead:
+            prfs = [i.strongswan_prf for i in self.phase1_integrity]
+            proposals.append("-".join(aead + prfs + groups))
+        if classic:
+            integrity = [i.strongswan for i in self.phase1_integrity]
+            proposals.append("-".join(classic + integrity + groups))
+        return ",".join(proposals)
+
+    @property
+    def esp_proposals(self) -> str:
+        # The phase 2 DH groups are the PFS groups of every CHILD_SA rekey,
+        # without them CHILD_SAs are rekeyed without PFS.
+        proposals = []
+        aead = [e.strongswan for e in self.phase2_encryption if e.aead]
+        classic = [e.strongswan for e in self.phase2_encryption if not e.aead]
+        groups = [g.strongswan for g in self.phase2_dh_groups]
+        if aead:
+            proposals.append("-".join(aead + groups))
+        if classic:
+            integrity = [i.strongswan for i in self.phase2_integrity]
+            proposals.append("-".join(classic + integrity + groups))
+        return ",".join(proposals)
+
+    @property
+    def kernel_aeads(self) -> list[str]:
+        # Linux crypto API names of the ESP transforms, as wrapped by pcrypt
+        names = []
+        for encryption in self.phase2_encryption:
+            if encryption.aead:
+                candidates = [encryption.kernel]
+            else:
+                candidates = [
+                    f"authenc({integrity.kernel},{encryption.kernel})"
+                    for integrity in self.phase2_integrity
+                ]
+            names += [name for name in candidates if name not in names]
+        return names
+
+    @property
+    def tunnel_options(self) -> dict:
+        # Keys of AWS::EC2::VPNConnection VpnTunnelOptionsSpecification
+        options = {
+            "IKEVersions": [{"Value": "ikev2"}],
+            "Phase1EncryptionAlgorithms": _values(self.phase1_encryption),
+            "Phase1IntegrityAlgorithms": _values(self.phase1_integrity),
+            "Phase1DHGroupNumbers": _values(self.phase1_dh_groups),
+            "Phase2EncryptionAlgorithms": _values(self.phase2_encryption),
+        }
+        if self.phase2_dh_groups:
+            options["Phase2DHGroupNumbers"] = _values(self.phase2_dh_groups)
+        if self.phase2_integrity:
+            options["Phase2IntegrityAlgorithms"] = _values(self.phase2_integrity)
+        return options
+
+
+@dataclass(frozen=True)
+class RekeyProfile:
+    # The AWS side of the tunnel, as VpnTunnelOptionsSpecification: the VPGW
+    # rekeys between margin and margin * (1 + fuzz) before the lifetime ends
+    phase1_lifetime: int = 28800
+    phase2_lifetime: int = 3600
+    margin: int = 270
+    fuzz: int = 100
+    # Randomization of the CGW rekeys, keeps the two tunnels apart
+    rand_time: int = 60
+
+    def __post_init__(self):
+        if not 900 <= self.phase1_lifetime <= 28800:
+            raise ValueError("RekeyProfile.phase1_lifetime must be 900-28800s")
+        if not 900 <= self.phase2_lifetime < self.phase1_lifetime:
+            raise ValueError(
+                "RekeyProfile.phase2_lifetime must be 900s or more and below "
+                "phase1_lifetime"
+            )
+        if not 60 <= self.margin <= self.phase2_lifetime // 2:
+            raise ValueError(
+                "RekeyProfile.margin must be between 60s and half of phase2_lifetime"
+            )
+        if not 0 <= self.fuzz <= 100:
+            raise ValueError("RekeyProfile.fuzz must be a percentage")
+        # Every CHILD_SA rekey of the CGW may come up to rand_time early, the
+        # IKE rekey must still fall between two CHILD_SA rekeys
+        drift = (self.ike_rekey_time // self.child_rekey_time + 1) * self.rand_time
+        if drift >= self.child_rekey_time // 2:
+            raise ValueError(
+                "RekeyProfile.rand_time is too large to keep IKE and CHILD_SA "
+                "rekeys apart"
+            )
+
+    @property
+    def aws_margin(self) -> int:
+        # Earliest VPGW rekey before the end of a lifetime
+        return math.ceil(self.margin * (1 + self.fuzz / 100))
+
+    @property
+    def child_rekey_time(self) -> int:
+        # The CGW always initiates the rekeys, before the VPGW would. Both
+        # sides initiating at once creates duplicate SAs, and one of them
+        # is deleted again with the flows on it.
+        return self.phase2_lifetime - self.aws_margin
+
+    @property
+    def ike_rekey_time(self) -> int:
+        # Halfway between two CHILD_SA rekeys, so IKE and CHILD_SA rekeys
+        # never run at the same time
+        rekeys = (self.phase1_lifetime - self.aws_margin) / self.child_rekey_time
+        return math.floor((math.floor(rekeys - 0.5) + 0.5) * self.child_rekey_time)
+
+    @property
+    def starter(self) -> dict[str, str]:
+        # ipsec.conf rekeys margintime plus up to rekeyfuzz of it before the
+        # lifetime, for IKE and CHILD_SAs alike
+        margin = self.phase2_lifetime - self.child_rekey_time
+        return dict(
+            ikelifetime=f"{self.ike_rekey_time + margin}s",
+            lifetime=f"{self.phase2_lifetime}s",
+            margintime=f"{margin}s",
+            rekeyfuzz=f"{math.ceil(100 * self.rand_time / margin)}%",
+        )
+
+    @property
+    def tunnel_options(self) -> dict:
+        # Keys of AWS::EC2::VPNConnection VpnTunnelOptionsSpecification
+        return {
+            "Phase1LifetimeSeconds": self.phase1_lifetime,
+            "Phase2LifetimeSeconds": self.phase2_lifetime,
+            "RekeyMarginTimeSeconds": self.margin,
+            "RekeyFuzzPercentage": self.fuzz,
+        }
+
+    def warnings(self, proposal: IpsecProposal) -> list[str]:
+        # Every CHILD_SA rekey runs a PFS exchange, elliptic curve groups cost
+        # a fraction of the MODP ones. AWS still offers MODP groups, so they
+        # are flagged rather than rejected.
+        return [
+            f"PFS group {group.name} is expensive to compute on every rekey, "
+            "consider an elliptic curve group such as ECP256"
+            for group in proposal.phase2_dh_groups
+            if not group.elliptic
+        ]
+
+
+def _values(algorithms: tuple[Enum, ...]) -> list[dict]:
+    return [{"Value": algorithm.value} for algorithm in algorithms]
+
+
+# What the CGW used to hardcode: every packet pays a separate HMAC-SHA1 pass.
+LEGACY = IpsecProposal(
+    phase1_encryption=(Encryption.AES128,),
+    phase1_integrity=(Integrity.SHA1,),
+    phase1_dh_groups=(DhGroup.MODP1024,),
+    phase2_encryption=(Encryption.AES128,),
+    phase2_integrity=(Integrity.SHA1,),
+    phase2_dh_groups=(),
+)
+
+# AES-GCM is a single AES-NI/VAES accelerated pass per packet, and ECP256 is
+# the cheapest DH group AWS offers for the PFS exchange on every rekey.
+AES_GCM_128 = IpsecProposal(
+    phase1_encryption=(Encryption.AES128_GCM_16,),
+    phase1_integrity=(Integrity.SHA2_256,),
+    phase1_dh_groups=(DhGroup.ECP256,),
+    phase2_encryption=(Encryption.AES128_GCM_16,),
+    phase2_integrity=(),
+    phase2_dh_groups=(DhGroup.ECP256,),
+)
+
+AES_GCM_256 = IpsecProposal(
+    phase1_encryption=(Encryption.AES256_GCM_16,),
+    phase1_integrity=(Integrity.SHA2_384,),
+    phase1_dh_groups=(DhGroup.ECP384,),
+    phase2_encryption=(Encryption.AES256_GCM_16,),
+    phase2_integrity=(),
+    phase2_dh_groups=(DhGroup.ECP384,),
+)
+
+PROPOSALS = {
+    "legacy": LEGACY,
+    "aes-gcm-128": AES_GCM_128,
+    "aes-gcm-256": AES_GCM_256,
+}
+
+# The VPGW defaults, with the CGW rekeying every SA before the VPGW does and
+# the IKE rekeys placed between the CHILD_SA rekeys
+HITLESS_REKEY = RekeyProfile()
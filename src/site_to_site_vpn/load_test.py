@@ -0,0 +1,162 @@
+import argparse
+from dataclasses import dataclass
+import json
+from pathlib import Path
+import re
+import sys
+
+IPERF3_PORT = 5201
+
+# wrk2 latency summary lines, e.g. " 99.900%   12.35ms"
+WRK2_PERCENTILE = re.compile(r"^\s*([\d.]+)%\s+([\d.]+)(us|ms|s|m)\s*$", re.MULTILINE)
+WRK2_UNITS_MS = {"us": 0.001, "ms": 1, "s": 1000, "m": 60_000}
+
+
+@dataclass(frozen=True)
+class LoadTest:
+    # wrk2 keeps a constant request rate, so latency is measured without
+    # coordinated omission while the tunnel is loaded
+    http_rate: int = 2_000
+    connections: int = 64
+    threads: int = 4
+    duration: int = 60
+    iperf3_streams: int = 8
+    iperf3_port: int = IPERF3_PORT
+
+
+@dataclass(frozen=True)
+class LoadTestRun:
+    run_id: str
+    requests_per_second: float
+    latency_ms: dict[float, float]
+    errors: int
+    upload_gbps: float
+    upload_retransmits: int
+    download_gbps: float
+    download_retransmits: int
+
+    @property
+    def p50_ms(self) -> float:
+        return self.latency_ms.get(50.0, 0.0)
+
+    @property
+    def p99_ms(self) -> float:
+        return self.latency_ms.get(99.0, 0.0)
+
+    @property
+    def p999_ms(self) -> float:
+        return self.latency_ms.get(99.9, 0.0)
+
+    @classmethod
+    def from_directory(cls, path: Path) -> "LoadTestRun":
+        # Layout uploaded by the dc-client, see constructs/load_generator.py
+        meta = json.loads((path / "meta.json").read_text())
+        wrk2 = (path / "wrk2.txt").read_text()
+        upload_gbps, upload_retransmits = parse_iperf3(
+            (path / "iperf3.json").read_text()
+        )
+        download_gbps, download_retransmits = parse_iperf3(
+            (path / "iperf3-reverse.json").read_text()
+        )
+        return cls(
+            run_id=meta["run_id"],
+            requests_per_second=parse_wrk2_rate(wrk2),
+            latency_ms=parse_wrk2_latency(wrk2),
+            errors=parse_wrk2_errors(wrk2),
+            upload_gbps=upload_gbps,
+            upload_retransmits=upload_retransmits,
+            download_gbps=download_gbps,
+            download_retransmits=download_retransmits,
+        )
+
+
+def parse_iperf3(output: str) -> tuple[float, int]:
+    # Goodput as seen by the receiver, and the sender's TCP retransmits
+    end = json.loads(output)["end"]
+    return (
+        end["sum_received"]["bits_per_second"] / 1e9,
+        end["sum_sent"].get("retransmits", 0),
+    )
+
+
+def parse_wrk2_latency(output: str) -> dict[float, float]:
+    # Percentile -> latency in ms, from the HdrHistogram summary of --latency
+    section = output.partition("Latency Distribution")[2].partition("Detailed")[0]
+    return {
+        float(percentile): float(value) * WRK2_UNITS_MS[unit]
+        for percentile, value, unit in WRK2_PERCENTILE.findall(section)
+    }
+
+
+def parse_wrk2_rate(output: str) -> float:
+    match = re.search(r"^Requests/sec:\s+([\d.]+)", output, re.MULTILINE)
+    if not match:
+        raise ValueError("No Requests/sec in wrk2 output")
+    return float(match.group(1))
+
+
+def parse_wrk2_errors(output: str) -> int:
+    errors = 0
+    match = re.search(
+        r"Socket errors: connect (\d+), read (\d+), write (\d+), timeout (\d+)",
+        output,
+    )
+    if match:
+        errors += sum(map(int, match.groups()))
+    match = re.search(r"Non-2xx or 3xx responses: (\d+)", output)
+    if match:
+        errors += int(match.group(1))
+    return errors
+
+
+def regressions(
+    runs: list[LoadTestRun], baseline: LoadTestRun, *, tolerance: float
+) -> list[str]:
+    messages = []
+    for run in runs:
+        for metric, before, after, higher_is_better in (
+            ("p99 ms", baseline.p99_ms, run.p99_ms, False),
+            ("p99.9 ms", baseline.p999_ms, run.p999_ms, False),
+            ("upload Gbps", baseline.upload_gbps, run.upload_gbps, True),
+            ("download Gbps", baseline.download_gbps, run.download_gbps, True),
+        ):
+            if higher_is_better:
+                regressed = after < before * (1 - tolerance)
+            else:
+                regressed = after > before * (1 + tolerance)
+            if regressed:
+                messages.append(f"{run.run_id}: {metric} {before:.2f} -> {after:.2f}")
+    return messages
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        prog="python -m site_to_site_vpn.load_test",
+        description="Compare load test runs downloaded from the results bucket",
+    )
+    parser.add_argument(
+        "runs", nargs="+", type=Path, help="run directories, the first is the baseline"
+    )
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    runs = [LoadTestRun.from_directory(path) for path in args.runs]
+    print(
+        f"{'run':<17} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'p99.9 ms':>9} "
+        f"{'errors':>6} {'up Gbps':>8} {'retr':>6} {'down Gbps':>9} {'retr':>6}"
+    )
+    for run in runs:
+        print(
+            f"{run.run_id:<17} {run.requests_per_second:>8.0f} {run.p50_ms:>8.2f} "
+            f"{run.p99_ms:>8.2f} {run.p999_ms:>9.2f} {run.errors:>6} "
+            f"{run.upload_gbps:>8.2f} {run.upload_retransmits:>6} "
+            f"{run.download_gbps:>9.2f} {run.download_retransmits:>6}"
+        )
+
+    messages = regressions(runs[1:], runs[0], tolerance=args.tolerance)
+    if messages:
+        sys.exit("Regressions against the baseline:\n" + "\n".join(messages))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+from itertools import product
+
+from .ipsec import Encryption, Integrity, IpsecProposal
+
+IPV4_HEADER = 20
+IPV6_HEADER = 40
+TCP_HEADER = 20
+UDP_HEADER = 8
+# SPI + sequence number
+ESP_HEADER = 8
+# Pad length + next header
+ESP_TRAILER = 2
+
+# Internet facing ENIs have a 1500 byte MTU, jumbo frames stop at the IGW
+DEFAULT_UNDERLAY_MTU = 1500
+
+_IV_SIZE = {
+    Encryption.AES128: 16,
+    Encryption.AES256: 16,
+    Encryption.AES128_GCM_16: 8,
+    Encryption.AES256_GCM_16: 8,
+}
+
+# ESP pads payload + trailer to the cipher block size, AEAD modes to 4 bytes
+_BLOCK_SIZE = {
+    Encryption.AES128: 16,
+    Encryption.AES256: 16,
+    Encryption.AES128_GCM_16: 4,
+    Encryption.AES256_GCM_16: 4,
+}
+
+# Truncated HMAC lengths as used by ESP (RFC 2404, RFC 4868)
+_ICV_SIZE = {
+    Integrity.SHA1: 12,
+    Integrity.SHA2_256: 16,
+    Integrity.SHA2_384: 24,
+    Integrity.SHA2_512: 32,
+}
+
+AEAD_ICV_SIZE = 16
+
+
+def max_inner_packet(
+    encryption: Encryption,
+    integrity: Integrity | None,
+    *,
+    underlay_mtu: int = DEFAULT_UNDERLAY_MTU,
+    nat_traversal: bool = True,
+) -> int:
+    if encryption.aead:
+        icv = AEAD_ICV_SIZE
+    elif integrity is None:
+        raise ValueError(f"{encryption.value} requires an integrity algorithm")
+    else:
+        icv = _ICV_SIZE[integrity]
+    available = (
+        underlay_mtu
+        - IPV4_HEADER
+        - (UDP_HEADER if nat_traversal else 0)
+        - ESP_HEADER
+        - _IV_SIZE[encryption]
+        - icv
+    )
+    block = _BLOCK_SIZE[encryption]
+    return available // block * block - ESP_TRAILER
+
+
+def tunnel_mtu(
+    proposal: IpsecProposal,
+    *,
+    underlay_mtu: int = DEFAULT_UNDERLAY_MTU,
+    nat_traversal: bool = True,
+) -> int:
+    # Any of the proposed transforms may be negotiated, size for the worst one
+    integrity: tuple[Integrity | None, ...] = proposal.phase2_integrity or (None,)
+    return min(
+        max_inner_packet(
+            encryption,
+            None if encryption.aead else algorithm,
+            underlay_mtu=underlay_mtu,
+            nat_traversal=nat_traversal,
+        )
+        for encryption, algorithm in product(proposal.phase2_encryption, integrity)
+    )
+
+
+def tcp_mss(mtu: int, *, ipv6: bool = False) -> int:
+    return mtu - (IPV6_HEADER if ipv6 else IPV4_HEADER) - TCP_HEADER
@@ -0,0 +1,100 @@
+from dataclasses import dataclass
+import ipaddress
+import os
+from pathlib import Path
+from typing import Mapping
+import urllib.request
+import weakref
+
+from constructs import Construct
+
+# CDK context keys (cdk synth -c admin_cidr=203.0.113.7/32) and the env vars
+# used when the context is unset
+ADMIN_CIDR_CONTEXT = "admin_cidr"
+SSH_PUBLIC_KEY_CONTEXT = "ssh_public_key"
+OFFLINE_CONTEXT = "offline"
+ADMIN_CIDR_ENV = "VPN_ADMIN_CIDR"
+SSH_PUBLIC_KEY_ENV = "VPN_SSH_PUBLIC_KEY"
+OFFLINE_ENV = "VPN_OFFLINE"
+
+CHECKIP_URL = "https://checkip.amazonaws.com"
+CHECKIP_TIMEOUT = 5
+
+# One resolution per app, however many stacks and instances ask for it
+_resolved: "weakref.WeakKeyDictionary[Construct, OperatorContext]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+@dataclass(frozen=True)
+class OperatorContext:
+    # Who administers the instances: SSH is opened to admin_cidr and
+    # ssh_public_key is installed as the key pair. Either may be None, the
+    # instances stay reachable over SSM Session Manager.
+    admin_cidr: str | None = None
+    ssh_public_key: str | None = None
+
+    def __post_init__(self):
+        if self.admin_cidr and not isinstance(
+            ipaddress.ip_network(self.admin_cidr), ipaddress.IPv4Network
+        ):
+            raise ValueError(
+                f"Only IPv4 admin CIDRs are supported, got {self.admin_cidr}"
+            )
+
+    @classmethod
+    def of(cls, scope: Construct) -> "OperatorContext":
+        root = scope.node.root
+        if root not in _resolved:
+            _resolved[root] = cls.resolve(scope)
+        return _resolved[root]
+
+    @classmethod
+    def resolve(
+        cls, scope: Construct, *, environ: Mapping[str, str] = os.environ
+    ) -> "OperatorContext":
+        # The settings, then (unless offline) a lookup of this machine's
+        # public IP
+        settings = cls.settings(scope, environ=environ)
+        admin_cidr = settings["admin_cidr"]
+        if not settings["offline"] and not admin_cidr:
+            admin_cidr = f"{_public_ip()}/32"
+        return cls(admin_cidr=admin_cidr, ssh_public_key=settings["ssh_public_key"])
+
+    @staticmethod
+    def settings(
+        scope: Construct, *, environ: Mapping[str, str] = os.environ
+    ) -> dict[str, str | bool | None]:
+        # CDK context, then env, then (unless offline) this machine's first
+        # SSH public key. Everything but the network lookup, so a synth cache
+        # can key on it without resolving.
+        def setting(context_key: str, env: str) -> str | None:
+            return scope.node.try_get_context(context_key) or environ.get(env)
+
+        offline = str(setting(OFFLINE_CONTEXT, OFFLINE_ENV) or "").lower() in (
+            "1",
+            "true",
+            "yes",
+        )
+        ssh_public_key = setting(SSH_PUBLIC_KEY_CONTEXT, SSH_PUBLIC_KEY_ENV)
+        if not offline:
+            ssh_public_key = ssh_public_key or _local_public_key()
+        if ssh_public_key and not ssh_public_key.startswith(("ssh-", "ecdsa-")):
+            # A path to a .pub file
+            ssh_public_key = Path(ssh_public_key).expanduser().read_text().strip()
+        return dict(
+            offline=offline,
+            admin_cidr=setting(ADMIN_CIDR_CONTEXT, ADMIN_CIDR_ENV),
+            ssh_public_key=ssh_public_key,
+        )
+
+
+def _public_ip() -> str:
+    with urllib.request.urlopen(CHECKIP_URL, timeout=CHECKIP_TIMEOUT) as response:
+        return response.read().decode("utf-8").strip()
+
+
+def _local_public_key() -> str | None:
+    # Sorted so the same machine always picks the same key
+    pub_files = sorted((Path.home() / ".ssh").glob("*.pub"))
+    return pub_files[0].read_text().strip() if pub_files else None
@@ -0,0 +1,228 @@
+import argparse
+from dataclasses import dataclass
+import json
+import os
+import socket
+import struct
+import threading
+import time
+
+# Active probing across the tunnel. The reflector on the web server echoes UDP
+# probes and accepts TCP connections, the prober on the datacenter side sends
+# timestamped UDP, ICMP echo and TCP connect probes and reports RTT percentiles,
+# jitter and loss per tumbling window as CloudWatch EMF. Installed as a
+# standalone script, so it only uses the standard library.
+NAMESPACE = "SiteToSiteVpn/Prober"
+EMF_ENDPOINT = ("127.0.0.1", 25888)
+PROTOCOLS = ("udp", "icmp", "tcp")
+PROBE = struct.Struct("!QQ")  # sequence number, send time in ns
+ICMP_ECHO_REQUEST, ICMP_ECHO_REPLY = 8, 0
+
+
+@dataclass(frozen=True)
+class LatencyProbe:
+    port: int = 7007
+    interval: float = 1
+    timeout: float = 0.5
+    window: int = 60
+    # Alarm when the p99 RTT or the loss of a window exceeds the SLO in
+    # 3 out of 5 windows
+    rtt_p99_slo_ms: float = 20
+    loss_slo_percent: float = 1
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def summarize(rtts: list[float], sent: int) -> dict[str, float]:
+    # Loss and, if any probe came back, RTT percentiles and jitter (mean
+    # difference between consecutive RTTs, RFC 3393 IPDV) in ms
+    summary = dict(Probes=sent, Loss=100 * (sent - len(rtts)) / sent if sent else 0)
+    if rtts:
+        summary.update(
+            RttP50=percentile(rtts, 50),
+            RttP90=percentile(rtts, 90),
+            RttP99=percentile(rtts, 99),
+            RttMax=max(rtts),
+            Jitter=(
+                sum(abs(b - a) for a, b in zip(rtts, rtts[1:])) / (len(rtts) - 1)
+                if len(rtts) > 1
+                else 0
+            ),
+        )
+    return summary
+
+
+def emf_document(
+    summary: dict,
+    dimensions: dict[str, str],
+    *,
+    timestamp: float,
+    log_group: str,
+    window: int = LatencyProbe.window,
+) -> dict:
+    units = dict(Probes="Count", Loss="Percent")
+    # Periods below 60s only aggregate high resolution metrics
+    resolution = 1 if window < 60 else 60
+    return {
+        "_aws": {
+            "Timestamp": int(timestamp * 1000),
+            "LogGroupName": log_group,
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": NAMESPACE,
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": [
+                        dict(
+                            Name=name,
+                            Unit=units.get(name, "Milliseconds"),
+                            StorageResolution=resolution,
+                        )
+                        for name in summary
+                    ],
+                }
+            ],
+        },
+        **dimensions,
+        **summary,
+    }
+
+
+def icmp_checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    return ~(total + (total >> 16)) & 0xFFFF
+
+
+def icmp_echo(identifier: int, sequence: int, payload: bytes) -> bytes:
+    header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, identifier, sequence)
+    checksum = icmp_checksum(header + payload)
+    header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum, identifier, sequence)
+    return header + payload
+
+
+class Prober:
+    def __init__(self, target: str, port: int, timeout: float):
+        self.target, self.port, self.timeout = target, port, timeout
+        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp.connect((target, port))
+        self.icmp = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+        self.identifier = os.getpid() & 0xFFFF
+
+    def probe(self, protocol: str, sequence: int) -> float | None:
+        # RTT in ms, None if the probe was lost
+        start = time.monotonic_ns()
+        deadline = time.monotonic() + self.timeout
+        payload = PROBE.pack(sequence, start)
+        if protocol == "tcp":
+            try:
+                socket.create_connection((self.target, self.port), self.timeout).close()
+            except OSError:
+                return None
+            return (time.monotonic_ns() - start) / 1e6
+        # A pending ICMP port unreachable fails the next send on the connected
+        # UDP socket, and a flapping tunnel fails both with ENETUNREACH or
+        # EHOSTUNREACH. Either way the probe is lost.
+        try:
+            if protocol == "udp":
+                sock = self.udp
+                sock.send(payload)
+            else:
+                sock = self.icmp
+                sock.sendto(
+                    icmp_echo(self.identifier, sequence & 0xFFFF, payload),
+                    (self.target, 0),
+                )
+        except OSError:
+            return None
+        # Skip late replies of earlier probes and unrelated ICMP
+        while (remaining := deadline - time.monotonic()) > 0:
+            sock.settimeout(remaining)
+            try:
+                data = sock.recv(1024)
+            except OSError:
+                return None
+            if protocol == "icmp":
+                data = data[(data[0] & 0x0F) * 4 :]  # strip the IP header
+                kind, _, _, identifier, _ = struct.unpack("!BBHHH", data[:8])
+                if kind != ICMP_ECHO_REPLY or identifier != self.identifier:
+                    continue
+                data = data[8:]
+            if data[: PROBE.size] == payload:
+                return (time.monotonic_ns() - start) / 1e6
+        return None
+
+
+def reflect(port: int):
+    def accept(listener: socket.socket):
+        while True:
+            listener.accept()[0].close()
+
+    listener = socket.create_server(("0.0.0.0", port))
+    threading.Thread(target=accept, args=(listener,), daemon=True).start()
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp.bind(("0.0.0.0", port))
+    while True:
+        data, address = udp.recvfrom(1024)
+        udp.sendto(data, address)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description="Probe latency and loss across the VPN"
+    )
+    parser.add_argument("--reflect", action="store_true", help="run the reflector")
+    parser.add_argument("--target", help="IP of the reflector")
+    parser.add_argument("--source-name", default=socket.gethostname())
+    parser.add_argument("--target-name")
+    parser.add_argument("--port", type=int, default=LatencyProbe.port)
+    parser.add_argument("--interval", type=float, default=LatencyProbe.interval)
+    parser.add_argument("--timeout", type=float, default=LatencyProbe.timeout)
+    parser.add_argument("--window", type=int, default=LatencyProbe.window)
+    parser.add_argument("--log-group", default="/vpn/prober/metrics")
+    parser.add_argument("--stdout", action="store_true", help="print instead of EMF")
+    args = parser.parse_args(argv)
+    if args.reflect:
+        return reflect(args.port)
+    if not args.target:
+        parser.error("--target is required unless --reflect")
+
+    prober = Prober(args.target, args.port, args.timeout)
+    emf = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sequence, window_start = 0, time.monotonic()
+    rtts = {protocol: [] for protocol in PROTOCOLS}
+    while True:
+        sequence += 1
+        for protocol in PROTOCOLS:
+            rtt = prober.probe(protocol, sequence)
+            if rtt is not None:
+                rtts[protocol].append(rtt)
+        if time.monotonic() - window_start >= args.window:
+            for protocol in PROTOCOLS:
+                summary = summarize(rtts[protocol], sequence)
+                document = emf_document(
+                    summary,
+                    dict(
+                        Source=args.source_name,
+                        Target=args.target_name or args.target,
+                        Protocol=protocol,
+                    ),
+                    timestamp=time.time(),
+                    log_group=args.log_group,
+                    window=args.window,
+                )
+                if args.stdout:
+                    print(json.dumps(document), flush=True)
+                else:
+                    emf.sendto(json.dumps(document).encode(), EMF_ENDPOINT)
+            sequence, window_start = 0, time.monotonic()
+            rtts = {protocol: [] for protocol in PROTOCOLS}
+        time.sleep(max(0, args.interval - (time.monotonic() % args.interval)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+from fnmatch import fnmatchcase
+import hashlib
+import importlib.metadata
+import json
+import os
+from pathlib import Path
+import shutil
+import types
+from typing import Callable
+
+from aws_cdk import App, Stack
+
+# CDK context key selecting the stacks to build, e.g.
+# cdk deploy dc-gw -c stacks=dc-gw (comma separated, globs allowed)
+STACKS_CONTEXT = "stacks"
+# cdk synth -c synth_cache=false always builds and synthesizes
+CACHE_CONTEXT = "synth_cache"
+DEFAULT_CACHE_DIR = Path(".cdk-cache")
+CACHE_ENTRIES = 8
+
+StackFactory = Callable[["StackRegistry"], Stack]
+
+
+class StackRegistry:
+    # Stacks are registered as factories and only instantiated when selected
+    # or needed by a selected stack. Each stack has an input key: a hash of
+    # its factory's code, the app globals it reads, the app and package
+    # sources, the CDK version, the app context, and the keys of its
+    # dependencies. A selection
+    # whose keys all match an earlier synth reuses that cloud assembly
+    # without building or synthesizing anything.
+    def __init__(
+        self,
+        app: App,
+        *,
+        shared_inputs: tuple = (),
+        cache_dir: Path | None = DEFAULT_CACHE_DIR,
+    ):
+        self.app = app
+        self.shared_inputs = shared_inputs
+        self.cache_dir = cache_dir
+        self._factories: dict[str, StackFactory] = {}
+        self._depends_on: dict[str, tuple[str, ...]] = {}
+        self._stacks: dict[str, Stack] = {}
+        self._keys: dict[str, str] = {}
+        self._shared_digest: str | None = None
+        self._building: list[str] = []
+
+    @property
+    def names(self) -> list[str]:
+        return list(self._factories)
+
+    def stack(self, name: str, *, depends_on: tuple[str, ...] = ()):
+        def register(factory: StackFactory) -> StackFactory:
+            if name in self._factories:
+                raise ValueError(f"Stack {name} is already registered")
+            self._factories[name] = factory
+            self._depends_on[name] = tuple(depends_on)
+            return factory
+
+        return register
+
+    def get(self, name: str) -> Stack:
+        if self._building and name not in self._depends_on[self._building[-1]]:
+            raise ValueError(
+                f"{self._building[-1]} uses {name}, add it to its depends_on"
+            )
+        if name not in self._factories:
+            raise ValueError(f"Unknown stack {name}")
+        if name not in self._stacks:
+            self._building.append(name)
+            try:
+                stack = self._factories[name](self)
+            finally:
+                self._building.pop()
+            if stack.node.id != name:
+                raise ValueError(f"The factory of {name} built {stack.node.id}")
+            self._stacks[name] = stack
+        return self._stacks[name]
+
+    def closure(self, selection: list[str]) -> list[str]:
+        # Selected stacks and their dependencies, dependencies first
+        ordered: list[str] = []
+
+        def visit(name: str):
+            if name not in ordered:
+                for dependency in self._depends_on[name]:
+                    visit(dependency)
+                ordered.append(name)
+
+        for pattern in selection:
+            matches = [name for name in self._factories if fnmatchcase(name, pattern)]
+            if not matches:
+                raise ValueError(
+                    f"No stack matches {pattern}, choose from {', '.join(self.names)}"
+                )
+            for name in matches:
+                visit(name)
+        return ordered
+
+    def selection(self) -> list[str]:
+        selected = self.app.node.try_get_context(STACKS_CONTEXT)
+        if not selected:
+            return self.names
+        if isinstance(selected, str):
+            selected = selected.split(",")
+        return [name.strip() for name in selected if name.strip()]
+
+    def input_key(self, name: str) -> str:
+        if name not in self._keys:
+            if self._shared_digest is None:
+                self._shared_digest = _shared_digest(
+                    self.shared_inputs,
+                    context=self.app.node.get_all_context(),
+                    app_sources={
+                        Path(factory.__code__.co_filename)
+                        for factory in self._factories.values()
+                    },
+                )
+            digest = hashlib.sha256(self._shared_digest.encode())
+            digest.update(name.encode())
+            factory = self._factories[name]
+            digest.update(_code_digest(factory.__code__).encode())
+            for global_name in sorted(_global_names(factory.__code__)):
+                if global_name in factory.__globals__:
+                    value = factory.__globals__[global_name]
+                    digest.update(f"{global_name}={_stable_repr(value)}".encode())
+            for dependency in self._depends_on[name]:
+                digest.update(self.input_key(dependency).encode())
+            self._keys[name] = digest.hexdigest()
+        return self._keys[name]
+
+    def synth(self, selection: list[str] | None = None):
+        names = self.closure(selection or self.selection())
+        outdir = Path(self.app.outdir)
+        cached = None
+        use_cache = str(self.app.node.try_get_context(CACHE_CONTEXT)).lower() not in (
+            "0",
+            "false",
+            "no",
+        )
+        if self.cache_dir and use_cache:
+            key = hashlib.sha256(
+                "".join(f"{name}={self.input_key(name)}" for name in names).encode()
+            ).hexdigest()
+            cached = self.cache_dir / key
+            if (cached / "manifest.json").exists():
+                shutil.copytree(cached, outdir, dirs_exist_ok=True)
+                os.utime(cached)
+                return None
+        for name in names:
+            self.get(name)
+        assembly = self.app.synth()
+        if cached:
+            partial = cached.with_suffix(".partial")
+            shutil.rmtree(partial, ignore_errors=True)
+            shutil.copytree(outdir, partial)
+            shutil.rmtree(cached, ignore_errors=True)
+            partial.rename(cached)
+            self._prune()
+        return assembly
+
+    def _prune(self):
+        entries = sorted(
+            (entry for entry in self.cache_dir.iterdir() if entry.is_dir()),
+            key=lambda entry: entry.stat().st_mtime,
+            reverse=True,
+        )
+        for entry in entries[CACHE_ENTRIES:]:
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+def _shared_digest(
+    shared_inputs: tuple, *, context: dict, app_sources: set[Path]
+) -> str:
+    # Everything every stack depends on: the app and package sources, the CDK
+    # version, the app context (cdk.json, -c and what the app sets itself),
+    # the CDK environment and the app wide inputs. The whole app source is
+    # hashed since module level code, e.g. app.node.set_context, changes
+    # stacks without going through a factory.
+    digest = hashlib.sha256(importlib.metadata.version("aws-cdk-lib").encode())
+    for path in sorted(app_sources):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    package = Path(__file__).parent
+    for path in sorted(package.rglob("*.py")):
+        digest.update(str(path.relative_to(package)).encode())
+        digest.update(path.read_bytes())
+    digest.update(json.dumps(context, sort_keys=True, default=str).encode())
+    for variable, value in sorted(os.environ.items()):
+        if variable.startswith("CDK_") and variable != "CDK_OUTDIR":
+            digest.update(f"{variable}={value}".encode())
+    for value in shared_inputs:
+        digest.update(_stable_repr(value).encode())
+    return digest.hexdigest()
+
+
+def _code_digest(code: types.CodeType) -> str:
+    # Bytecode, names and constants without line numbers, so moving a factory
+    # around in app.py keeps its key
+    digest = hashlib.sha256(code.co_code)
+    digest.update(repr(code.co_names).encode())
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            digest.update(_code_digest(constant).encode())
+        else:
+            digest.update(repr(constant).encode())
+    return digest.hexdigest()
+
+
+def _global_names(code: types.CodeType) -> set[str]:
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            names |= _global_names(constant)
+    return names
+
+
+def _stable_repr(value) -> str:
+    # Modules, classes and functions are covered by the package sources, other
+    # objects by their repr unless it is only an address
+    if isinstance(value, types.ModuleType):
+        return value.__name__
+    if isinstance(value, (type, types.FunctionType)):
+        return f"{getattr(value, '__module__', '')}.{value.__qualname__}"
+    text = repr(value)
+    if " at 0x" in text:
+        return type(value).__qualname__
+    return text
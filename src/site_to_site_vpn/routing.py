@@ -0,0 +1,142 @@
+import argparse
+from dataclasses import dataclass
+import ipaddress
+from itertools import product
+import json
+
+ANY = "0.0.0.0/0"
+
+# Default quotas: static routes of a VPN connection and routes of a route
+# table, of which the local and the default route are always taken
+VPN_STATIC_ROUTE_QUOTA = 100
+ROUTE_TABLE_QUOTA = 50
+RESERVED_ROUTES = 2
+
+
+@dataclass(frozen=True)
+class RoutePlan:
+    # Prefixes of the datacenter (site) side and of the VPC side. Every route,
+    # traffic selector and firewall rule between the two is derived from the
+    # collapsed prefixes, so adding a prefix keeps all of them consistent.
+    site_cidrs: tuple[str, ...]
+    vpc_cidrs: tuple[str, ...]
+
+    def __post_init__(self):
+        for field in ("site_cidrs", "vpc_cidrs"):
+            if not getattr(self, field):
+                raise ValueError(f"RoutePlan.{field} must not be empty")
+            for cidr in getattr(self, field):
+                if not isinstance(ipaddress.ip_network(cidr), ipaddress.IPv4Network):
+                    raise ValueError(f"Only IPv4 networks are supported, got {cidr}")
+        overlaps = [
+            f"{site} and {vpc}"
+            for site, vpc in product(self._site_networks, self._vpc_networks)
+            if site.overlaps(vpc)
+        ]
+        if overlaps:
+            raise ValueError(f"Site and VPC prefixes overlap: {', '.join(overlaps)}")
+        if len(self.site_prefixes) > VPN_STATIC_ROUTE_QUOTA:
+            raise ValueError(
+                f"{len(self.site_prefixes)} site prefixes exceed the "
+                f"{VPN_STATIC_ROUTE_QUOTA} static routes of a VPN connection"
+            )
+        for side, prefixes in (
+            ("site", self.site_prefixes),
+            ("VPC", self.vpc_prefixes),
+        ):
+            if len(prefixes) > ROUTE_TABLE_QUOTA - RESERVED_ROUTES:
+                raise ValueError(
+                    f"{len(prefixes)} {side} prefixes exceed the "
+                    f"{ROUTE_TABLE_QUOTA} routes of a route table"
+                )
+
+    @property
+    def _site_networks(self) -> list[ipaddress.IPv4Network]:
+        return _collapse(self.site_cidrs)
+
+    @property
+    def _vpc_networks(self) -> list[ipaddress.IPv4Network]:
+        return _collapse(self.vpc_cidrs)
+
+    @property
+    def site_prefixes(self) -> list[str]:
+        # Adjacent and nested prefixes merged into the fewest supernets
+        return [str(network) for network in self._site_networks]
+
+    @property
+    def vpc_prefixes(self) -> list[str]:
+        return [str(network) for network in self._vpc_networks]
+
+    @property
+    def vpn_static_routes(self) -> list[str]:
+        # Routes of a static VPN connection towards the site
+        return self.site_prefixes
+
+    @property
+    def vpc_routes(self) -> list[str]:
+        # Destinations of the VPC route tables pointing at the VGW or TGW
+        return self.site_prefixes
+
+    @property
+    def dc_routes(self) -> list[str]:
+        # Destinations of the datacenter route tables pointing at the CGW
+        return self.vpc_prefixes
+
+    @property
+    def cgw_routes(self) -> list[str]:
+        # Kernel routes of the CGW over its VTIs
+        return self.vpc_prefixes
+
+    @property
+    def traffic_selectors(self) -> tuple[str, str]:
+        # AWS endpoints negotiate a single SA pair per tunnel, so each side is
+        # one prefix: the smallest supernet of its prefixes if that stays
+        # clear of the other side, otherwise 0.0.0.0/0 and the VTI routes
+        # decide what enters the tunnel
+        return (
+            _selector(self._site_networks, self._vpc_networks),
+            _selector(self._vpc_networks, self._site_networks),
+        )
+
+
+def _collapse(cidrs: tuple[str, ...]) -> list[ipaddress.IPv4Network]:
+    return list(ipaddress.collapse_addresses(map(ipaddress.IPv4Network, cidrs)))
+
+
+def _selector(
+    networks: list[ipaddress.IPv4Network], avoid: list[ipaddress.IPv4Network]
+) -> str:
+    supernet = networks[0]
+    while not all(network.subnet_of(supernet) for network in networks):
+        supernet = supernet.supernet()
+    if any(supernet.overlaps(network) for network in avoid):
+        return ANY
+    return str(supernet)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description="Plan the routes and traffic selectors between site and VPC"
+    )
+    parser.add_argument("--site", action="append", required=True, help="site CIDR")
+    parser.add_argument("--vpc", action="append", required=True, help="VPC CIDR")
+    args = parser.parse_args(argv)
+    plan = RoutePlan(site_cidrs=tuple(args.site), vpc_cidrs=tuple(args.vpc))
+    local_ts, remote_ts = plan.traffic_selectors
+    print(
+        json.dumps(
+            dict(
+                vpn_static_routes=plan.vpn_static_routes,
+                vpc_routes=plan.vpc_routes,
+                dc_routes=plan.dc_routes,
+                cgw_routes=plan.cgw_routes,
+                local_ts=local_ts,
+                remote_ts=remote_ts,
+            ),
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
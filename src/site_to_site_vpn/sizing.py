@@ -0,0 +1,116 @@
+from dataclasses import dataclass
+
+from .constructs.constants import Ubuntu
+
+# Conservative AES-GCM ESP throughput of one vCPU including NAT-T
+# encapsulation. Without pcrypt (the STARTER backend) the kernel processes
+# every SA on one vCPU, with pcrypt (SWANCTL) an SA is spread over all vCPUs.
+ESP_GBPS_PER_VCPU = 1.5
+
+# AWS does not publish PPS allowances. Planning estimate per ENA queue pair,
+# one queue pair per vCPU up to the ENA limit of 32.
+ESTIMATED_PPS_PER_QUEUE = 250_000
+MAX_ENA_QUEUES = 32
+
+
+@dataclass(frozen=True)
+class InstanceSize:
+    instance_type: str
+    vcpus: int
+    # Sustained bandwidth; burst bandwidth is only available while credits last
+    baseline_gbps: float
+    burst_gbps: float
+    arm: bool = False
+    ena_express: bool = False
+
+    @property
+    def family(self) -> str:
+        return self.instance_type.split(".")[0]
+
+    @property
+    def ami_id(self) -> str:
+        return (Ubuntu.ARM if self.arm else Ubuntu.X86).value
+
+    @property
+    def estimated_pps(self) -> int:
+        return min(self.vcpus, MAX_ENA_QUEUES) * ESTIMATED_PPS_PER_QUEUE
+
+    def esp_gbps(self, *, sas: int = 1, parallel: bool = False) -> float:
+        # ESP capacity over `sas` SAs, parallel when pcrypt spreads each of
+        # them over all vCPUs
+        return (self.vcpus if parallel else min(self.vcpus, sas)) * ESP_GBPS_PER_VCPU
+
+
+# Network bandwidth of the EC2 instance types considered for gateways, see
+# https://docs.aws.amazon.com/ec2/latest/instancetypes/ (network specifications)
+INSTANCE_SIZES = {
+    size.instance_type: size
+    for size in (
+        InstanceSize("m7a.large", 2, 0.781, 12.5),
+        InstanceSize("m7a.xlarge", 4, 1.562, 12.5),
+        InstanceSize("m7a.2xlarge", 8, 3.125, 12.5),
+        InstanceSize("m7a.4xlarge", 16, 6.25, 12.5),
+        InstanceSize("m7a.8xlarge", 32, 12.5, 12.5),
+        InstanceSize("m7a.12xlarge", 48, 18.75, 18.75),
+        InstanceSize("m7a.16xlarge", 64, 25, 25),
+        InstanceSize("m7a.24xlarge", 96, 37.5, 37.5),
+        InstanceSize("m7a.32xlarge", 128, 50, 50),
+        InstanceSize("m7a.48xlarge", 192, 50, 50),
+        InstanceSize("c6in.large", 2, 3.125, 25),
+        InstanceSize("c6in.xlarge", 4, 6.25, 30),
+        InstanceSize("c6in.2xlarge", 8, 12.5, 40),
+        InstanceSize("c6in.4xlarge", 16, 25, 50),
+        InstanceSize("c6in.8xlarge", 32, 50, 50),
+        InstanceSize("c6in.12xlarge", 48, 75, 75),
+        InstanceSize("c6in.16xlarge", 64, 100, 100),
+        InstanceSize("c6in.24xlarge", 96, 150, 150),
+        InstanceSize("c6in.32xlarge", 128, 200, 200, ena_express=True),
+        InstanceSize("c7gn.medium", 1, 3.125, 25, arm=True),
+        InstanceSize("c7gn.large", 2, 6.25, 30, arm=True),
+        InstanceSize("c7gn.xlarge", 4, 12.5, 40, arm=True),
+        InstanceSize("c7gn.2xlarge", 8, 25, 50, arm=True),
+        InstanceSize("c7gn.4xlarge", 16, 50, 50, arm=True),
+        InstanceSize("c7gn.8xlarge", 32, 100, 100, arm=True),
+        InstanceSize("c7gn.12xlarge", 48, 150, 150, arm=True),
+        InstanceSize("c7gn.16xlarge", 64, 200, 200, arm=True, ena_express=True),
+    )
+}
+
+# Network optimized families first, m7a is what the project used by hand
+FAMILY_PREFERENCE = ("c7gn", "c6in", "m7a")
+
+
+def select_instance_size(
+    throughput_gbps: float,
+    pps: int,
+    *,
+    ipsec_sas: int = 0,
+    parallel_esp: bool = False,
+    allow_arm: bool = True,
+    families: tuple[str, ...] = FAMILY_PREFERENCE,
+) -> InstanceSize:
+    # Smallest instance whose sustained bandwidth, PPS and, for gateways
+    # terminating ipsec_sas SAs, ESP capacity all cover the target, so
+    # production traffic never runs on burst credits
+    candidates = [
+        size
+        for size in INSTANCE_SIZES.values()
+        if size.family in families
+        and (allow_arm or not size.arm)
+        and size.baseline_gbps >= throughput_gbps
+        and size.estimated_pps >= pps
+        and (
+            not ipsec_sas
+            or size.esp_gbps(sas=ipsec_sas, parallel=parallel_esp) >= throughput_gbps
+        )
+    ]
+    if not candidates:
+        raise ValueError(
+            f"No instance in {families} sustains {throughput_gbps} Gbps and {pps} PPS"
+            + (
+                f" over {ipsec_sas} SA(s) without parallel ESP"
+                if ipsec_sas and not parallel_esp
+                else ""
+            )
+        )
+    return min(candidates, key=lambda size: (size.vcpus, families.index(size.family)))
@@ -1,14 +1,35 @@
 from aws_cdk import CfnOutput, Stack
 import aws_cdk.aws_ec2 as ec2
+import aws_cdk.aws_iam as iam
+import aws_cdk.aws_s3 as s3
 from constructs import Construct
 
+from ..constructs.caching_proxy import CachingProxy
 from ..constructs.ec2 import Instance
-from ..constructs.customer_gateway import CustomerGateway
-from ..constructs.constants import Ubuntu
+from ..constructs.customer_gateway import CustomerGateway, IpsecBackend
+from ..constructs.golden_image import GoldenImage
+from ..constructs import load_generator
+from ..constructs.latency_prober import LatencyProber
+from ..constructs.vpn_connection import VpnConnection
+from ..ipsec import AES_GCM_128, HITLESS_REKEY, IpsecProposal, RekeyProfile
+from ..load_test import LoadTest
+from ..prober import LatencyProbe
+from ..routing import RoutePlan
+from ..sizing import INSTANCE_SIZES, InstanceSize
+from ..wan_cache import WanCache
 
 
 class DatacenterVPCStack(Stack):
-    def __init__(self, scope: Construct, id: str, *, cidr: str, **kwargs) -> None:
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        *,
+        cidr: str,
+        gateway_count: int = 1,
+        vpc_name: str = "datacenter",
+        **kwargs,
+    ) -> None:
         super().__init__(scope, id, **kwargs)
 
         # The code that defines your stack goes here
@@ -16,7 +37,7 @@ class DatacenterVPCStack(Stack):
         self.vpc = ec2.Vpc(
             self,
             "VPC",
-            vpc_name="datacenter",
+            vpc_name=vpc_name,
             max_azs=3,
             ip_addresses=ec2.IpAddresses.cidr(cidr),
             # configuration will create 3 groups in 2 AZs = 6 subnets.
@@ -36,18 +57,39 @@ class DatacenterVPCStack(Stack):
             # nat_gateway_provider=ec2.NatProvider.gateway(),
             nat_gateways=2,
         )
-        self.vpc.add_gateway_endpoint(
+        self.s3_endpoint = self.vpc.add_gateway_endpoint(
             "S3Endpoint", service=ec2.GatewayVpcEndpointAwsService.S3
         )
         self.vpc.add_gateway_endpoint(
             "DynamoDbEndpoint", service=ec2.GatewayVpcEndpointAwsService.DYNAMODB
         )
 
-        customer_gateway_public_ip = ec2.CfnEIP(self, "CustomerGatewayElasticIpv4")
-        self.customer_gateway_public_ip = customer_gateway_public_ip.attr_public_ip
+        customer_gateway_public_ips = [
+            ec2.CfnEIP(
+                self,
+                (
+                    "CustomerGatewayElasticIpv4"
+                    if index == 0
+                    else f"CustomerGateway{index + 1}ElasticIpv4"
+                ),
+            )
+            for index in range(gateway_count)
+        ]
+        self.customer_gateway_public_ips = [
+            eip.attr_public_ip for eip in customer_gateway_public_ips
+        ]
+        self.customer_gateway_public_ip_allocation_ids = [
+            eip.attr_allocation_id for eip in customer_gateway_public_ips
+        ]
+        self.customer_gateway_public_ip = self.customer_gateway_public_ips[0]
         self.customer_gateway_public_ip_allocation_id = (
-            customer_gateway_public_ip.attr_allocation_id
+            self.customer_gateway_public_ip_allocation_ids[0]
+        )
+        # Keeps the CGW and the clients behind it on the same network spine
+        self.placement_group = ec2.PlacementGroup(
+            self, "PlacementGroup", strategy=ec2.PlacementGroupStrategy.CLUSTER
         )
+        self.placement_group_name = self.placement_group.placement_group_name
         CfnOutput(self, "VPCId", value=self.vpc.vpc_id)
 
 
@@ -57,30 +99,56 @@ class DatacenterCustomerGatewayStack(Stack):
         scope: Construct,
         id: str,
         dc_vpc: ec2.Vpc,
-        cgw_eip_allocation_id: str,
-        vpgw_tun1_public_ip: str,
-        tun1_pre_shared_key: str,
-        cgw_tun1_link_local_ip: str,
-        vpgw_tun1_link_local_ip: str,
-        vpc_cidr: str,
-        dc_cidr: str,
+        cgw_eip_allocation_ids: list[str],
+        vpn_connections: list[VpnConnection],
+        routes: RoutePlan,
+        proposal: IpsecProposal = AES_GCM_128,
+        rekey: RekeyProfile = HITLESS_REKEY,
+        ipsec_backend: IpsecBackend = IpsecBackend.STARTER,
+        gateway_size: InstanceSize = INSTANCE_SIZES["m7a.xlarge"],
+        placement_group_name: str | None = None,
+        golden_image: GoldenImage | None = None,
+        name: str = "customer-gateway",
         **kwargs,
     ) -> None:
         super().__init__(scope, id, **kwargs)
+        if len(cgw_eip_allocation_ids) != len(vpn_connections):
+            raise ValueError("Every customer gateway needs one EIP and VPN connection")
 
-        self.customer_gateway = CustomerGateway(
-            self,
-            "CustomerGateway",
-            dc_vpc=dc_vpc,
-            dc_public_subnet=dc_vpc.public_subnets[0],
-            cgw_eip_allocation_id=cgw_eip_allocation_id,
-            vpgw_tun1_public_ip=vpgw_tun1_public_ip,
-            tun1_pre_shared_key=tun1_pre_shared_key,
-            cgw_tun1_link_local_inner_ip=cgw_tun1_link_local_ip,
-            vpgw_tun1_link_local_inner_ip=vpgw_tun1_link_local_ip,
-            vpc_cidr=vpc_cidr,
-            dc_cidr=dc_cidr,
-        )
+        # One CGW per VPN connection, each terminating both tunnels of its
+        # connection. Dynamic connections (BGP on a VGW or TGW) peer over BGP.
+        self.customer_gateways = [
+            CustomerGateway(
+                self,
+                "CustomerGateway" if index == 0 else f"CustomerGateway{index + 1}",
+                name=name if index == 0 else f"{name}-{index + 1}",
+                dc_vpc=dc_vpc,
+                dc_public_subnet=dc_vpc.public_subnets[0],
+                cgw_eip_allocation_id=cgw_eip_allocation_id,
+                vpgw_tun1_public_ip=vpn_connection.vpgw_tun1_public_ip,
+                tun1_pre_shared_key=vpn_connection.tun1_pre_shared_key,
+                cgw_tun1_link_local_inner_ip=vpn_connection.cgw_tun1_link_local_ip,
+                vpgw_tun1_link_local_inner_ip=vpn_connection.vpgw_tun1_link_local_ip,
+                routes=routes,
+                vpgw_tun2_public_ip=vpn_connection.vpgw_tun2_public_ip,
+                tun2_pre_shared_key=vpn_connection.tun2_pre_shared_key,
+                cgw_tun2_link_local_inner_ip=vpn_connection.cgw_tun2_link_local_ip,
+                vpgw_tun2_link_local_inner_ip=vpn_connection.vpgw_tun2_link_local_ip,
+                proposal=proposal,
+                rekey=rekey,
+                backend=ipsec_backend,
+                size=gateway_size,
+                placement_group_name=placement_group_name,
+                bgp_asn=vpn_connection.bgp_asn,
+                peer_asn=vpn_connection.amazon_side_asn,
+                golden_image=golden_image,
+                vpn_id=vpn_connection.vpn_id,
+            )
+            for index, (cgw_eip_allocation_id, vpn_connection) in enumerate(
+                zip(cgw_eip_allocation_ids, vpn_connections)
+            )
+        ]
+        self.customer_gateway = self.customer_gateways[0]
 
         all_subnets = (
             dc_vpc.select_subnets(subnet_type=ec2.SubnetType.PUBLIC).subnets
@@ -89,14 +157,21 @@ class DatacenterCustomerGatewayStack(Stack):
                 subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS
             ).subnets
         )
-        for subnet in all_subnets:
-            ec2.CfnRoute(
-                self,
-                f"{subnet.node.id}CgwRoute",
-                route_table_id=subnet.route_table.route_table_id,
-                destination_cidr_block=vpc_cidr,
-                instance_id=self.customer_gateway.instance.instance_id,
-            )
+        # A route table holds a single target per destination, so the subnets
+        # are spread round robin over the gateways. Return traffic is balanced
+        # by the transit gateway ECMP and may come back through any gateway.
+        for index, subnet in enumerate(all_subnets):
+            customer_gateway = self.customer_gateways[
+                index % len(self.customer_gateways)
+            ]
+            for number, vpc_cidr in enumerate(routes.dc_routes):
+                ec2.CfnRoute(
+                    self,
+                    f"{subnet.node.id}CgwRoute{number or ''}",
+                    route_table_id=subnet.route_table.route_table_id,
+                    destination_cidr_block=vpc_cidr,
+                    instance_id=customer_gateway.instance.instance_id,
+                )
 
 
 class DatacenterClient(Stack):
@@ -106,20 +181,107 @@ class DatacenterClient(Stack):
         id: str,
         dc_vpc: ec2.Vpc,
         dc_subnet: ec2.ISubnet,
+        size: InstanceSize = INSTANCE_SIZES["m7a.large"],
+        placement_group_name: str | None = None,
+        load_test: LoadTest | None = None,
+        probe: LatencyProbe | None = None,
+        web_server_ip: str | None = None,
+        s3_endpoint: ec2.GatewayVpcEndpoint | None = None,
         **kwargs,
     ) -> None:
         super().__init__(scope, id, **kwargs)
 
+        user_data = ""
+        if load_test:
+            if not web_server_ip or not s3_endpoint:
+                raise ValueError("Load tests require web_server_ip and s3_endpoint")
+            self.results_bucket = s3.Bucket(
+                self,
+                "LoadTestResults",
+                block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+                enforce_ssl=True,
+            )
+            # Results only arrive over the VPC's gateway endpoint, never over
+            # the NAT gateways or the internet
+            self.results_bucket.add_to_resource_policy(
+                iam.PolicyStatement(
+                    effect=iam.Effect.DENY,
+                    principals=[iam.AnyPrincipal()],
+                    actions=["s3:PutObject"],
+                    resources=[self.results_bucket.arn_for_objects("*")],
+                    conditions={
+                        "StringNotEquals": {
+                            "aws:SourceVpce": s3_endpoint.vpc_endpoint_id
+                        }
+                    },
+                )
+            )
+            user_data = load_generator.render_user_data(
+                load_test,
+                target_ip=web_server_ip,
+                bucket_name=self.results_bucket.bucket_name,
+                region=self.region,
+            )
+            CfnOutput(
+                self, "LoadTestResultsBucket", value=self.results_bucket.bucket_name
+            )
+
         self.client = Instance(
             self,
             "Client",
             name="dc-client",
             vpc=dc_vpc,
             subnet=dc_subnet,
-            instance_type="m7a.large",
-            ami_id=Ubuntu.X86.value,
+            instance_type=size.instance_type,
+            ami_id=size.ami_id,
+            user_data=user_data,
+            placement_group_name=placement_group_name,
+            ena_express=size.ena_express,
         )
+        if load_test:
+            self.results_bucket.grant_put(self.client.role)
         self.client.allow_ssh_from_local()
+        if probe:
+            if not web_server_ip:
+                raise ValueError("Latency probes require web_server_ip")
+            self.latency_prober = LatencyProber(
+                self,
+                "LatencyProber",
+                instance=self.client,
+                target_ip=web_server_ip,
+                target_name="web-server",
+                probe=probe,
+            )
 
         # TODO: remove
         self.client.allow_ping_from("10.0.0.0/8")
+
+
+class DatacenterCachingProxy(Stack):
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        dc_vpc: ec2.Vpc,
+        dc_subnet: ec2.ISubnet,
+        origin_ip: str,
+        access_from_cidr: str,
+        cache: WanCache = WanCache(),
+        size: InstanceSize = INSTANCE_SIZES["m7a.large"],
+        placement_group_name: str | None = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        self.proxy = CachingProxy(
+            self,
+            "CachingProxy",
+            vpc=dc_vpc,
+            subnet=dc_subnet,
+            origin_ip=origin_ip,
+            access_from_cidr=access_from_cidr,
+            cache=cache,
+            size=size,
+            placement_group_name=placement_group_name,
+        )
+        CfnOutput(self, "WanCacheUrl", value=self.proxy.url)
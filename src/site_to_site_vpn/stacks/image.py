@@ -0,0 +1,53 @@
+from aws_cdk import CfnOutput, Stack
+import aws_cdk.aws_ec2 as ec2
+from constructs import Construct
+
+from ..constructs.constants import Ubuntu
+from ..constructs.customer_gateway import IpsecBackend, install_script
+from ..constructs.golden_image import GoldenImage
+from ..constructs import web_server
+from ..sizing import INSTANCE_SIZES, InstanceSize
+from ..tuning import FORWARDING, NetworkTuningProfile
+
+
+class ImageStack(Stack):
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        *,
+        vpc: ec2.IVpc,
+        subnet: ec2.ISubnet,
+        ipsec_backend: IpsecBackend = IpsecBackend.STARTER,
+        gateway_size: InstanceSize = INSTANCE_SIZES["m7a.xlarge"],
+        tuning_profile: NetworkTuningProfile = FORWARDING,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        # FRR and the CloudWatch agent are baked in as well, so one image serves
+        # static and BGP routing
+        self.customer_gateway_image = GoldenImage(
+            self,
+            "CustomerGatewayImage",
+            name="customer-gateway",
+            vpc=vpc,
+            subnet=subnet,
+            parent_image=gateway_size.ami_id,
+            arm=gateway_size.arm,
+            setup=install_script(ipsec_backend, bgp=True, metrics=True),
+            tuning_profile=tuning_profile,
+        )
+        self.web_server_image = GoldenImage(
+            self,
+            "WebServerImage",
+            name="web-server",
+            vpc=vpc,
+            subnet=subnet,
+            parent_image=Ubuntu.X86.value,
+            setup=web_server.INSTALL,
+        )
+        CfnOutput(
+            self, "CustomerGatewayImageId", value=self.customer_gateway_image.image_id
+        )
+        CfnOutput(self, "WebServerImageId", value=self.web_server_image.image_id)
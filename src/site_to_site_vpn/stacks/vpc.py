@@ -1,8 +1,22 @@
+import ipaddress
+
 from aws_cdk import Stack
 import aws_cdk.aws_ec2 as ec2
 from constructs import Construct
+from ..constructs.golden_image import GoldenImage
 from ..constructs.web_server import WebServer
-from ..constructs.vpn_connection import VpnConnection
+from ..constructs.transit_gateway import TransitGateway
+from ..constructs.vpn_connection import (
+    DEFAULT_AMAZON_SIDE_ASN,
+    DEFAULT_CGW_ASN,
+    VpnConnection,
+    VpnTopology,
+)
+from ..inside_cidrs import InsideCidrAllocator
+from ..ipsec import AES_GCM_128, HITLESS_REKEY, IpsecProposal, RekeyProfile
+from ..load_test import LoadTest
+from ..prober import LatencyProbe
+from ..routing import RoutePlan
 
 
 class VpcStack(Stack):
@@ -12,13 +26,35 @@ class VpcStack(Stack):
         id: str,
         *,
         cidr: str,
-        datacenter_cidr: str,
-        customer_gateway_public_ip: str,
+        routes: RoutePlan,
+        customer_gateway_public_ips: list[str],
         tun1_pre_shared_key: str,
         tun1_inner_cidr: str,
+        tun2_pre_shared_key: str | None = None,
+        tun2_inner_cidr: str | None = None,
+        inside_cidrs: InsideCidrAllocator | None = None,
+        proposal: IpsecProposal = AES_GCM_128,
+        rekey: RekeyProfile = HITLESS_REKEY,
+        topology: VpnTopology = VpnTopology.VGW,
+        bgp_asn: int = DEFAULT_CGW_ASN,
+        amazon_side_asn: int = DEFAULT_AMAZON_SIDE_ASN,
+        vpc_name: str = "webservers-vpc",
+        dashboard_name: str = "site-to-site-vpn",
+        ssm_prefix: str = "/vpn/vpgw",
         **kwargs,
     ) -> None:
         super().__init__(scope, id, **kwargs)
+        if not any(
+            ipaddress.ip_network(cidr).subnet_of(ipaddress.ip_network(vpc_cidr))
+            for vpc_cidr in routes.vpc_prefixes
+        ):
+            raise ValueError(f"The VPC CIDR {cidr} is missing in the route plan")
+        # Inside CIDRs are unique per VGW or TGW. The given ones are pinned to
+        # the first connection, the others are allocated per connection.
+        inside_cidrs = inside_cidrs or InsideCidrAllocator()
+        inside_cidrs.pin(f"{id}/vpn1/tunnel1", tun1_inner_cidr)
+        if tun2_inner_cidr:
+            inside_cidrs.pin(f"{id}/vpn1/tunnel2", tun2_inner_cidr)
         # tun1_pre_shared_key: Allowed characters are alphanumeric characters period . and underscores _. Must be between 8 and 64 characters in length and cannot start with zero (0).
 
         # The code that defines your stack goes here
@@ -26,7 +62,7 @@ class VpcStack(Stack):
         self.vpc = ec2.Vpc(
             self,
             "VPC",
-            vpc_name="webservers-vpc",
+            vpc_name=vpc_name,
             max_azs=3,
             ip_addresses=ec2.IpAddresses.cidr(cidr),
             # configuration will create 3 groups in 2 AZs = 6 subnets.
@@ -52,16 +88,65 @@ class VpcStack(Stack):
             "DynamoDbEndpoint", service=ec2.GatewayVpcEndpointAwsService.DYNAMODB
         )
 
-        self.vpn_connection = VpnConnection(
-            self,
-            "VpnConnection",
-            vpc=self.vpc,
-            datacenter_cidr=datacenter_cidr,
-            customer_gateway_public_ip=customer_gateway_public_ip,
-            tun1_pre_shared_key=tun1_pre_shared_key,
-            tun1_inner_cidr=tun1_inner_cidr,
+        if topology in (VpnTopology.VGW, VpnTopology.VGW_BGP):
+            if len(customer_gateway_public_ips) != 1:
+                raise ValueError(
+                    "A virtual private gateway routes over a single VPN connection, "
+                    "use VpnTopology.TGW to scale out over several customer gateways"
+                )
+            self.vpn_connection = VpnConnection(
+                self,
+                "VpnConnection",
+                vpc=self.vpc,
+                routes=routes,
+                customer_gateway_public_ip=customer_gateway_public_ips[0],
+                tun1_pre_shared_key=tun1_pre_shared_key,
+                tun1_inner_cidr=tun1_inner_cidr,
+                tun2_pre_shared_key=tun2_pre_shared_key,
+                tun2_inner_cidr=tun2_inner_cidr,
+                proposal=proposal,
+                rekey=rekey,
+                bgp_asn=bgp_asn if topology is VpnTopology.VGW_BGP else None,
+                amazon_side_asn=amazon_side_asn,
+                ssm_prefix=ssm_prefix,
+            )
+            if topology is VpnTopology.VGW:
+                self.vpn_connection.add_routes_to_vpgw()
+            self.vpn_connection.add_dashboard(dashboard_name)
+            self.vpn_connections = [self.vpn_connection]
+            return
+
+        self.transit_gateway = TransitGateway(
+            self, "TransitGateway", vpc=self.vpc, amazon_side_asn=amazon_side_asn
         )
-        self.vpn_connection.add_routes_to_vpgw()
+        # One VPN connection per customer gateway
+        self.vpn_connections = [
+            VpnConnection(
+                self,
+                "VpnConnection" if index == 0 else f"VpnConnection{index + 1}",
+                vpc=self.vpc,
+                routes=routes,
+                customer_gateway_public_ip=public_ip,
+                tun1_pre_shared_key=tun1_pre_shared_key,
+                tun1_inner_cidr=inside_cidrs.allocate(f"{id}/vpn{index + 1}/tunnel1"),
+                tun2_pre_shared_key=tun2_pre_shared_key,
+                tun2_inner_cidr=tun2_inner_cidr
+                and inside_cidrs.allocate(f"{id}/vpn{index + 1}/tunnel2"),
+                proposal=proposal,
+                rekey=rekey,
+                transit_gateway_id=self.transit_gateway.transit_gateway_id,
+                bgp_asn=bgp_asn,
+                amazon_side_asn=amazon_side_asn,
+                ssm_prefix=ssm_prefix if index == 0 else f"{ssm_prefix}{index + 1}",
+            )
+            for index, public_ip in enumerate(customer_gateway_public_ips)
+        ]
+        self.vpn_connection = self.vpn_connections[0]
+        self.transit_gateway.add_routes_to_tgw(routes.vpc_routes)
+        for index, vpn_connection in enumerate(self.vpn_connections):
+            vpn_connection.add_dashboard(
+                dashboard_name if index == 0 else f"{dashboard_name}-{index + 1}"
+            )
 
 
 class WebServerStack(Stack):
@@ -73,6 +158,9 @@ class WebServerStack(Stack):
         vpc: ec2.IVpc,
         subnet: ec2.ISubnet,
         access_from_cidr: str,
+        golden_image: GoldenImage | None = None,
+        load_test: LoadTest | None = None,
+        probe: LatencyProbe | None = None,
         **kwargs,
     ) -> None:
         super().__init__(scope, id, **kwargs)
@@ -82,4 +170,7 @@ class WebServerStack(Stack):
             vpc=vpc,
             subnet=subnet,
             access_from_cidr=access_from_cidr,
+            golden_image=golden_image,
+            load_test=load_test,
+            probe=probe,
         )
@@ -0,0 +1,292 @@
+import argparse
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass, field
+import ipaddress
+from itertools import islice
+import json
+import os
+from pathlib import Path
+import runpy
+import subprocess
+import sys
+import tempfile
+import time
+
+PRE_SHARED_KEY = "benchmark.pre_shared.key"
+# Peak RSS and wall time may grow by this fraction before it is a regression
+DEFAULT_TOLERANCE = 0.2
+MB = 1024
+# registry.CACHE_CONTEXT, not imported as that would load aws_cdk untimed
+CACHE_CONTEXT = "synth_cache"
+
+
+@dataclass(frozen=True)
+class SynthResult:
+    scenario: str
+    # import of aws_cdk, including the jsii kernel startup and assembly load
+    import_s: float
+    # app.py or the fleet builder, up to app.synth()
+    construct_s: float
+    synth_s: float
+    wall_s: float
+    # Largest process of the run, Python or the jsii kernel (node)
+    peak_rss_mb: float
+    stacks: int
+    resources: int
+    # Inclusive __init__ time per profiled construct, with --profile
+    constructs: dict[str, dict] = field(default_factory=dict)
+
+
+@contextmanager
+def profile_constructs(timings: dict[str, dict]):
+    # Opt-in hook timing every Instance, VpnConnection and CustomerGateway.
+    # Times are inclusive: a CustomerGateway contains its Instance.
+    from .constructs.customer_gateway import CustomerGateway
+    from .constructs.ec2 import Instance
+    from .constructs.vpn_connection import VpnConnection
+
+    originals = {}
+    for construct in (Instance, VpnConnection, CustomerGateway):
+        originals[construct] = construct.__init__
+        timing = timings.setdefault(construct.__name__, {"count": 0, "seconds": 0.0})
+
+        def timed(self, *args, _init=construct.__init__, _timing=timing, **kwargs):
+            start = time.perf_counter()
+            try:
+                _init(self, *args, **kwargs)
+            finally:
+                _timing["count"] += 1
+                _timing["seconds"] += time.perf_counter() - start
+
+        construct.__init__ = timed
+    try:
+        yield timings
+    finally:
+        for construct, init in originals.items():
+            construct.__init__ = init
+
+
+def fleet_scenario(sites: int, gateways: int):
+    # Scaled up topology: sites x (dc-vpc, infra-vpc, dc-gw) with `gateways`
+    # CGWs on a transit gateway per site. A /20 fits the nine /24 subnets.
+    from .constructs.vpn_connection import VpnTopology
+    from .fleet import Fleet, Site
+
+    cidrs = list(
+        islice(ipaddress.ip_network("10.0.0.0/8").subnets(new_prefix=20), 2 * sites)
+    )
+    if len(cidrs) < 2 * sites:
+        raise ValueError(f"10.0.0.0/8 fits at most {len(cidrs) // 2} sites")
+    return Fleet(
+        sites=tuple(
+            Site(
+                name=f"site{index}",
+                dc_cidr=str(cidrs[2 * index]),
+                vpc_cidr=str(cidrs[2 * index + 1]),
+                active_active=True,
+                topology=VpnTopology.TGW if gateways > 1 else VpnTopology.VGW,
+                gateway_count=gateways,
+            )
+            for index in range(sites)
+        )
+    )
+
+
+def _child(scenario: str, *, app_path: Path, sites: int, gateways: int, profile: bool):
+    # Runs in its own process, so every scenario pays the jsii kernel startup
+    start = time.perf_counter()
+    import aws_cdk
+
+    imported = time.perf_counter()
+    marks = {}
+    synth = aws_cdk.App.synth
+
+    def timed_synth(self, *args, **kwargs):
+        marks["synth"] = time.perf_counter()
+        marks["assembly"] = synth(self, *args, **kwargs)
+        marks["synthesized"] = time.perf_counter()
+        return marks["assembly"]
+
+    aws_cdk.App.synth = timed_synth
+    timings: dict[str, dict] = {}
+    with profile_constructs(timings) if profile else nullcontext():
+        if scenario == "app":
+            runpy.run_path(str(app_path), run_name="__main__")
+        else:
+            from .fleet import build_fleet
+
+            fleet = fleet_scenario(sites, gateways)
+            app = aws_cdk.App()
+            build_fleet(
+                app,
+                fleet,
+                environ={
+                    env: PRE_SHARED_KEY
+                    for site in fleet.sites
+                    for env in site.pre_shared_key_envs
+                },
+            )
+            app.synth()
+    stacks = marks["assembly"].stacks
+    return dict(
+        import_s=imported - start,
+        construct_s=marks["synth"] - imported,
+        synth_s=marks["synthesized"] - marks["synth"],
+        stacks=len(stacks),
+        resources=sum(len(stack.template.get("Resources", {})) for stack in stacks),
+        constructs=timings,
+    )
+
+
+def run(
+    scenario: str,
+    *,
+    app_path: Path,
+    sites: int = 1,
+    gateways: int = 1,
+    profile: bool = False,
+) -> SynthResult:
+    # Offline: no checkip lookup, no ~/.ssh and placeholder PSKs
+    with tempfile.TemporaryDirectory() as outdir:
+        result_path = Path(outdir) / "result.json"
+        log_path = Path(outdir) / "synth.log"
+        env = os.environ | {
+            "CDK_OUTDIR": str(Path(outdir) / "cdk.out"),
+            "VPN_OFFLINE": "1",
+            "TUN1_PRE_SHARED_KEY": PRE_SHARED_KEY,
+            "JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION": "1",
+            # Measure a real synth, never a reused cloud assembly
+            "CDK_CONTEXT_JSON": json.dumps(
+                json.loads(os.environ.get("CDK_CONTEXT_JSON", "{}"))
+                | {CACHE_CONTEXT: False}
+            ),
+        }
+        command = [
+            sys.executable,
+            "-m",
+            "site_to_site_vpn.synth_bench",
+            f"--child={scenario}",
+            f"--child-result={result_path}",
+            f"--app={app_path}",
+            f"--sites={sites}",
+            f"--gateways={gateways}",
+        ] + (["--profile"] if profile else [])
+        start = time.perf_counter()
+        with open(log_path, "wb") as log:
+            process = subprocess.Popen(
+                command, cwd=app_path.parent, env=env, stdout=log, stderr=log
+            )
+            # wait4 instead of wait: the child reaps the jsii kernel, so the
+            # peak RSS covers node as well
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+        wall = time.perf_counter() - start
+        if process.returncode:
+            raise RuntimeError(
+                f"{scenario} synth failed:\n{log_path.read_text()[-2000:]}"
+            )
+        child = json.loads(result_path.read_text())
+    return SynthResult(
+        scenario=scenario if scenario == "app" else f"fleet-{sites}x{gateways}",
+        wall_s=wall,
+        peak_rss_mb=usage.ru_maxrss / MB,
+        **child,
+    )
+
+
+def regressions(
+    results: list[SynthResult],
+    baseline: list[SynthResult],
+    *,
+    tolerance: float,
+) -> list[str]:
+    previous = {result.scenario: result for result in baseline}
+    messages = []
+    for result in results:
+        before = previous.get(result.scenario)
+        if not before:
+            continue
+        for metric, unit in (("wall_s", "s"), ("peak_rss_mb", "MB")):
+            old, new = getattr(before, metric), getattr(result, metric)
+            if new > old * (1 + tolerance):
+                messages.append(
+                    f"{result.scenario} {metric}: {old:.2f} -> {new:.2f} {unit}"
+                )
+    return messages
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark cdk synth of app.py and of a scaled up fleet, offline"
+    )
+    parser.add_argument("--scenario", action="append", choices=("app", "fleet"))
+    parser.add_argument("--app", type=Path, default=Path("app.py"))
+    parser.add_argument("--sites", type=int, default=10, help="fleet sites")
+    parser.add_argument("--gateways", type=int, default=2, help="CGWs per site")
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="runs per scenario, the fastest counts"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="time Instance, VpnConnection and CustomerGateway construction",
+    )
+    parser.add_argument("--json", type=Path, help="write the results to this file")
+    parser.add_argument("--baseline", type=Path, help="results of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--child-result", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        result = _child(
+            args.child,
+            app_path=args.app.resolve(),
+            sites=args.sites,
+            gateways=args.gateways,
+            profile=args.profile,
+        )
+        args.child_result.write_text(json.dumps(result))
+        return
+
+    results = []
+    print(
+        f"{'scenario':<14} {'stacks':>6} {'res':>5} {'import s':>8} "
+        f"{'build s':>7} {'synth s':>7} {'wall s':>7} {'RSS MB':>7}"
+    )
+    for scenario in args.scenario or ["app", "fleet"]:
+        result = min(
+            (
+                run(
+                    scenario,
+                    app_path=args.app.resolve(),
+                    sites=args.sites,
+                    gateways=args.gateways,
+                    profile=args.profile,
+                )
+                for _ in range(args.repeat)
+            ),
+            key=lambda result: result.wall_s,
+        )
+        results.append(result)
+        print(
+            f"{result.scenario:<14} {result.stacks:>6} {result.resources:>5} "
+            f"{result.import_s:>8.2f} {result.construct_s:>7.2f} "
+            f"{result.synth_s:>7.2f} {result.wall_s:>7.2f} {result.peak_rss_mb:>7.0f}"
+        )
+        for name, timing in result.constructs.items():
+            print(f"  {name:<16} {timing['count']:>5} x {timing['seconds']:>7.2f} s")
+
+    if args.json:
+        args.json.write_text(json.dumps([asdict(r) for r in results], indent=2))
+    if args.baseline:
+        baseline = [
+            SynthResult(**result) for result in json.loads(args.baseline.read_text())
+        ]
+        messages = regressions(results, baseline, tolerance=args.tolerance)
+        if messages:
+            sys.exit("Synth regressions:\n" + "\n".join(messages))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+from dataclasses import dataclass
+
+# Detects the primary ENA interface at boot instead of assuming a name such as
+# enp39s0, which differs between instance families. Exports PRIMARY_INTERFACE
+# for the rest of the user data.
+USER_DATA = """
+# Network tuning profile
+PRIMARY_INTERFACE=$(ip -o route show default | awk '{{print $5; exit}}')
+CPUS=$(nproc)
+
+{rss}{irqs}sudo ethtool -K $PRIMARY_INTERFACE gro {gro} gso {gso}
+{conntrack}{sysctls}sudo sysctl -p /etc/sysctl.d/60-network-tuning.conf
+"""
+
+SYSCTLS = """
+cat << EOF > /etc/sysctl.d/60-network-tuning.conf
+net.core.rmem_max={socket_buffer_bytes}
+net.core.wmem_max={socket_buffer_bytes}
+net.core.rmem_default={socket_buffer_default_bytes}
+net.core.wmem_default={socket_buffer_default_bytes}
+net.ipv4.tcp_rmem=4096 131072 {socket_buffer_bytes}
+net.ipv4.tcp_wmem=4096 65536 {socket_buffer_bytes}
+net.ipv4.udp_rmem_min=16384
+net.ipv4.udp_wmem_min=16384
+net.core.netdev_max_backlog={netdev_max_backlog}
+net.core.netdev_budget={netdev_budget}
+net.core.netdev_budget_usecs={netdev_budget_usecs}
+net.core.busy_poll={busy_poll_usecs}
+net.core.busy_read={busy_poll_usecs}
+{conntrack_sysctls}EOF
+"""
+
+# One combined RSS queue per vCPU, capped at what the ENA device offers
+RSS = """MAX_QUEUES=$(ethtool -l $PRIMARY_INTERFACE | awk '/Combined/ {{print $2; exit}}')
+QUEUES={queues}
+sudo ethtool -L $PRIMARY_INTERFACE combined $(( QUEUES < MAX_QUEUES ? QUEUES : MAX_QUEUES ))
+"""
+
+# irqbalance would undo the pinning, spread the queue IRQs round robin instead
+IRQS = """sudo systemctl disable --now irqbalance
+INDEX=0
+for IRQ in $(awk -F: "/$PRIMARY_INTERFACE-Tx-Rx/ {print \\$1}" /proc/interrupts); do
+    echo $(( INDEX % CPUS )) | sudo tee /proc/irq/$IRQ/smp_affinity_list
+    INDEX=$(( INDEX + 1 ))
+done
+"""
+
+# IKE, NAT-T and ESP are point to point flows between the gateways, tracking
+# them only costs a conntrack lookup per packet.
+NOTRACK = """
+for CHAIN in PREROUTING OUTPUT; do
+    sudo iptables -t raw -A $CHAIN -p udp -m multiport --ports 500,4500 -j CT --notrack
+    sudo iptables -t raw -A $CHAIN -p esp -j CT --notrack
+done
+"""
+
+CONNTRACK = """sudo modprobe nf_conntrack
+echo {hashsize} | sudo tee /sys/module/nf_conntrack/parameters/hashsize
+"""
+
+CONNTRACK_SYSCTLS = """net.netfilter.nf_conntrack_max={conntrack_max}
+"""
+
+# In a golden image the module is loaded before systemd-sysctl applies the
+# baked sysctl file, with the hash size set at load time
+CONNTRACK_IMAGE = """echo nf_conntrack | sudo tee /etc/modules-load.d/nf_conntrack.conf
+echo "options nf_conntrack hashsize={hashsize}" | sudo tee /etc/modprobe.d/nf_conntrack.conf
+"""
+
+
+@dataclass(frozen=True)
+class NetworkTuningProfile:
+    socket_buffer_bytes: int = 64 * 1024 * 1024
+    socket_buffer_default_bytes: int = 1024 * 1024
+    netdev_max_backlog: int = 250000
+    netdev_budget: int = 600
+    netdev_budget_usecs: int = 8000
+    busy_poll_usecs: int = 50
+    gro: bool = True
+    gso: bool = True
+    pin_irqs: bool = True
+    # None uses one queue per vCPU
+    rss_queues: int | None = None
+    # 0 keeps the kernel default conntrack table size
+    conntrack_max: int = 1048576
+    notrack_tunnel: bool = True
+
+    @property
+    def user_data(self) -> str:
+        return self._user_data(sysctls=self.sysctls)
+
+    @property
+    def boot_user_data(self) -> str:
+        # Only the per-boot steps, for images that have image_setup baked in
+        return self._user_data(sysctls="")
+
+    @property
+    def image_setup(self) -> str:
+        conntrack = ""
+        if self.conntrack_max:
+            conntrack = CONNTRACK_IMAGE.format(hashsize=self.conntrack_max // 4)
+        return conntrack + self.sysctls
+
+    @property
+    def sysctls(self) -> str:
+        conntrack_sysctls = ""
+        if self.conntrack_max:
+            conntrack_sysctls = CONNTRACK_SYSCTLS.format(
+                conntrack_max=self.conntrack_max
+            )
+        return SYSCTLS.format(
+            socket_buffer_bytes=self.socket_buffer_bytes,
+            socket_buffer_default_bytes=self.socket_buffer_default_bytes,
+            netdev_max_backlog=self.netdev_max_backlog,
+            netdev_budget=self.netdev_budget,
+            netdev_budget_usecs=self.netdev_budget_usecs,
+            busy_poll_usecs=self.busy_poll_usecs,
+            conntrack_sysctls=conntrack_sysctls,
+        )
+
+    def _user_data(self, *, sysctls: str) -> str:
+        conntrack = ""
+        if self.conntrack_max:
+            conntrack = CONNTRACK.format(hashsize=self.conntrack_max // 4)
+        return USER_DATA.format(
+            rss=RSS.format(queues=self.rss_queues or "$CPUS"),
+            irqs=IRQS if self.pin_irqs else "",
+            gro="on" if self.gro else "off",
+            gso="on" if self.gso else "off",
+            conntrack=conntrack + (NOTRACK if self.notrack_tunnel else ""),
+            sysctls=sysctls,
+        )
+
+
+FORWARDING = NetworkTuningProfile()
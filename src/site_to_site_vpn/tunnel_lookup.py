@@ -0,0 +1,163 @@
+import argparse
+from dataclasses import dataclass
+import json
+from pathlib import Path
+import subprocess
+import sys
+
+from .critical_path import load_assembly, stack_metadata
+
+# AWS assigns the outside IPs of a VPN connection's tunnels and
+# AWS::EC2::VPNConnection returns none of them, so VpnConnection reads them
+# with a custom resource. Once a connection is deployed this tool caches them,
+# with the inside CIDRs, in cdk.context.json under vpn-tunnels:<construct
+# path>. VpnConnection then uses the cached values and drops the custom
+# resource.
+#
+# Dropping the custom resource also drops the export of its outside IPs, which
+# the deployed dc-gw still imports. The importing stacks have to be deployed
+# on their own first (cdk deploy -e), then the VPN connection's stack.
+TUNNELS_CONTEXT = "vpn-tunnels"
+# Construct metadata of every VpnConnection: the logical id of its
+# AWS::EC2::VPNConnection
+VPN_CONNECTION_METADATA = "site-to-site-vpn:vpn-connection"
+DEFAULT_CONTEXT_FILE = Path("cdk.context.json")
+
+
+def context_key(construct_path: str) -> str:
+    return f"{TUNNELS_CONTEXT}:{construct_path}"
+
+
+@dataclass(frozen=True)
+class DeployedVpnConnection:
+    stack_name: str
+    # None for environment agnostic stacks, the AWS CLI default applies
+    region: str | None
+    logical_id: str
+    context_key: str
+
+
+def vpn_connections(assembly: Path) -> list[DeployedVpnConnection]:
+    manifest = json.loads((assembly / "manifest.json").read_text())
+    connections = []
+    for name, artifact in manifest["artifacts"].items():
+        if artifact["type"] != "aws:cloudformation:stack":
+            continue
+        region = artifact.get("environment", "").rpartition("/")[2]
+        for path, entries in stack_metadata(assembly, artifact).items():
+            for entry in entries:
+                if entry["type"] == VPN_CONNECTION_METADATA:
+                    connections.append(
+                        DeployedVpnConnection(
+                            stack_name=artifact["properties"].get("stackName", name),
+                            region=None if region.startswith("unknown-") else region,
+                            logical_id=entry["data"],
+                            context_key=context_key(path.lstrip("/")),
+                        )
+                    )
+    return connections
+
+
+def tunnel_importers(assembly: Path) -> dict[str, list[str]]:
+    # Stacks importing the tunnels read by a custom resource, by the stack of
+    # that custom resource
+    graph = load_assembly(assembly)
+    fetchers = {
+        key
+        for key, resource in graph.resources.items()
+        if resource.type == "Custom::AWS"
+        and "FetchVpnTunnels" in resource.path.split("/")
+    }
+    importers: dict[str, set[str]] = {}
+    for (stack, _), needs in graph.needs.items():
+        for need in needs & fetchers:
+            if need[0] != stack:
+                importers.setdefault(need[0], set()).add(stack)
+    return {stack: sorted(names) for stack, names in importers.items()}
+
+
+def describe_tunnels(connection: DeployedVpnConnection) -> dict:
+    resource = _aws(
+        connection.region,
+        "cloudformation",
+        "describe-stack-resource",
+        f"--stack-name={connection.stack_name}",
+        f"--logical-resource-id={connection.logical_id}",
+    )
+    vpn_connection_id = resource["StackResourceDetail"]["PhysicalResourceId"]
+    (vpn_connection,) = _aws(
+        connection.region,
+        "ec2",
+        "describe-vpn-connections",
+        f"--vpn-connection-ids={vpn_connection_id}",
+    )["VpnConnections"]
+    tunnels = vpn_connection["Options"]["TunnelOptions"]
+    return {
+        "vpn_connection_id": vpn_connection_id,
+        "outside_ips": [tunnel["OutsideIpAddress"] for tunnel in tunnels],
+        "inside_cidrs": [tunnel["TunnelInsideCidr"] for tunnel in tunnels],
+    }
+
+
+def _aws(region: str | None, *args: str) -> dict:
+    command = ["aws", *args, "--output=json"]
+    if region:
+        command.append(f"--region={region}")
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip())
+    return json.loads(result.stdout)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description="Cache the tunnel outside IPs and inside CIDRs of the deployed "
+        "VPN connections in cdk.context.json"
+    )
+    parser.add_argument("assembly", type=Path, nargs="?", default=Path("cdk.out"))
+    parser.add_argument("--context", type=Path, default=DEFAULT_CONTEXT_FILE)
+    parser.add_argument(
+        "--clear",
+        action="store_true",
+        help="remove the cached tunnels, e.g. before replacing a VPN connection",
+    )
+    args = parser.parse_args(argv)
+
+    context = {}
+    if args.context.exists():
+        context = json.loads(args.context.read_text())
+    if args.clear:
+        context = {
+            key: value
+            for key, value in context.items()
+            if not key.startswith(f"{TUNNELS_CONTEXT}:")
+        }
+    else:
+        cached = set()
+        for connection in vpn_connections(args.assembly):
+            try:
+                context[connection.context_key] = describe_tunnels(connection)
+            except RuntimeError as error:
+                # Not deployed (any more), it keeps the custom resource
+                context.pop(connection.context_key, None)
+                print(f"{connection.context_key}: {error}", file=sys.stderr)
+                continue
+            cached.add(connection.stack_name)
+            tunnels = context[connection.context_key]
+            print(
+                f"{connection.context_key}: {tunnels['vpn_connection_id']} "
+                f"{', '.join(tunnels['outside_ips'])}"
+            )
+        for stack, importers in tunnel_importers(args.assembly).items():
+            if stack in cached:
+                print(
+                    f"{stack} exports its tunnels to {', '.join(importers)}. "
+                    f"Deploy them first with cdk deploy -e {' '.join(importers)}, "
+                    f"then {stack} can drop the export.",
+                    file=sys.stderr,
+                )
+    args.context.write_text(json.dumps(context, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import argparse
+from dataclasses import dataclass
+import json
+import os
+from pathlib import Path
+import socket
+import time
+
+# Hit ratio of the datacenter's caching proxy in front of the web server.
+# nginx logs the cache status and size of every response, this exporter
+# summarizes the log per tumbling window and publishes requests, hits and the
+# bytes served from the cache (the tunnel traffic saved) as CloudWatch EMF.
+# Installed as a standalone script, so it only uses the standard library.
+NAMESPACE = "SiteToSiteVpn/WanCache"
+EMF_ENDPOINT = ("127.0.0.1", 25888)
+ACCESS_LOG = "/var/log/nginx/wan-cache.log"
+# Served without fetching the body over the tunnel. REVALIDATED costs a
+# conditional request and a 304.
+HIT_STATUSES = ("HIT", "STALE", "UPDATING", "REVALIDATED")
+MISS_STATUSES = ("MISS", "EXPIRED")
+
+
+@dataclass(frozen=True)
+class WanCache:
+    port: int = 80
+    origin_port: int = 80
+    # Shared memory for the cache keys, 1 MB holds about 8000 of them
+    keys_zone_mb: int = 64
+    # Cached bodies, the least recently used are evicted beyond this
+    max_size_mb: int = 10_240
+    # Keep the cache on tmpfs, bounded by max_size_mb of RAM, instead of disk
+    in_memory: bool = False
+    # Evicted when unused for this long, even if still fresh
+    inactive: str = "1d"
+    # Freshness of 200/301/302 responses without Cache-Control or Expires
+    valid: str = "10m"
+    window: int = 60
+
+
+def summarize(lines: list[str]) -> dict[str, float]:
+    # Lines of the wan_cache log format: "$upstream_cache_status
+    # $body_bytes_sent"
+    requests = hits = misses = bytes_served = bytes_from_cache = 0
+    for line in lines:
+        try:
+            status, size = line.split()
+            size = int(size)
+        except ValueError:
+            continue
+        requests += 1
+        bytes_served += size
+        if status in HIT_STATUSES:
+            hits += 1
+            bytes_from_cache += size
+        elif status in MISS_STATUSES:
+            misses += 1
+    summary = dict(
+        Requests=requests,
+        Hits=hits,
+        Misses=misses,
+        BytesServed=bytes_served,
+        BytesFromCache=bytes_from_cache,
+    )
+    if hits + misses:
+        summary["HitRatio"] = 100 * hits / (hits + misses)
+    if bytes_served:
+        summary["ByteHitRatio"] = 100 * bytes_from_cache / bytes_served
+    return summary
+
+
+def emf_document(
+    summary: dict,
+    dimensions: dict[str, str],
+    *,
+    timestamp: float,
+    log_group: str,
+    window: int = WanCache.window,
+) -> dict:
+    units = dict(
+        HitRatio="Percent",
+        ByteHitRatio="Percent",
+        BytesServed="Bytes",
+        BytesFromCache="Bytes",
+    )
+    # Periods below 60s only aggregate high resolution metrics
+    resolution = 1 if window < 60 else 60
+    return {
+        "_aws": {
+            "Timestamp": int(timestamp * 1000),
+            "LogGroupName": log_group,
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": NAMESPACE,
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": [
+                        dict(
+                            Name=name,
+                            Unit=units.get(name, "Count"),
+                            StorageResolution=resolution,
+                        )
+                        for name in summary
+                    ],
+                }
+            ],
+        },
+        **dimensions,
+        **summary,
+    }
+
+
+def follow(path: Path):
+    # Yields the lines appended to path, reopening it after logrotate. The
+    # lines of a log that exists at startup are skipped, a log that only
+    # appears later is read from its start.
+    log = None
+    inode = None
+    skip = os.path.exists(path)
+    while True:
+        try:
+            if os.stat(path).st_ino != inode:
+                if log:
+                    yield from log.readlines()
+                    log.close()
+                log = open(path)
+                if skip:
+                    log.seek(0, os.SEEK_END)
+                    skip = False
+                inode = os.fstat(log.fileno()).st_ino
+        except FileNotFoundError:
+            pass
+        yield from (log.readlines() if log else [])
+        yield None
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description="Publish the hit ratio of the WAN caching proxy"
+    )
+    parser.add_argument("--log", type=Path, default=Path(ACCESS_LOG))
+    parser.add_argument("--proxy-name", default=socket.gethostname())
+    parser.add_argument("--window", type=int, default=WanCache.window)
+    parser.add_argument("--log-group", default="/vpn/wan-cache/metrics")
+    parser.add_argument("--stdout", action="store_true", help="print instead of EMF")
+    parser.add_argument(
+        "--summary", action="store_true", help="summarize the whole log and exit"
+    )
+    args = parser.parse_args(argv)
+    if args.summary:
+        print(json.dumps(summarize(args.log.read_text().splitlines()), indent=2))
+        return
+
+    emf = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    lines, window_start = [], time.monotonic()
+    for line in follow(args.log):
+        if line is not None:
+            lines.append(line)
+            continue
+        if time.monotonic() - window_start >= args.window:
+            document = emf_document(
+                summarize(lines),
+                dict(Proxy=args.proxy_name),
+                timestamp=time.time(),
+                log_group=args.log_group,
+                window=args.window,
+            )
+            if args.stdout:
+                print(json.dumps(document), flush=True)
+            else:
+                emf.sendto(json.dumps(document).encode(), EMF_ENDPOINT)
+            lines, window_start = [], time.monotonic()
+        time.sleep(1)
+
+
+if __name__ == "__main__":
+    main()
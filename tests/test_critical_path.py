@@ -0,0 +1,140 @@
+from pathlib import Path
+
+import pytest
+
+from site_to_site_vpn.critical_path import (
+    DeployGraph,
+    Resource,
+    _references,
+    critical_path,
+    load_assembly,
+    schedule,
+    suggest_splits,
+    unbounded_seconds,
+)
+
+# net: a VPC with a subnet and a VPN connection (420 s) on its own gateway
+# app: an instance in the imported subnet, with its role, profile and alarm
+# dash: a dashboard that only depends on app (Stack.add_dependency)
+# logs: a log group on its own
+ASSEMBLY = Path(__file__).parent / "assemblies" / "deploy"
+
+
+@pytest.fixture
+def graph() -> DeployGraph:
+    return load_assembly(ASSEMBLY)
+
+
+def test_load_assembly(graph):
+    assert graph.stacks == ("net", "app", "dash", "logs")
+    assert graph.resources["app", "Alarm"] == Resource(
+        stack="app",
+        logical_id="Alarm",
+        type="AWS::CloudWatch::Alarm",
+        path="Instance/StatusAlarm",
+        seconds=5,
+    )
+    assert graph.resources["net", "Gateway"].path == "Vpn/Gateway"
+    # The import of a stack outside the assembly is no dependency
+    assert graph.needs["app", "Instance"] == {("net", "Subnet"), ("app", "Profile")}
+    assert graph.needs["app", "Alarm"] == {("app", "Instance")}
+    # app imports from net, dash only has the explicit dependency
+    assert graph.explicit == dict(net=set(), app=set(), dash={"app"}, logs=set())
+
+
+def test_schedule(graph):
+    plan = schedule(graph)
+    assert plan.start == dict(net=0, logs=0, app=510, dash=745)
+    assert plan.finish == dict(net=510, logs=35, app=745, dash=780)
+    assert plan.depends_on == dict(net=set(), app={"net"}, dash={"app"}, logs=set())
+    # 30 s stack overhead, then the role, profile, instance and alarm chain
+    assert plan.resource_start["app", "Role"] == 540
+    assert plan.resource_finish["app", "Alarm"] == 745
+    assert plan.seconds == 780
+    assert unbounded_seconds(graph) == 510
+
+
+def test_schedule_with_concurrency(graph):
+    # logs waits for a slot behind the stacks listed before it
+    plan = schedule(graph, concurrency=1)
+    assert plan.start == dict(net=0, app=510, dash=745, logs=780)
+    assert plan.seconds == 815
+
+
+def test_schedule_cycle():
+    resources = {
+        (stack, "Topic"): Resource(stack, "Topic", "AWS::SNS::Topic", "Topic", 10)
+        for stack in ("a", "b")
+    }
+    graph = DeployGraph(
+        stacks=("a", "b"),
+        resources=resources,
+        needs={("a", "Topic"): frozenset(), ("b", "Topic"): frozenset()},
+        explicit=dict(a=frozenset({"b"}), b=frozenset({"a"})),
+    )
+    with pytest.raises(ValueError, match="cycle between a, b"):
+        schedule(graph)
+
+
+def test_critical_path(graph):
+    steps = critical_path(graph, schedule(graph))
+    assert [(step.stack, step.resource.logical_id) for step in steps] == [
+        ("net", "Gateway"),
+        ("net", "Connection"),
+        ("app", "Role"),
+        ("app", "Profile"),
+        ("app", "Instance"),
+        ("app", "Alarm"),
+        ("dash", "Dashboard"),
+    ]
+    assert (steps[1].start, steps[1].finish) == (90, 510)
+    assert (steps[-1].start, steps[-1].finish) == (775, 780)
+
+
+def test_suggest_splits(graph):
+    core, early = suggest_splits(graph)
+    # app only imports the subnet, not the VPN connection
+    assert core.stack == "net"
+    assert core.new_stack == "net-core"
+    assert [resource.logical_id for resource in core.moved] == ["Vpc", "Subnet"]
+    assert core.depends_on == ()
+    assert core.reason == "app does not wait for the rest of net"
+    assert (core.seconds, core.saving) == (510, 270)
+    # The role and profile need nothing from net
+    assert early.stack == "app"
+    assert early.new_stack == "app-early"
+    assert [resource.logical_id for resource in early.moved] == ["Role", "Profile"]
+    assert early.reason == "they do not wait for net"
+    assert (early.seconds, early.saving) == (640, 140)
+
+
+def test_suggest_splits_min_saving(graph):
+    assert [split.new_stack for split in suggest_splits(graph, min_saving=200)] == [
+        "net-core"
+    ]
+
+
+def test_references():
+    refs, imports = _references(
+        {
+            "A": {"Ref": "Bucket"},
+            "B": [{"Fn::GetAtt": ["Role", "Arn"]}, {"Fn::GetAtt": "Queue.Arn"}],
+            "C": {"Fn::Sub": "arn:${AWS::Partition}:${Topic.TopicName}/${!Literal}"},
+            "D": {"Fn::Sub": ["${Name}-${Suffix}", {"Suffix": {"Ref": "Table"}}]},
+            "E": {"Fn::ImportValue": "net:VpcId"},
+            "F": {"Fn::Join": ["", [{"Ref": "Key"}]]},
+        }
+    )
+    # Pseudo parameters and Sub variables are filtered against the template
+    assert refs == {
+        "Bucket",
+        "Role",
+        "Queue",
+        "AWS::Partition",
+        "Topic",
+        "Name",
+        "Suffix",
+        "Table",
+        "Key",
+    }
+    assert imports == {"net:VpcId"}
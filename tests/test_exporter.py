@@ -0,0 +1,145 @@
+from pathlib import Path
+
+import pytest
+
+from site_to_site_vpn.exporter import (
+    metrics,
+    parse_rekeys,
+    parse_xfrm_states,
+    strip_keys,
+)
+
+# Counter dumps of a CGW with one tunnel (mark 100) across a CHILD_SA rekey
+CAPTURES = Path(__file__).parent / "captures"
+LOCAL_IP = "10.0.0.110"
+TUNNELS = {100: "Tunnel1"}
+
+
+def dump(name: str) -> str:
+    return (CAPTURES / name).read_text()
+
+
+def capture(suffix: str) -> dict:
+    return dict(
+        time=0,
+        xfrm_state=dump(f"xfrm_state_{suffix}.txt"),
+        xfrm_stat=dump(f"xfrm_stat_{suffix}.txt"),
+        ethtool=dump(f"ethtool_{suffix}.txt"),
+        stat=dump(f"stat_{suffix}.txt"),
+        rekey_log=dump(f"charon_rekey_{suffix}.log"),
+    )
+
+
+def test_parse_xfrm_states():
+    states = parse_xfrm_states(dump("xfrm_state_before.txt"))
+    assert states == [
+        dict(
+            src="10.0.0.110",
+            spi="0xc2a1f00d",
+            mark=100,
+            bytes=1_400_000,
+            packets=10_000,
+            replay=0,
+            integrity_failed=0,
+        ),
+        dict(
+            src="3.79.132.236",
+            spi="0x0b5e4a11",
+            mark=100,
+            bytes=2_800_000,
+            packets=20_000,
+            replay=2,
+            integrity_failed=1,
+        ),
+    ]
+
+
+def test_strip_keys():
+    output = dump("xfrm_state_before.txt").replace(
+        "0x<key>", "0x3f1c0a7b9e2d4c6a8b0e1f2a3b4c5d6e7f809102"
+    )
+    output += "\tenc cbc(aes) 0x00112233\n\tauth-trunc hmac(sha1) 0x44556677 96\n"
+    stripped = strip_keys(output)
+    assert "0x3f1c" not in stripped
+    assert "cbc(aes)" not in stripped
+    assert "hmac(sha1)" not in stripped
+    assert "encap type espinudp" in stripped
+    assert parse_xfrm_states(stripped) == parse_xfrm_states(output)
+
+
+def test_parse_xfrm_states_after_rekey():
+    states = parse_xfrm_states(dump("xfrm_state_after.txt"))
+    assert [state["spi"] for state in states] == [
+        "0xd3b2e11e",
+        "0x1c6f5b22",
+        "0xc2a1f00d",
+        "0x0b5e4a11",
+    ]
+
+
+def test_parse_rekeys():
+    rekeys = parse_rekeys(
+        dump("charon_rekey_before.log"), dump("charon_rekey_after.log")
+    )
+    # The new CHILD_SA without N(REKEY_SA) is not a rekey
+    assert rekeys == [
+        dict(
+            tunnel="Tunnel1",
+            sa="CHILD_SA",
+            initiator="local",
+            time=1792310066.103,
+            duration=pytest.approx(28, abs=0.01),
+        ),
+        dict(
+            tunnel="Tunnel1",
+            sa="IKE_SA",
+            initiator="peer",
+            time=1792310070.5,
+            duration=pytest.approx(12, abs=0.01),
+        ),
+    ]
+
+
+def test_parse_rekeys_only_reports_responses_in_after():
+    assert parse_rekeys(dump("charon_rekey_before.log"), "") == []
+    assert parse_rekeys("", dump("charon_rekey_before.log")) == []
+
+
+def test_metrics():
+    sample = metrics(
+        capture("before"), capture("after"), local_ip=LOCAL_IP, tunnels=TUNNELS
+    )
+    assert sample["gateway"] == dict(
+        BwInAllowanceExceeded=15,
+        BwOutAllowanceExceeded=0,
+        PpsAllowanceExceeded=5,
+        ConntrackAllowanceExceeded=0,
+        LinklocalAllowanceExceeded=0,
+        XfrmInErrors=4,
+        XfrmOutErrors=1,
+        XfrmReplayErrors=3,
+        SoftirqCpuPercent=25,
+        SoftirqMaxCpuPercent=40,
+    )
+    # Deltas of the old SAs plus the whole counters of the new ones
+    assert sample["tunnels"] == dict(
+        Tunnel1=dict(
+            EspBytesIn=340_000,
+            EspBytesOut=170_000,
+            EspPacketsIn=2_400,
+            EspPacketsOut=1_200,
+            SaReplayErrors=3,
+            SaIntegrityErrors=0,
+            Rekeys=1,
+            PeerRekeys=1,
+            RekeyDuration=pytest.approx(28, abs=0.01),
+        )
+    )
+
+
+def test_metrics_after_counter_reset():
+    # A reloaded driver restarts its counters, the new value is the delta
+    before, after = capture("after"), capture("before")
+    sample = metrics(before, after, local_ip=LOCAL_IP, tunnels=TUNNELS)
+    assert sample["gateway"]["BwInAllowanceExceeded"] == 10
+    assert sample["tunnels"]["Tunnel1"]["EspBytesOut"] == 1_400_000
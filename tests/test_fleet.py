@@ -0,0 +1,119 @@
+import pytest
+
+from site_to_site_vpn.constructs.customer_gateway import IpsecBackend
+from site_to_site_vpn.constructs.vpn_connection import VpnTopology
+from site_to_site_vpn.fleet import Fleet, Site, load_fleet
+from site_to_site_vpn.ipsec import AES_GCM_256
+
+FLEET = """
+[fleet]
+proposal = "aes-gcm-256"
+ipsec_backend = "swanctl"
+
+[defaults]
+throughput_gbps = 2.5
+
+[[sites]]
+name = "paris"
+dc_cidr = "10.0.0.0/16"
+vpc_cidr = "10.1.0.0/16"
+active_active = true
+
+[[sites]]
+name = "berlin"
+dc_cidr = "10.2.0.0/16"
+vpc_cidr = "10.3.0.0/16"
+site_cidrs = ["192.168.0.0/24"]
+topology = "tgw"
+gateway_count = 2
+throughput_gbps = 5
+"""
+
+
+def load(tmp_path, text: str) -> Fleet:
+    path = tmp_path / "fleet.toml"
+    path.write_text(text)
+    return load_fleet(path)
+
+
+def test_load_fleet(tmp_path):
+    fleet = load(tmp_path, FLEET)
+    assert fleet.proposal is AES_GCM_256
+    assert fleet.ipsec_backend is IpsecBackend.SWANCTL
+    paris, berlin = fleet.sites
+    assert paris == Site(
+        name="paris",
+        dc_cidr="10.0.0.0/16",
+        vpc_cidr="10.1.0.0/16",
+        active_active=True,
+        throughput_gbps=2.5,
+    )
+    assert berlin.site_cidrs == ("192.168.0.0/24",)
+    assert berlin.topology is VpnTopology.TGW
+    assert berlin.gateway_count == 2
+    assert berlin.throughput_gbps == 5
+    assert berlin.routes.site_prefixes == ["10.2.0.0/16", "192.168.0.0/24"]
+    assert paris.pre_shared_key_envs == [
+        "PARIS_TUN1_PRE_SHARED_KEY",
+        "PARIS_TUN2_PRE_SHARED_KEY",
+    ]
+
+
+@pytest.mark.parametrize(
+    "text, message",
+    [
+        ("[fleets]\n", "Unknown fleet file tables: fleets"),
+        ('[fleet]\nproposal = "aes-cbc"\n', "Unknown proposal 'aes-cbc'"),
+        ('[fleet]\nipsec_backend = "libreswan"\n', "Unknown ipsec_backend 'libreswan'"),
+        ("[fleet]\nallow_x86 = true\n", "Unknown fleet settings: allow_x86"),
+        (
+            '[[sites]]\nname = "a"\ndc_cidr = "10.0.0.0/16"\n'
+            'vpc_cidr = "10.1.0.0/16"\ngateways = 2\n',
+            "Unknown site fields: gateways",
+        ),
+        (
+            '[[sites]]\nname = "a"\ndc_cidr = "10.0.0.0/16"\n'
+            'vpc_cidr = "10.1.0.0/16"\ntopology = "vpn"\n',
+            "Unknown topology 'vpn'",
+        ),
+    ],
+)
+def test_load_fleet_rejects_unknown_values(tmp_path, text, message):
+    with pytest.raises(ValueError, match=message):
+        load(tmp_path, FLEET.split("[fleet]")[0] + text)
+
+
+@pytest.mark.parametrize(
+    "fields, message",
+    [
+        (dict(name="Paris"), "Site names are lowercase"),
+        (dict(gateway_count=0), "a: gateway_count must be at least 1"),
+        (dict(gateway_count=2), "a: only the TGW topology scales out gateways"),
+        (dict(vpc_cidr="10.0.1.0/24"), "a: Site and VPC prefixes overlap"),
+    ],
+)
+def test_invalid_site(fields, message):
+    values = dict(name="a", dc_cidr="10.0.0.0/16", vpc_cidr="10.1.0.0/16") | fields
+    with pytest.raises(ValueError, match=message):
+        Site(**values)
+
+
+def test_duplicate_site_names():
+    site = Site(name="a", dc_cidr="10.0.0.0/16", vpc_cidr="10.1.0.0/16")
+    with pytest.raises(ValueError, match="Duplicate site names: a"):
+        Fleet(sites=(site, site))
+
+
+def test_colliding_pre_shared_key_envs():
+    # SITE_NAME keeps names apart today, the check guards the env var names
+    # should it ever admit underscores
+    first = Site(name="a-b", dc_cidr="10.0.0.0/16", vpc_cidr="10.1.0.0/16")
+    second = Site(name="a-c", dc_cidr="10.2.0.0/16", vpc_cidr="10.3.0.0/16")
+    object.__setattr__(second, "name", "a_b")
+    with pytest.raises(ValueError, match="distinct PSK env vars"):
+        Fleet(sites=(first, second))
+
+
+def test_empty_fleet():
+    with pytest.raises(ValueError, match="at least one site"):
+        Fleet(sites=())
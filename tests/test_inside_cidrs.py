@@ -0,0 +1,44 @@
+import ipaddress
+
+import pytest
+
+from site_to_site_vpn.inside_cidrs import BLOCKS, LINK_LOCAL, InsideCidrAllocator
+
+
+def test_full_space_with_custom_reserved_raises():
+    # All but two /30s reserved
+    reserved = tuple(
+        str(network) for network in list(LINK_LOCAL.subnets(new_prefix=30))[2:]
+    )
+    assert len(reserved) == BLOCKS - 2
+    allocator = InsideCidrAllocator(reserved=reserved)
+    assert {allocator.allocate("a"), allocator.allocate("b")} == {
+        "169.254.0.0/30",
+        "169.254.0.4/30",
+    }
+    with pytest.raises(ValueError, match="No tunnel inside CIDR left"):
+        allocator.allocate("c")
+
+
+def test_allocations_are_stable_across_synths(tmp_path):
+    state = tmp_path / "inside-cidrs.json"
+    first = InsideCidrAllocator(state=state)
+    existing = {key: first.allocate(key) for key in ("site-b", "site-c")}
+
+    # A site added in front of the others never takes their /30s
+    second = InsideCidrAllocator(state=state)
+    new = second.allocate("site-a")
+    assert {key: second.allocate(key) for key in existing} == existing
+    assert new not in existing.values()
+    assert ipaddress.ip_network(new).subnet_of(LINK_LOCAL)
+    assert InsideCidrAllocator(state=state).allocations == second.allocations
+
+
+def test_configured_pin_overrides_persisted_cidr(tmp_path):
+    state = tmp_path / "inside-cidrs.json"
+    InsideCidrAllocator(state=state).pin("vpc/vpn1/tunnel1", "169.254.88.80/30")
+    allocator = InsideCidrAllocator(state=state)
+    allocator.pin("vpc/vpn1/tunnel1", "169.254.90.80/30")
+    assert allocator.allocations == {"vpc/vpn1/tunnel1": "169.254.90.80/30"}
+    # The old /30 is free again
+    allocator.pin("vpc/vpn2/tunnel1", "169.254.88.80/30")
@@ -0,0 +1,86 @@
+from dataclasses import replace
+
+import pytest
+
+from site_to_site_vpn.ipsec import (
+    AES_GCM_128,
+    LEGACY,
+    DhGroup,
+    Encryption,
+    Integrity,
+    IpsecProposal,
+)
+
+# AEAD and CBC ciphers side by side, as offered during a migration
+MIXED = IpsecProposal(
+    phase1_encryption=(Encryption.AES256_GCM_16, Encryption.AES128),
+    phase1_integrity=(Integrity.SHA2_256, Integrity.SHA1),
+    phase1_dh_groups=(DhGroup.ECP256, DhGroup.MODP2048),
+    phase2_encryption=(Encryption.AES256_GCM_16, Encryption.AES128),
+    phase2_integrity=(Integrity.SHA2_256, Integrity.SHA1),
+    phase2_dh_groups=(DhGroup.ECP256,),
+)
+
+
+@pytest.mark.parametrize(
+    "proposal, ike, esp",
+    [
+        (LEGACY, "aes128-sha1-modp1024!", "aes128-sha1!"),
+        # AEAD: phase 1 integrity is the PRF, phase 2 has no integrity part
+        (AES_GCM_128, "aes128gcm16-prfsha256-ecp256!", "aes128gcm16-ecp256!"),
+        (
+            MIXED,
+            "aes256gcm16-prfsha256-prfsha1-ecp256-modp2048,"
+            "aes128-sha256-sha1-ecp256-modp2048!",
+            "aes256gcm16-ecp256,aes128-sha256-sha1-ecp256!",
+        ),
+    ],
+)
+def test_strongswan_proposals(proposal, ike, esp):
+    assert proposal.ike == ike
+    assert proposal.esp == esp
+    # swanctl takes the same proposals without the strict suffix
+    assert proposal.ike_proposals == ike.removesuffix("!")
+    assert proposal.esp_proposals == esp.removesuffix("!")
+
+
+def test_no_pfs_without_phase2_groups():
+    assert replace(AES_GCM_128, phase2_dh_groups=()).esp == "aes128gcm16!"
+
+
+def test_kernel_aeads():
+    assert AES_GCM_128.kernel_aeads == ["rfc4106(gcm(aes))"]
+    assert MIXED.kernel_aeads == [
+        "rfc4106(gcm(aes))",
+        "authenc(hmac(sha256),cbc(aes))",
+        "authenc(hmac(sha1),cbc(aes))",
+    ]
+
+
+def test_tunnel_options():
+    assert AES_GCM_128.tunnel_options == {
+        "IKEVersions": [{"Value": "ikev2"}],
+        "Phase1EncryptionAlgorithms": [{"Value": "AES128-GCM-16"}],
+        "Phase1IntegrityAlgorithms": [{"Value": "SHA2-256"}],
+        "Phase1DHGroupNumbers": [{"Value": 19}],
+        "Phase2EncryptionAlgorithms": [{"Value": "AES128-GCM-16"}],
+        "Phase2DHGroupNumbers": [{"Value": 19}],
+    }
+    # Optional keys only when set
+    options = replace(LEGACY, phase2_dh_groups=()).tunnel_options
+    assert "Phase2DHGroupNumbers" not in options
+    assert options["Phase2IntegrityAlgorithms"] == [{"Value": "SHA1"}]
+
+
+@pytest.mark.parametrize(
+    "field",
+    ["phase1_encryption", "phase1_integrity", "phase1_dh_groups", "phase2_encryption"],
+)
+def test_empty_algorithm_list(field):
+    with pytest.raises(ValueError, match=f"IpsecProposal.{field} must not be empty"):
+        replace(AES_GCM_128, **{field: ()})
+
+
+def test_cbc_requires_phase2_integrity():
+    with pytest.raises(ValueError, match="phase2_integrity is required"):
+        replace(LEGACY, phase2_integrity=())
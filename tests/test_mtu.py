@@ -0,0 +1,52 @@
+import pytest
+
+from site_to_site_vpn.ipsec import (
+    AES_GCM_128,
+    AES_GCM_256,
+    LEGACY,
+    Encryption,
+    Integrity,
+    IpsecProposal,
+)
+from site_to_site_vpn.mtu import max_inner_packet, tcp_mss, tunnel_mtu
+
+
+@pytest.mark.parametrize(
+    "proposal, mtu, mss",
+    [
+        # 20 IP + 8 UDP + 8 ESP + 8 IV + 16 ICV, 4 byte aligned, 2 trailer
+        (AES_GCM_128, 1438, 1398),
+        (AES_GCM_256, 1438, 1398),
+        # 20 IP + 8 UDP + 8 ESP + 16 IV + 12 ICV, 16 byte aligned, 2 trailer
+        (LEGACY, 1422, 1382),
+    ],
+)
+def test_nat_traversal_mtu_and_mss(proposal, mtu, mss):
+    assert tunnel_mtu(proposal) == mtu
+    assert tcp_mss(tunnel_mtu(proposal)) == mss
+
+
+def test_ipv6_mss():
+    assert tcp_mss(tunnel_mtu(AES_GCM_128), ipv6=True) == 1378
+    assert tcp_mss(tunnel_mtu(LEGACY), ipv6=True) == 1362
+
+
+def test_without_nat_traversal_the_udp_header_is_saved():
+    assert tunnel_mtu(AES_GCM_128, nat_traversal=False) == 1446
+
+
+def test_mixed_proposal_is_sized_for_the_worst_transform():
+    proposal = IpsecProposal(
+        phase1_encryption=AES_GCM_128.phase1_encryption,
+        phase1_integrity=AES_GCM_128.phase1_integrity,
+        phase1_dh_groups=AES_GCM_128.phase1_dh_groups,
+        phase2_encryption=(Encryption.AES128_GCM_16, Encryption.AES128),
+        phase2_integrity=(Integrity.SHA1,),
+        phase2_dh_groups=AES_GCM_128.phase2_dh_groups,
+    )
+    assert tunnel_mtu(proposal) == 1422
+
+
+def test_cbc_requires_integrity():
+    with pytest.raises(ValueError, match="requires an integrity algorithm"):
+        max_inner_packet(Encryption.AES128, None)
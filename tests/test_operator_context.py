@@ -0,0 +1,50 @@
+from aws_cdk import App
+import pytest
+
+from site_to_site_vpn import operator_context
+from site_to_site_vpn.operator_context import OperatorContext
+
+KEY = "ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIOperator operator@example"
+
+
+@pytest.fixture
+def lookups(monkeypatch) -> list[str]:
+    calls = []
+
+    def public_ip() -> str:
+        calls.append("checkip")
+        return "198.51.100.7"
+
+    monkeypatch.setattr(operator_context, "_public_ip", public_ip)
+    monkeypatch.setattr(operator_context, "_local_public_key", lambda: KEY)
+    return calls
+
+
+def test_settings_make_no_network_call(lookups):
+    settings = OperatorContext.settings(App(), environ={})
+    assert settings == dict(offline=False, admin_cidr=None, ssh_public_key=KEY)
+    assert not lookups
+
+
+def test_resolve_looks_up_the_public_ip(lookups):
+    assert OperatorContext.resolve(App(), environ={}) == OperatorContext(
+        admin_cidr="198.51.100.7/32", ssh_public_key=KEY
+    )
+    assert lookups == ["checkip"]
+
+
+def test_pinned_and_offline(lookups):
+    pinned = App(context=dict(admin_cidr="203.0.113.0/24"))
+    assert OperatorContext.resolve(pinned, environ={}).admin_cidr == "203.0.113.0/24"
+    offline = OperatorContext.resolve(App(), environ=dict(VPN_OFFLINE="1"))
+    assert offline == OperatorContext()
+    assert not lookups
+
+
+def test_key_path(tmp_path, lookups):
+    path = tmp_path / "id_ed25519.pub"
+    path.write_text(KEY + "\n")
+    settings = OperatorContext.settings(
+        App(), environ=dict(VPN_SSH_PUBLIC_KEY=str(path), VPN_OFFLINE="1")
+    )
+    assert settings["ssh_public_key"] == KEY
@@ -0,0 +1,88 @@
+import errno
+import struct
+
+import pytest
+
+from site_to_site_vpn.prober import (
+    Prober,
+    icmp_checksum,
+    icmp_echo,
+    percentile,
+    summarize,
+)
+
+
+@pytest.mark.parametrize(
+    "p, expected", [(0, 1), (50, 6), (90, 10), (99, 10), (100, 10)]
+)
+def test_percentile(p, expected):
+    assert percentile([10, 1, 9, 2, 8, 3, 7, 4, 6, 5], p) == expected
+
+
+def test_summarize():
+    summary = summarize([4.0, 6.0, 5.0], sent=4)
+    assert summary == dict(
+        Probes=4, Loss=25, RttP50=5.0, RttP90=6.0, RttP99=6.0, RttMax=6.0, Jitter=1.5
+    )
+
+
+def test_summarize_without_probes():
+    # A window without sends loses nothing and has no RTTs
+    assert summarize([], sent=0) == dict(Probes=0, Loss=0)
+    assert summarize([], sent=3) == dict(Probes=3, Loss=100)
+
+
+def test_summarize_single_rtt():
+    summary = summarize([7.5], sent=1)
+    assert summary["Jitter"] == 0
+    assert summary["RttP50"] == summary["RttP99"] == 7.5
+
+
+def test_icmp_checksum():
+    # RFC 1071, 4.1
+    assert icmp_checksum(bytes.fromhex("0001f203f4f5f6f7")) == 0x220D
+    # An odd length is padded with a zero byte
+    assert icmp_checksum(b"\x01") == icmp_checksum(b"\x01\x00") == 0xFEFF
+    assert icmp_checksum(b"\xff\xff\xff") == 0x00FF
+
+
+@pytest.mark.parametrize("payload", [b"", b"probe", b"probes"])
+def test_icmp_echo(payload):
+    packet = icmp_echo(0x1234, 7, payload)
+    assert struct.unpack("!BBxxHH", packet[:8]) == (8, 0, 0x1234, 7)
+    assert packet[8:] == payload
+    # The checksum of a packet including its checksum is 0
+    assert icmp_checksum(packet) == 0
+
+
+class FailingSocket:
+    def __init__(self, error: OSError):
+        self.error = error
+
+    def send(self, data):
+        raise self.error
+
+    def sendto(self, data, address):
+        raise self.error
+
+
+def prober(error: OSError) -> Prober:
+    # Without the sockets of __init__, the raw ICMP one needs root
+    prober = Prober.__new__(Prober)
+    prober.target, prober.port, prober.timeout = "192.0.2.1", 7007, 0.1
+    prober.identifier = 1
+    prober.udp = prober.icmp = FailingSocket(error)
+    return prober
+
+
+@pytest.mark.parametrize("protocol", ["udp", "icmp"])
+@pytest.mark.parametrize(
+    "error",
+    [
+        ConnectionRefusedError(errno.ECONNREFUSED, "Connection refused"),
+        OSError(errno.ENETUNREACH, "Network is unreachable"),
+        OSError(errno.EHOSTUNREACH, "No route to host"),
+    ],
+)
+def test_failed_send_is_a_lost_probe(protocol, error):
+    assert prober(error).probe(protocol, 1) is None
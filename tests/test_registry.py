@@ -0,0 +1,123 @@
+import importlib.util
+from itertools import count
+
+from aws_cdk import App
+import pytest
+
+from site_to_site_vpn.registry import StackRegistry
+
+APP = """
+from aws_cdk import Stack
+
+SETTING = "first"
+UNRELATED = "first"
+
+
+def network(stacks):
+    return Stack(stacks.app, "network", description=SETTING)
+
+
+def server(stacks):
+    stacks.get("network")
+    return Stack(stacks.app, "server")
+"""
+
+_modules = count()
+
+
+@pytest.fixture
+def app_module(tmp_path):
+    def load(source: str = APP):
+        # A fresh module per source, as a new `cdk synth` would import it
+        path = tmp_path / "app_under_test.py"
+        path.write_text(source)
+        spec = importlib.util.spec_from_file_location(f"app_{next(_modules)}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    return load
+
+
+def registry(module, tmp_path, **context) -> StackRegistry:
+    app = App(context=context, outdir=str(tmp_path / "cdk.out"))
+    stacks = StackRegistry(app, cache_dir=tmp_path / "cache")
+    stacks.stack("network")(module.network)
+    stacks.stack("server", depends_on=("network",))(module.server)
+    return stacks
+
+
+def keys(stacks: StackRegistry) -> dict[str, str]:
+    return {name: stacks.input_key(name) for name in stacks.names}
+
+
+def test_same_inputs_same_keys(app_module, tmp_path):
+    module = app_module()
+    assert keys(registry(module, tmp_path)) == keys(registry(module, tmp_path))
+
+
+def test_app_source_changes_every_key(app_module, tmp_path):
+    before = keys(registry(app_module(), tmp_path))
+    after = keys(registry(app_module(APP + "\nEXTRA = 1\n"), tmp_path))
+    assert before["network"] != after["network"]
+    assert before["server"] != after["server"]
+
+
+def test_context_changes_every_key(app_module, tmp_path):
+    module = app_module()
+    before = keys(registry(module, tmp_path))
+    after = keys(registry(module, tmp_path, admin_cidr="203.0.113.7/32"))
+    assert before["network"] != after["network"]
+    assert before["server"] != after["server"]
+
+
+def test_cdk_environment(app_module, tmp_path, monkeypatch):
+    module = app_module()
+    before = keys(registry(module, tmp_path))
+    monkeypatch.setenv("UNRELATED_VARIABLE", "1")
+    monkeypatch.setenv("CDK_OUTDIR", str(tmp_path / "elsewhere"))
+    assert keys(registry(module, tmp_path)) == before
+    monkeypatch.setenv("CDK_DEFAULT_REGION", "eu-central-1")
+    assert keys(registry(module, tmp_path))["network"] != before["network"]
+
+
+def test_factory_globals(app_module, tmp_path):
+    module = app_module()
+    before = keys(registry(module, tmp_path))
+    # Only the globals a factory reads are part of its key
+    module.UNRELATED = "second"
+    assert keys(registry(module, tmp_path)) == before
+    module.SETTING = "second"
+    after = keys(registry(module, tmp_path))
+    assert after["network"] != before["network"]
+    # and the keys of the stacks depending on it
+    assert after["server"] != before["server"]
+
+
+def test_cache_hit_skips_the_build(app_module, tmp_path):
+    module = app_module()
+    assert registry(module, tmp_path).synth(["server"]) is not None
+    template = tmp_path / "cdk.out" / "server.template.json"
+    template.unlink()
+
+    cached = registry(module, tmp_path)
+    assert cached.synth(["server"]) is None
+    # Copied from the cache, without building a stack
+    assert template.exists()
+    assert not cached._stacks
+
+
+def test_cache_miss_after_a_change(app_module, tmp_path):
+    module = app_module()
+    registry(module, tmp_path).synth(["network"])
+    module.SETTING = "second"
+    changed = registry(module, tmp_path)
+    assert changed.synth(["network"]) is not None
+    assert len(list((tmp_path / "cache").iterdir())) == 2
+
+
+def test_cache_disabled(app_module, tmp_path):
+    module = app_module()
+    registry(module, tmp_path).synth(["network"])
+    stacks = registry(module, tmp_path, synth_cache="false")
+    assert stacks.synth(["network"]) is not None
@@ -0,0 +1,109 @@
+from dataclasses import replace
+
+import pytest
+
+from site_to_site_vpn.constructs.customer_gateway import IpsecBackend, render_user_data
+from site_to_site_vpn.ipsec import AES_GCM_128, HITLESS_REKEY, DhGroup, RekeyProfile
+from site_to_site_vpn.routing import RoutePlan
+
+TUNNEL = dict(
+    number=1,
+    mark=100,
+    vpgw_public_ip="203.0.113.1",
+    pre_shared_key="secret",
+    cgw_link_local_inner_ip="169.254.88.82",
+    vpgw_link_local_inner_ip="169.254.88.81",
+)
+ROUTES = RoutePlan(site_cidrs=("10.0.0.0/16",), vpc_cidrs=("10.1.0.0/16",))
+
+
+@pytest.mark.parametrize(
+    "fields, message",
+    [
+        (dict(phase1_lifetime=600), "phase1_lifetime must be 900-28800s"),
+        (dict(phase1_lifetime=30000), "phase1_lifetime must be 900-28800s"),
+        (dict(phase2_lifetime=600), "phase2_lifetime must be 900s or more"),
+        (
+            dict(phase1_lifetime=3600, phase2_lifetime=3600),
+            "phase2_lifetime must be 900s or more and below",
+        ),
+        (dict(margin=30), "margin must be between 60s"),
+        (dict(margin=1801), "margin must be between 60s"),
+        (dict(fuzz=101), "fuzz must be a percentage"),
+        (dict(rand_time=600), "rand_time is too large"),
+    ],
+)
+def test_out_of_range(fields, message):
+    with pytest.raises(ValueError, match=message):
+        RekeyProfile(**fields)
+
+
+@pytest.mark.parametrize(
+    "fields, aws_margin, child, ike",
+    [
+        # The VPGW rekeys 270-540s before the end of the 3600s CHILD_SA
+        (dict(), 540, 3060, 26010),
+        (dict(fuzz=0), 270, 3330, 28305),
+        (
+            dict(phase1_lifetime=14400, phase2_lifetime=1800, margin=120, fuzz=50),
+            180,
+            1620,
+            13770,
+        ),
+    ],
+)
+def test_rekey_times(fields, aws_margin, child, ike):
+    rekey = RekeyProfile(**fields)
+    assert rekey.aws_margin == aws_margin
+    assert rekey.child_rekey_time == child
+    assert rekey.ike_rekey_time == ike
+    # Ahead of the earliest VPGW rekey of both SAs
+    assert rekey.child_rekey_time <= rekey.phase2_lifetime - rekey.aws_margin
+    assert rekey.ike_rekey_time <= rekey.phase1_lifetime - rekey.aws_margin
+    # Halfway between two CHILD_SA rekeys
+    assert rekey.ike_rekey_time % rekey.child_rekey_time == child // 2
+
+
+def test_starter():
+    assert HITLESS_REKEY.starter == dict(
+        ikelifetime="26550s", lifetime="3600s", margintime="540s", rekeyfuzz="12%"
+    )
+
+
+def test_tunnel_options():
+    assert HITLESS_REKEY.tunnel_options == {
+        "Phase1LifetimeSeconds": 28800,
+        "Phase2LifetimeSeconds": 3600,
+        "RekeyMarginTimeSeconds": 270,
+        "RekeyFuzzPercentage": 100,
+    }
+
+
+def test_rendered_starter_config():
+    script = render_user_data([TUNNEL], routes=ROUTES)
+    for line in (
+        "ikelifetime=26550s",
+        "lifetime=3600s",
+        "margintime=540s",
+        "rekeyfuzz=12%",
+    ):
+        assert f"        {line}\n" in script
+
+
+def test_rendered_swanctl_config():
+    script = render_user_data([TUNNEL], routes=ROUTES, backend=IpsecBackend.SWANCTL)
+    # IKE_SA, then CHILD_SA
+    assert script.count("rekey_time = 26010s") == 1
+    assert "over_time = 2790s" in script
+    assert script.count("rekey_time = 3060s") == 1
+    assert "life_time = 3600s" in script
+    assert script.count("rand_time = 60s") == 2
+
+
+def test_modp_pfs_group_warns():
+    proposal = replace(AES_GCM_128, phase2_dh_groups=(DhGroup.MODP2048,))
+    assert HITLESS_REKEY.warnings(proposal) == [
+        "PFS group MODP2048 is expensive to compute on every rekey, "
+        "consider an elliptic curve group such as ECP256"
+    ]
+    assert HITLESS_REKEY.warnings(AES_GCM_128) == []
@@ -0,0 +1,84 @@
+import pytest
+
+from site_to_site_vpn.routing import (
+    ROUTE_TABLE_QUOTA,
+    VPN_STATIC_ROUTE_QUOTA,
+    RoutePlan,
+)
+
+
+def subnets(count: int, second_octet: int = 0) -> tuple[str, ...]:
+    # Non adjacent /24s, they never collapse
+    return tuple(
+        f"10.{second_octet + i // 100}.{2 * (i % 100)}.0/24" for i in range(count)
+    )
+
+
+def test_adjacent_and_nested_prefixes_collapse():
+    plan = RoutePlan(
+        site_cidrs=("10.0.0.0/24", "10.0.1.0/24", "10.0.1.128/25"),
+        vpc_cidrs=("10.1.0.0/16",),
+    )
+    assert plan.site_prefixes == ["10.0.0.0/23"]
+    assert plan.vpn_static_routes == plan.vpc_routes == ["10.0.0.0/23"]
+    assert plan.dc_routes == plan.cgw_routes == ["10.1.0.0/16"]
+    assert plan.traffic_selectors == ("10.0.0.0/23", "10.1.0.0/16")
+
+
+def test_selector_is_the_smallest_supernet():
+    plan = RoutePlan(
+        site_cidrs=("10.0.0.0/24", "10.0.4.0/24"), vpc_cidrs=("10.1.0.0/16",)
+    )
+    assert plan.site_prefixes == ["10.0.0.0/24", "10.0.4.0/24"]
+    assert plan.traffic_selectors == ("10.0.0.0/21", "10.1.0.0/16")
+
+
+def test_selector_falls_back_to_any():
+    # The supernet of both site prefixes would cover the VPC
+    plan = RoutePlan(
+        site_cidrs=("10.0.0.0/24", "192.168.0.0/24"), vpc_cidrs=("10.1.0.0/16",)
+    )
+    assert plan.traffic_selectors == ("0.0.0.0/0", "10.1.0.0/16")
+    assert plan.vpc_routes == ["10.0.0.0/24", "192.168.0.0/24"]
+
+
+def test_overlap():
+    with pytest.raises(ValueError, match="overlap: 10.0.0.0/16 and 10.0.1.0/24"):
+        RoutePlan(site_cidrs=("10.0.0.0/16",), vpc_cidrs=("10.0.1.0/24",))
+
+
+@pytest.mark.parametrize(
+    "fields, message",
+    [
+        (
+            dict(site_cidrs=(), vpc_cidrs=("10.1.0.0/16",)),
+            "site_cidrs must not be empty",
+        ),
+        (
+            dict(site_cidrs=("10.0.0.0/16",), vpc_cidrs=()),
+            "vpc_cidrs must not be empty",
+        ),
+        (
+            dict(site_cidrs=("fd00::/64",), vpc_cidrs=("10.1.0.0/16",)),
+            "Only IPv4 networks",
+        ),
+    ],
+)
+def test_invalid(fields, message):
+    with pytest.raises(ValueError, match=message):
+        RoutePlan(**fields)
+
+
+def test_vpn_static_route_quota():
+    site = subnets(VPN_STATIC_ROUTE_QUOTA + 1)
+    with pytest.raises(ValueError, match="static routes of a VPN connection"):
+        RoutePlan(site_cidrs=site, vpc_cidrs=("172.16.0.0/16",))
+
+
+def test_route_table_quota():
+    # Two routes of every table are taken by the local and default routes
+    vpc = subnets(ROUTE_TABLE_QUOTA - 1, second_octet=100)
+    with pytest.raises(ValueError, match="49 VPC prefixes exceed the 50 routes"):
+        RoutePlan(site_cidrs=("172.16.0.0/16",), vpc_cidrs=vpc)
+    plan = RoutePlan(site_cidrs=("172.16.0.0/16",), vpc_cidrs=vpc[:-1])
+    assert len(plan.dc_routes) == ROUTE_TABLE_QUOTA - 2
@@ -0,0 +1,85 @@
+import pytest
+
+from site_to_site_vpn.sizing import (
+    ESTIMATED_PPS_PER_QUEUE,
+    INSTANCE_SIZES,
+    MAX_ENA_QUEUES,
+    select_instance_size,
+)
+
+
+@pytest.mark.parametrize(
+    "sas, parallel, gbps",
+    [
+        # STARTER: one vCPU per SA
+        (1, False, 1.5),
+        (2, False, 3),
+        (16, False, 12),
+        # SWANCTL: pcrypt spreads every SA over all vCPUs
+        (1, True, 12),
+        (2, True, 12),
+    ],
+)
+def test_esp_gbps(sas, parallel, gbps):
+    assert INSTANCE_SIZES["c6in.2xlarge"].esp_gbps(sas=sas, parallel=parallel) == gbps
+
+
+def test_estimated_pps_stops_at_the_ena_queue_limit():
+    assert INSTANCE_SIZES["c6in.large"].estimated_pps == 2 * ESTIMATED_PPS_PER_QUEUE
+    assert (
+        INSTANCE_SIZES["c6in.32xlarge"].estimated_pps
+        == MAX_ENA_QUEUES * ESTIMATED_PPS_PER_QUEUE
+    )
+
+
+@pytest.mark.parametrize(
+    "throughput_gbps, pps, options, instance_type",
+    [
+        # The client: bandwidth and PPS only
+        (1.25, 150_000, dict(), "c7gn.medium"),
+        (1.25, 150_000, dict(allow_arm=False), "c6in.large"),
+        (3, 150_000, dict(allow_arm=False), "c6in.large"),
+        (10, 150_000, dict(allow_arm=False), "c6in.2xlarge"),
+        # PPS needs more queues than vCPUs the bandwidth would
+        (1, 600_000, dict(allow_arm=False), "c6in.xlarge"),
+        (1, 2_000_000, dict(allow_arm=False), "c6in.2xlarge"),
+        # Gateways: the ESP capacity of their SAs depends on the backend
+        (1.25, 150_000, dict(ipsec_sas=1, allow_arm=False), "c6in.large"),
+        (3, 150_000, dict(ipsec_sas=2, allow_arm=False), "c6in.large"),
+        (
+            3,
+            150_000,
+            dict(ipsec_sas=1, parallel_esp=True, allow_arm=False),
+            "c6in.large",
+        ),
+        (
+            10,
+            150_000,
+            dict(ipsec_sas=1, parallel_esp=True, allow_arm=False),
+            "c6in.2xlarge",
+        ),
+        (4, 150_000, dict(ipsec_sas=2, parallel_esp=True), "c7gn.xlarge"),
+        # Family restriction
+        (5, 150_000, dict(families=("m7a",)), "m7a.4xlarge"),
+    ],
+)
+def test_select_instance_size(throughput_gbps, pps, options, instance_type):
+    size = select_instance_size(throughput_gbps, pps, **options)
+    assert size.instance_type == instance_type
+    if not options.get("allow_arm", True):
+        assert not size.arm
+
+
+@pytest.mark.parametrize(
+    "throughput_gbps, pps, options, message",
+    [
+        # A single SA on one vCPU never reaches 3 Gbps
+        (3, 150_000, dict(ipsec_sas=1), "over 1 SA\\(s\\) without parallel ESP"),
+        (4, 150_000, dict(ipsec_sas=2), "over 2 SA\\(s\\) without parallel ESP"),
+        (100, 10_000_000, dict(), "sustains 100 Gbps and 10000000 PPS$"),
+        (100, 150_000, dict(families=("m7a",)), "No instance in \\('m7a',\\)"),
+    ],
+)
+def test_nothing_fits(throughput_gbps, pps, options, message):
+    with pytest.raises(ValueError, match=message):
+        select_instance_size(throughput_gbps, pps, **options)
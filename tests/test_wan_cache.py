@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from site_to_site_vpn.wan_cache import follow, summarize
+
+
+def test_summarize():
+    summary = summarize(
+        [
+            "HIT 1000",
+            "REVALIDATED 200",
+            "MISS 600",
+            "EXPIRED 200",
+            # Neither a hit nor a miss, but served
+            "BYPASS 1000",
+            "- 0",
+            "malformed",
+            "HIT many",
+        ]
+    )
+    assert summary == dict(
+        Requests=6,
+        Hits=2,
+        Misses=2,
+        BytesServed=3000,
+        BytesFromCache=1200,
+        HitRatio=50,
+        ByteHitRatio=40,
+    )
+
+
+def test_summarize_without_cacheable_requests():
+    # No ratio rather than a division by zero
+    assert summarize([]) == dict(
+        Requests=0, Hits=0, Misses=0, BytesServed=0, BytesFromCache=0
+    )
+    assert "HitRatio" not in summarize(["BYPASS 100"])
+    assert "ByteHitRatio" not in summarize(["MISS 0"])
+
+
+def poll(lines) -> list[str]:
+    # The lines follow yields until it waits for more
+    polled = []
+    while (line := next(lines)) is not None:
+        polled.append(line)
+    return polled
+
+
+def test_follow_skips_the_existing_log(tmp_path):
+    path = tmp_path / "wan-cache.log"
+    path.write_text("HIT 1\n")
+    lines = follow(path)
+    assert poll(lines) == []
+    with open(path, "a") as log:
+        log.write("MISS 2\n")
+    assert poll(lines) == ["MISS 2\n"]
+
+
+def test_follow_reads_a_log_created_later(tmp_path):
+    path = tmp_path / "wan-cache.log"
+    lines = follow(path)
+    assert poll(lines) == []
+    path.write_text("HIT 1\nMISS 2\n")
+    assert poll(lines) == ["HIT 1\n", "MISS 2\n"]
+
+
+@pytest.mark.parametrize("existed", [True, False])
+def test_follow_after_logrotate(tmp_path, existed):
+    path = tmp_path / "wan-cache.log"
+    if existed:
+        path.write_text("")
+    lines = follow(path)
+    poll(lines)
+    path.write_text("HIT 1\n")
+    assert poll(lines) == ["HIT 1\n"]
+    with open(path, "a") as log:
+        log.write("MISS 2\n")
+    os.rename(path, tmp_path / "wan-cache.log.1")
+    assert poll(lines) == ["MISS 2\n"]
+    # The rest of the rotated log, then the new one from its start
+    with open(tmp_path / "wan-cache.log.1", "a") as log:
+        log.write("HIT 3\n")
+    path.write_text("HIT 4\n")
+    assert poll(lines) == ["HIT 3\n", "HIT 4\n"]